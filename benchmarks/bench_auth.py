@@ -0,0 +1,84 @@
+# Copyright (c) 2024-2025 LinguaScreen, Inc.
+#
+# This file is part of LinguaScreen Server
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Per-request cost of get_current_user, with and without the principal cache
+
+Run from the repository root: python -m benchmarks.bench_auth
+"""
+
+import asyncio
+import os
+import tempfile
+import time
+
+# a throwaway database, set before the app modules read their settings
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{tempfile.mkdtemp()}/bench.db")
+
+from fastapi.security import HTTPAuthorizationCredentials
+
+import main  # noqa: F401 registers every model before the tables are created
+from config import settings
+from db import (
+    async_engine,
+    async_write_engine,
+    async_write_session_factory,
+    create_db_and_tables,
+)
+from models.user import User
+from security.jwt import (
+    create_access_token,
+    get_current_user,
+    principal_cache,
+    token_claims,
+)
+
+ROUNDS = 2000
+
+
+async def bench(label: str, token: str, cached: bool):
+    credentials = HTTPAuthorizationCredentials(scheme="Bearer", credentials=token)
+    principal_cache.clear()
+    await get_current_user(credentials)
+    start = time.perf_counter()
+    for _ in range(ROUNDS):
+        if not cached:
+            principal_cache.clear()
+        await get_current_user(credentials)
+    elapsed = time.perf_counter() - start
+    print(f"{label:<28}{elapsed / ROUNDS * 1e6:10.1f} us/request")
+
+
+async def main():
+    create_db_and_tables()
+    async with async_write_session_factory() as db:
+        user = User(username="bench", email="bench@example.com", hashed_password="")
+        db.add(user)
+        await db.commit()
+        await db.refresh(user)
+    token = create_access_token(token_claims(user))
+    # the path every request took before the cache
+    await bench("decode + database lookup", token, cached=False)
+    await bench("principal cache hit", token, cached=True)
+    settings.AUTH_TRUST_TOKEN_CLAIMS = True
+    await bench("decode + trusted claims", create_access_token(token_claims(user)), cached=False)
+    # pooled aiosqlite connections run in threads that would keep the process alive
+    await async_engine.dispose()
+    await async_write_engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,149 @@
+# Copyright (c) 2024-2025 LinguaScreen, Inc.
+#
+# This file is part of LinguaScreen Server
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Per-request cost of rendering an explanation payload, and of compressing it
+
+Run from the repository root: python -m benchmarks.bench_responses
+"""
+
+import asyncio
+import time
+import zlib
+
+import httpx
+from fastapi import FastAPI
+from fastapi.responses import JSONResponse
+
+from config import settings
+from core.llm import LLMResponse, WordsExplanation
+from core.responses import (
+    CompressionMiddleware,
+    FastJSONResponse,
+    brotli,
+    model_response,
+    orjson,
+)
+from routers.gateway import ExplainResponseModel
+
+ROUNDS = 2000
+
+# a long sentence explained word by word, about 12 KiB of JSON
+RESULT = LLMResponse(
+    words_explanation=[
+        WordsExplanation(
+            original_word=f"単語{i}",
+            translated_word=f"word {i}",
+            explanation=f"explanation of word {i} in the context of the sentence " * 2,
+            romanization=f"tango {i}",
+        )
+        for i in range(60)
+    ],
+    entire_explanation="the sentence as a whole means something " * 20,
+    original_sentence="とても長い文章" * 10,
+    translated_sentence="a very long sentence " * 10,
+    prompt_tokens=812,
+    completion_tokens=2048,
+)
+
+
+def as_dict() -> dict:
+    # the dict handlers built before, validated against the response model
+    return {
+        "message": "successful LLM explanation",
+        "result": {
+            "words_explanation": RESULT.words_explanation,
+            "entire_explanation": RESULT.entire_explanation,
+            "original_sentence": RESULT.original_sentence,
+            "translated_sentence": RESULT.translated_sentence,
+            "prompt_tokens": RESULT.prompt_tokens,
+            "completion_tokens": RESULT.completion_tokens,
+        },
+    }
+
+
+def build_app(compress: bool) -> FastAPI:
+    app = FastAPI()
+    if compress:
+        app.add_middleware(CompressionMiddleware)
+
+    @app.get("/stdlib", response_model=ExplainResponseModel, response_class=JSONResponse)
+    async def stdlib():
+        return as_dict()
+
+    @app.get("/fast", response_model=ExplainResponseModel, response_class=FastJSONResponse)
+    async def fast():
+        return as_dict()
+
+    @app.get("/model", response_model=ExplainResponseModel)
+    async def model():
+        return model_response(
+            ExplainResponseModel(message="successful LLM explanation", result=RESULT)
+        )
+
+    return app
+
+
+async def bench(app: FastAPI, label: str, path: str, encoding: str = "identity"):
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        headers = {"Accept-Encoding": encoding}
+        response = await client.get(path, headers=headers)
+        size = len(response.content) if encoding == "identity" else int(
+            response.headers["content-length"]
+        )
+        start = time.perf_counter()
+        for _ in range(ROUNDS):
+            await client.get(path, headers=headers)
+        elapsed = time.perf_counter() - start
+    print(f"{label:<36}{elapsed / ROUNDS * 1e6:10.1f} us/request{size:10d} bytes")
+
+
+def bench_codec(label: str, compress):
+    payload = ExplainResponseModel(
+        message="successful LLM explanation", result=RESULT
+    ).model_dump_json().encode()
+    size = len(compress(payload))
+    start = time.perf_counter()
+    for _ in range(ROUNDS):
+        compress(payload)
+    elapsed = time.perf_counter() - start
+    print(f"{label:<36}{elapsed / ROUNDS * 1e6:10.1f} us/body   {size:10d} bytes")
+
+
+async def main():
+    print(f"orjson {'installed' if orjson else 'missing'}, "
+          f"brotli {'installed' if brotli else 'missing'}")
+    plain = build_app(compress=False)
+    # the path every handler took before
+    await bench(plain, "dict + validation + json", "/stdlib")
+    await bench(plain, "dict + validation + orjson", "/fast")
+    await bench(plain, "validated model, one dump", "/model")
+    # these include httpx decoding the body on the client side
+    compressed = build_app(compress=True)
+    await bench(compressed, "validated model + gzip", "/model", "gzip")
+    if brotli is not None:
+        await bench(compressed, "validated model + br", "/model", "br")
+    level = settings.COMPRESSION_GZIP_LEVEL
+    bench_codec(f"gzip level {level}", lambda body: zlib.compress(body, level))
+    bench_codec("gzip level 1", lambda body: zlib.compress(body, 1))
+    if brotli is not None:
+        quality = settings.COMPRESSION_BROTLI_QUALITY
+        bench_codec(f"brotli quality {quality}", lambda body: brotli.compress(body, quality=quality))
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
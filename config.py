@@ -15,6 +15,8 @@
 # You should have received a copy of the GNU Affero General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
+from typing import Optional
+
 from pydantic_settings import BaseSettings
 
 from dotenv import load_dotenv
@@ -31,11 +33,37 @@ class Settings(BaseSettings):
 
     # Database settings
     DATABASE_URL: str = "sqlite:///./app.db"
+    # derived from DATABASE_URL (aiosqlite / asyncpg) when not set
+    ASYNC_DATABASE_URL: Optional[str] = None
+    # "production" enables connection pooling, sqlite pragmas and a single writer
+    DATABASE_PROFILE: str = "default"
+    DATABASE_POOL_SIZE: int = 8
+    DATABASE_MAX_OVERFLOW: int = 8
+    # seconds a write waits for the single writer connection
+    DATABASE_WRITE_TIMEOUT: float = 30.0
+    SQLITE_BUSY_TIMEOUT_MS: int = 5000
+    SQLITE_MMAP_SIZE: int = 268435456
+    # negative values are in KiB
+    SQLITE_CACHE_SIZE: int = -65536
 
     # Security settings
     SECRET_KEY: str = "default-secret-key"
     ALGORITHM: str = "HS256"
     ACCESS_TOKEN_EXPIRE: int = 30
+    # seconds a verified token is mapped to its user without a database lookup,
+    # also bounds how long other workers may serve a changed user
+    AUTH_CACHE_TTL: float = 60.0
+    AUTH_CACHE_MAX_ENTRIES: int = 10000
+    # bcrypt work factor, hashes with another factor are upgraded on login
+    BCRYPT_ROUNDS: int = 12
+    # threads hashing passwords, and hashes allowed to wait for one of them
+    PASSWORD_HASH_WORKERS: int = 2
+    PASSWORD_HASH_QUEUE_SIZE: int = 32
+    # password hashes a single client address may have in flight
+    PASSWORD_HASH_PER_CLIENT: int = 4
+    # embed username and email in tokens and trust them instead of loading the
+    # user, changes to a user then only apply to tokens issued afterwards
+    AUTH_TRUST_TOKEN_CLAIMS: bool = False
 
     # Azure credential settings
 
@@ -52,6 +80,123 @@ class Settings(BaseSettings):
     AZURE_LLM_OPENAI_API_KEY: str
     AZURE_LLM_OPENAI_ENDPOINT: str
 
+    # Logging settings
+    LOG_LEVEL: str = "INFO"
+    LOG_JSON: bool = True
+    # records are dropped instead of blocking once the queue is full
+    LOG_QUEUE_SIZE: int = 10000
+    # identical records allowed per window before being suppressed
+    LOG_DUPLICATE_WINDOW: float = 10.0
+    LOG_DUPLICATE_BURST: int = 5
+
+    # Quiz settings
+    # seconds a cached per-user quiz pool is trusted
+    QUIZ_POOL_TTL: float = 300.0
+    QUIZ_POOL_MAX_USERS: int = 10000
+    # most recent words preloaded per user for batch quizzes
+    QUIZ_WORD_POOL_MAX_WORDS: int = 5000
+    # seconds a study session remembers the words it already asked
+    QUIZ_SESSION_TTL: float = 3600.0
+
+    # Review settings
+    # seconds an item handed out by /review/next stays out of the queue
+    REVIEW_LEASE_SECONDS: int = 600
+
+    # Export and import settings
+    # rows fetched per round trip while streaming an export
+    EXPORT_BATCH_SIZE: int = 500
+    # sentences saved per transaction while importing
+    IMPORT_BATCH_SIZE: int = 500
+    IMPORT_MAX_BYTES: int = 104857600
+
+    # Rate limit settings
+    RATE_LIMIT_ENABLED: bool = True
+    # sqlite file holding the token buckets, shared by every worker
+    RATE_LIMIT_DB: str = "./ratelimit.db"
+    # requests per minute, and burst, of one caller on one route
+    RATE_LIMIT_PER_MINUTE: float = 120.0
+    RATE_LIMIT_BURST: int = 60
+    # stricter limits on the routes calling Azure services
+    RATE_LIMIT_AI_PER_MINUTE: float = 20.0
+    RATE_LIMIT_AI_BURST: int = 10
+    # LLM tokens one caller may spend per day, refilled continuously
+    LLM_PROMPT_TOKENS_PER_DAY: int = 200000
+    LLM_COMPLETION_TOKENS_PER_DAY: int = 100000
+
+    # Overlay websocket settings
+    # seconds a new connection has to send its auth message
+    OVERLAY_AUTH_TIMEOUT: float = 10.0
+    # requests of one connection processed at once, reading waits beyond that
+    OVERLAY_MAX_IN_FLIGHT: int = 8
+    # recent results kept per connection and answered without upstream calls
+    OVERLAY_CACHE_SIZE: int = 64
+
+    # Job queue settings
+    # worker tasks started with the app, 0 when worker.py runs them instead
+    JOB_WORKERS: int = 2
+    # jobs claimed at once, their sentences are saved in one transaction
+    JOB_BATCH_SIZE: int = 8
+    # seconds a claimed job may run before another worker claims it again
+    JOB_LEASE_SECONDS: int = 300
+    JOB_MAX_ATTEMPTS: int = 3
+    # seconds between checks for jobs queued by other processes
+    JOB_POLL_INTERVAL: float = 1.0
+    # seconds running batches get to finish on shutdown
+    JOB_SHUTDOWN_TIMEOUT: float = 30.0
+    # seconds between keepalive comments of job event streams
+    JOB_EVENTS_KEEPALIVE: float = 15.0
+
+    # Response settings
+    COMPRESSION_ENABLED: bool = True
+    # bodies smaller than this are sent as they are
+    COMPRESSION_MINIMUM_SIZE: int = 1024
+    COMPRESSION_GZIP_LEVEL: int = 6
+    # brotli is only offered with the brotli extra installed
+    COMPRESSION_BROTLI_QUALITY: int = 4
+
+    # Idempotency settings
+    # seconds a stored response is replayed to retries carrying the same key
+    IDEMPOTENCY_TTL: int = 86400
+    # seconds after which an unfinished request no longer holds its key
+    IDEMPOTENCY_LOCK_SECONDS: int = 300
+    # seconds a duplicate waits for the request holding its key, then gets a 409
+    IDEMPOTENCY_WAIT_SECONDS: float = 60.0
+    # seconds between checks on a key held by another worker
+    IDEMPOTENCY_POLL_INTERVAL: float = 0.25
+
+    # Usage settings
+    USAGE_ENABLED: bool = True
+    # seconds usage is summed in memory before being written
+    USAGE_FLUSH_INTERVAL: float = 10.0
+    # daily rows upserted per statement
+    USAGE_FLUSH_BATCH_SIZE: int = 500
+
+    # Metrics settings
+    METRICS_ENABLED: bool = True
+    # shared directory for worker snapshots when running multiple workers
+    METRICS_MULTIPROC_DIR: Optional[str] = None
+    METRICS_FLUSH_INTERVAL: float = 5.0
+
+    # Tracing settings
+    TRACING_ENABLED: bool = True
+    # requests slower than this are sampled to the log with their span tree
+    TRACE_SLOW_REQUEST_MS: float = 2000.0
+    TRACE_SLOW_SAMPLE_RATE: float = 1.0
+    # spans kept per request, later ones are folded into per-name totals
+    TRACE_MAX_SPANS: int = 200
+
+    # Profiler settings, the middleware is not installed unless enabled
+    PROFILER_ENABLED: bool = False
+    # requests carrying this header with the token are always profiled
+    PROFILER_HEADER: str = "X-Profile-Token"
+    PROFILER_TOKEN: Optional[str] = None
+    # fraction of requests profiled, kept only when slower than the threshold
+    PROFILER_SAMPLE_RATE: float = 0.0
+    PROFILER_SLOW_REQUEST_MS: float = 2000.0
+    PROFILER_INTERVAL_MS: float = 5.0
+    PROFILER_OUTPUT_DIR: str = "./profiles"
+    PROFILER_MAX_PROFILES: int = 100
+
     class Config:
         env_file = ".env"
         case_sensitive = True
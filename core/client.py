@@ -23,6 +23,9 @@ from azure.ai.vision.imageanalysis import ImageAnalysisClient
 from azure.core.credentials import AzureKeyCredential
 
 from config import settings
+from telemetry.log import get_logger
+
+logger = get_logger("client")
 
 
 def new_azure_text_translation_client():
@@ -33,7 +36,7 @@ def new_azure_text_translation_client():
     # generate credential and client
     credential = AzureKeyCredential(api_key)
     client = TextTranslationClient(credential=credential, region=region)
-    print("Azure text-translator client connected")
+    logger.info("Azure text-translator client connected")
     # connection established
     return client
 
@@ -46,7 +49,7 @@ def new_azure_image_analysis_client():
     # generate client
     credential = AzureKeyCredential(api_key)
     client = ImageAnalysisClient(endpoint=endpoint, credential=credential)
-    print("Azure image-analysis client connected")
+    logger.info("Azure image-analysis client connected")
     # connection established
     return client
 
@@ -63,7 +66,7 @@ def new_azure_llm_openai_client():
         azure_endpoint=endpoint,
         api_key=api_key,
     )
-    print("Azure llm open AI client connected")
+    logger.info("Azure llm open AI client connected")
     # connection established
     return client
 
@@ -0,0 +1,190 @@
+# Copyright (c) 2024-2025 LinguaScreen, Inc.
+#
+# This file is part of LinguaScreen Server
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+from datetime import datetime, timezone
+from typing import List, NamedTuple, Optional
+
+from sqlalchemy import delete, insert
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.sql.elements import ColumnElement
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from .lexicon import chunked, gloss_upsert, lexicon_upsert, word_rows
+from .llm import LLMResponse
+from .review import review_rows
+from .search import document_params, index_sentences, unindex_sentences
+
+from models.reviews import Reviews
+from models.sentences import DictionaryVersion, Sentences
+from models.words import Words
+
+
+async def dictionary_version(db: AsyncSession, user_id: int) -> int:
+    """Current version of the user dictionary, 0 before its first change"""
+    version = (
+        await db.exec(
+            select(DictionaryVersion.version).where(DictionaryVersion.user_id == user_id)
+        )
+    ).first()
+    return version or 0
+
+
+async def bump_dictionary_version(db: AsyncSession, user_id: int):
+    """Mark the user dictionary as changed, within the transaction of the change"""
+    upsert = sqlite.insert if db.bind.dialect.name == "sqlite" else postgresql.insert
+    stmt = upsert(DictionaryVersion).values(user_id=user_id, version=1)
+    await db.exec(
+        stmt.on_conflict_do_update(
+            index_elements=[DictionaryVersion.user_id],
+            set_={"version": DictionaryVersion.version + 1},
+        )
+    )
+
+
+def naive_utc(value: datetime) -> datetime:
+    """Timestamp in the naive UTC form sentences store, aware ones are converted"""
+    if value.tzinfo is None:
+        return value
+    return value.astimezone(timezone.utc).replace(tzinfo=None)
+
+
+class ExplainedSentence(NamedTuple):
+    """Sentence with its LLM explanation, ready to be saved"""
+
+    original: str
+    original_lang: str
+    translation: str
+    translation_lang: str
+    explanation: Optional[str]
+    result: LLMResponse
+    # kept by imports, new sentences are stamped with the save time
+    created_at: Optional[datetime] = None
+
+
+async def save_sentences(
+    db: AsyncSession, user_id: int, sentences: List[ExplainedSentence]
+) -> List[int]:
+    """Insert sentences and their words, returns the new sentence ids
+
+    Sentences are inserted with RETURNING so no refresh round trip is needed,
+    lexicon entries and glosses are upserted in multi-row statements, rows
+    are chunked to stay under the bind parameter limit of the backend.
+    The dictionary version is bumped. Nothing is committed, the caller owns
+    the transaction.
+    """
+    if not sentences:
+        return []
+    created_at = datetime.utcnow()
+    sentence_rows = [
+        {
+            "original": sentence.original,
+            "original_lang": sentence.original_lang,
+            "translation": sentence.translation,
+            "translation_lang": sentence.translation_lang,
+            "explanation": sentence.explanation,
+            "user_id": user_id,
+            "word_count": len(sentence.result.words_explanation),
+            "created_at": sentence.created_at or created_at,
+        }
+        for sentence in sentences
+    ]
+    sentence_ids = []
+    for chunk in chunked(sentence_rows, len(sentence_rows[0])):
+        sentence_ids.extend(
+            (
+                await db.exec(
+                    insert(Sentences).returning(Sentences.id, sort_by_parameter_order=True),
+                    params=chunk,
+                )
+            ).scalars().all()
+        )
+    words = [
+        (
+            sentence_id,
+            word.original_word,
+            word.translated_word,
+            word.explanation,
+            word.romanization,
+        )
+        for sentence, sentence_id in zip(sentences, sentence_ids)
+        for word in sentence.result.words_explanation
+    ]
+    if words:
+        # words reference shared lexicon entries and glosses, upserted once each
+        dialect = db.bind.dialect.name
+        lexicon_ids = {}
+        for stmt in lexicon_upsert(dialect, [(w[1], w[2], w[4]) for w in words]):
+            lexicon_ids.update((await db.exec(stmt)).all())
+        gloss_ids = {}
+        for stmt in gloss_upsert(dialect, [w[3] for w in words]):
+            gloss_ids.update((await db.exec(stmt)).all())
+        word_ids = []
+        for chunk in chunked(word_rows(words, lexicon_ids, gloss_ids), 3):
+            word_ids.extend(
+                (
+                    await db.exec(
+                        insert(Words).returning(Words.id, sort_by_parameter_order=True),
+                        params=chunk,
+                    )
+                ).scalars().all()
+            )
+        # new words are due for review right away
+        for chunk in chunked(review_rows(user_id, word_ids, created_at), 3):
+            await db.exec(insert(Reviews), params=chunk)
+    await index_sentences(
+        db,
+        [
+            document_params(
+                sentence_id,
+                user_id,
+                sentence.original,
+                sentence.translation,
+                sentence.explanation,
+                [
+                    (word.original_word, word.translated_word, word.romanization)
+                    for word in sentence.result.words_explanation
+                ],
+            )
+            for sentence, sentence_id in zip(sentences, sentence_ids)
+        ],
+    )
+    await bump_dictionary_version(db, user_id)
+    return sentence_ids
+
+
+async def delete_sentences(
+    db: AsyncSession, user_id: int, *criteria: ColumnElement[bool]
+) -> int:
+    """Delete the user sentences matching every criterion, returns the count
+
+    Words go with them through ON DELETE CASCADE, search index rows are
+    removed by the returned ids and the dictionary version is bumped when
+    anything was deleted. Nothing is committed, the caller owns the
+    transaction.
+    """
+    sentence_ids = (
+        await db.exec(
+            delete(Sentences)
+            .where(Sentences.user_id == user_id, *criteria)
+            .returning(Sentences.id)
+        )
+    ).scalars().all()
+    if sentence_ids:
+        await unindex_sentences(db, sentence_ids)
+        await bump_dictionary_version(db, user_id)
+    return len(sentence_ids)
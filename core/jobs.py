@@ -0,0 +1,335 @@
+# Copyright (c) 2024-2025 LinguaScreen, Inc.
+#
+# This file is part of LinguaScreen Server
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import asyncio
+import json
+from collections import defaultdict
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import and_, insert, tuple_, update
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from config import settings
+from db import async_write_session_factory
+
+from .dictionary import ExplainedSentence, save_sentences
+from .llm import LLMResponse, llm_explaination_service
+from .quiz import invalidate_quiz_cache
+
+from models.jobs import JOB_DONE, JOB_FAILED, JOB_QUEUED, JOB_RUNNING, Job
+from security.ratelimit import charge_llm_tokens
+from telemetry.log import get_logger
+from telemetry.usage import attribute_usage
+
+logger = get_logger("jobs")
+
+# explain a sentence and save it to the dictionary of the job user
+JOB_SAVE = "save"
+
+# longest error message kept on a job
+JOB_ERROR_MAX_LENGTH = 500
+
+
+class JobNotifier:
+    """Wakes the waiters of this process when jobs are queued or change
+
+    Workers and event streams of other processes are not woken, they poll.
+    """
+
+    def __init__(self):
+        self._queue: Set[asyncio.Event] = set()
+        self._jobs: Dict[int, Set[asyncio.Event]] = {}
+
+    async def _wait(self, waiters: Set[asyncio.Event], timeout: float):
+        event = asyncio.Event()
+        waiters.add(event)
+        try:
+            await asyncio.wait_for(event.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        finally:
+            waiters.discard(event)
+
+    async def wait_queued(self, timeout: float):
+        """Wait until a job is queued, at most `timeout` seconds"""
+        await self._wait(self._queue, timeout)
+
+    async def wait_job(self, job_id: int, timeout: float):
+        """Wait until a job changes, at most `timeout` seconds"""
+        waiters = self._jobs.setdefault(job_id, set())
+        try:
+            await self._wait(waiters, timeout)
+        finally:
+            if not waiters:
+                self._jobs.pop(job_id, None)
+
+    def notify_queued(self):
+        for event in self._queue:
+            event.set()
+
+    def notify_job(self, job_id: int):
+        for event in self._jobs.get(job_id, ()):
+            event.set()
+
+
+job_notifier = JobNotifier()
+
+
+async def enqueue_job(
+    db: AsyncSession, user_id: int, kind: str, payload: Dict[str, Any]
+) -> int:
+    """Insert a queued job, returns its id
+
+    Nothing is committed, the caller owns the transaction and calls
+    job_notifier.notify_queued() once it is committed.
+    """
+    now = datetime.utcnow()
+    return (
+        await db.exec(
+            insert(Job)
+            .values(
+                user_id=user_id,
+                kind=kind,
+                status=JOB_QUEUED,
+                payload=json.dumps(payload, ensure_ascii=False),
+                attempts=0,
+                available_at=now,
+                created_at=now,
+                updated_at=now,
+            )
+            .returning(Job.id)
+        )
+    ).scalar_one()
+
+
+async def claim_jobs(db: AsyncSession, limit: int, now: datetime) -> List[Any]:
+    """Lease the oldest available jobs in one statement
+
+    Jobs whose lease expired are claimed again, every claim counts as an
+    attempt. Returns (id, user_id, kind, payload, attempts) rows.
+    """
+    available = (
+        select(Job.id)
+        .where(Job.status.in_((JOB_QUEUED, JOB_RUNNING)), Job.available_at <= now)
+        .order_by(Job.id)
+        .limit(limit)
+        # concurrent workers skip each other's rows on postgres
+        .with_for_update(skip_locked=True)
+    )
+    return (
+        await db.exec(
+            update(Job)
+            .where(Job.id.in_(available.scalar_subquery()))
+            .values(
+                status=JOB_RUNNING,
+                attempts=Job.attempts + 1,
+                available_at=now + timedelta(seconds=settings.JOB_LEASE_SECONDS),
+                updated_at=now,
+            )
+            .returning(Job.id, Job.user_id, Job.kind, Job.payload, Job.attempts)
+            .execution_options(synchronize_session=False)
+        )
+    ).all()
+
+
+async def _explain(job: Any, body: Dict[str, Any]) -> LLMResponse:
+    # usage of the job goes to its user, gather runs it in its own task
+    attribute_usage(f"job:{job.kind}", job.user_id)
+    return await run_in_threadpool(
+        llm_explaination_service,
+        body["original_sentence"],
+        body["translated_sentence"],
+        body["original_lang"],
+        body["target_lang"],
+    )
+
+
+def _leased(job: Any):
+    # the lease is still ours when no other claim bumped the attempts since
+    return and_(Job.id == job.id, Job.attempts == job.attempts)
+
+
+async def _record_failure(db: AsyncSession, job: Any, error: str, now: datetime):
+    if job.attempts >= settings.JOB_MAX_ATTEMPTS:
+        values = {"status": JOB_FAILED, "available_at": now}
+    else:
+        # retried with an exponential backoff
+        values = {
+            "status": JOB_QUEUED,
+            "available_at": now + timedelta(seconds=2**job.attempts),
+        }
+    await db.exec(
+        update(Job)
+        .where(_leased(job), Job.status == JOB_RUNNING)
+        .values(error=error[:JOB_ERROR_MAX_LENGTH], updated_at=now, **values)
+    )
+
+
+async def _save_group(
+    db: AsyncSession,
+    user_id: int,
+    items: List[Tuple[Any, LLMResponse]],
+    bodies: Dict[int, Dict[str, Any]],
+    now: datetime,
+) -> List[Tuple[Any, LLMResponse]]:
+    """Mark the jobs of one user done and save their sentences, returns the saved items"""
+    # only jobs still leased to this worker are saved
+    owned = set(
+        (
+            await db.exec(
+                update(Job)
+                .where(
+                    tuple_(Job.id, Job.attempts).in_([(job.id, job.attempts) for job, _ in items]),
+                    Job.status == JOB_RUNNING,
+                )
+                .values(status=JOB_DONE, error=None, updated_at=now)
+                .returning(Job.id)
+                .execution_options(synchronize_session=False)
+            )
+        ).scalars().all()
+    )
+    items = [(job, result) for job, result in items if job.id in owned]
+    if not items:
+        return items
+    sentence_ids = await save_sentences(
+        db,
+        user_id,
+        [
+            ExplainedSentence(
+                original=result.original_sentence,
+                original_lang=bodies[job.id]["original_lang"],
+                translation=result.translated_sentence,
+                translation_lang=bodies[job.id]["target_lang"],
+                explanation=result.entire_explanation,
+                result=result,
+            )
+            for job, result in items
+        ],
+    )
+    await db.exec(
+        update(Job),
+        params=[
+            {"id": job.id, "result": json.dumps({"sentence_ids": [sentence_id]})}
+            for (job, _), sentence_id in zip(items, sentence_ids)
+        ],
+    )
+    return items
+
+
+async def process_jobs(limit: int) -> int:
+    """Run a batch of save jobs, returns the number of jobs claimed
+
+    Explanations run concurrently. Failures are committed first, then the
+    sentences of every user are saved in their own transaction that also
+    marks the jobs done, so one failing save only fails the jobs of its user.
+    """
+    async with async_write_session_factory() as db:
+        jobs = await claim_jobs(db, limit, datetime.utcnow())
+        await db.commit()
+    if not jobs:
+        return 0
+    for job in jobs:
+        job_notifier.notify_job(job.id)
+    # jobs whose lease expired too often are not run again
+    runnable = [job for job in jobs if job.attempts <= settings.JOB_MAX_ATTEMPTS]
+    bodies = {job.id: json.loads(job.payload) for job in runnable}
+    outcomes = await asyncio.gather(
+        *[_explain(job, bodies[job.id]) for job in runnable], return_exceptions=True
+    )
+    now = datetime.utcnow()
+    succeeded: Dict[int, List[Tuple[Any, LLMResponse]]] = defaultdict(list)
+    async with async_write_session_factory() as db:
+        for job in jobs:
+            if job.attempts > settings.JOB_MAX_ATTEMPTS:
+                await _record_failure(db, job, "Job lease expired too many times", now)
+        for job, outcome in zip(runnable, outcomes):
+            if isinstance(outcome, BaseException):
+                logger.error(
+                    "job failed",
+                    extra={"job_id": job.id, "attempt": job.attempts, "error": str(outcome)},
+                )
+                await _record_failure(db, job, str(outcome) or type(outcome).__name__, now)
+            else:
+                succeeded[job.user_id].append((job, outcome))
+        await db.commit()
+    for user_id, items in succeeded.items():
+        try:
+            async with async_write_session_factory() as db:
+                saved = await _save_group(db, user_id, items, bodies, now)
+                await db.commit()
+        except Exception as exception:
+            saved = []
+            logger.error(
+                "job save failed",
+                extra={"job_ids": [job.id for job, _ in items], "error": str(exception)},
+            )
+            async with async_write_session_factory() as db:
+                for job, _ in items:
+                    await _record_failure(db, job, str(exception) or type(exception).__name__, now)
+                await db.commit()
+        if saved:
+            invalidate_quiz_cache(user_id)
+        # the explanations were billed upstream whether or not they were saved
+        await charge_llm_tokens(
+            f"user:{user_id}",
+            sum(result.prompt_tokens for _, result in items),
+            sum(result.completion_tokens for _, result in items),
+        )
+    for job in jobs:
+        job_notifier.notify_job(job.id)
+    return len(jobs)
+
+
+class JobWorkers:
+    """Worker tasks draining the job queue in the running event loop"""
+
+    def __init__(self, count: int):
+        self.count = count
+        self._stop: Optional[asyncio.Event] = None
+        self._tasks: List[asyncio.Task] = []
+
+    def start(self):
+        self._stop = asyncio.Event()
+        self._tasks = [
+            asyncio.create_task(self._run(), name=f"job-worker-{i}")
+            for i in range(self.count)
+        ]
+
+    async def _run(self):
+        while not self._stop.is_set():
+            try:
+                claimed = await process_jobs(settings.JOB_BATCH_SIZE)
+            except Exception as exception:
+                logger.error("job batch failed", extra={"error": str(exception)})
+                claimed = 0
+            if not claimed:
+                await job_notifier.wait_queued(settings.JOB_POLL_INTERVAL)
+
+    async def stop(self):
+        """Let running batches finish, jobs of cancelled ones are leased again"""
+        if not self._tasks:
+            return
+        self._stop.set()
+        job_notifier.notify_queued()
+        _, pending = await asyncio.wait(self._tasks, timeout=settings.JOB_SHUTDOWN_TIMEOUT)
+        for task in pending:
+            task.cancel()
+        await asyncio.gather(*pending, return_exceptions=True)
+        self._tasks = []
@@ -0,0 +1,152 @@
+# Copyright (c) 2024-2025 LinguaScreen, Inc.
+#
+# This file is part of LinguaScreen Server
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import hashlib
+from typing import Dict, Iterable, Iterator, List, NamedTuple, Sequence, Tuple, TypeVar
+
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlmodel import select
+
+from models.lexicon import Glosses, Lexicon
+from models.words import Words
+
+T = TypeVar("T")
+
+# bind parameters per statement, the lowest limit of the supported backends
+# (SQLite builds before 3.32 and many distro builds)
+MAX_BIND_PARAMETERS = 999
+
+
+class SavedWord(NamedTuple):
+    """Saved word of a sentence, in the shape words are served in"""
+
+    id: int
+    sentences_id: int
+    original_word: str
+    translated_word: str
+    explanation: str
+    romanization: str
+
+
+def select_words(*columns):
+    """Select saved words joined with their lexicon entry and gloss
+
+    Rows start with the SavedWord fields, followed by the extra columns.
+    """
+    return (
+        select(
+            Words.id,
+            Words.sentences_id,
+            Lexicon.original_word,
+            Lexicon.translated_word,
+            Glosses.explanation,
+            Lexicon.romanization,
+            *columns,
+        )
+        .join(Lexicon, Words.lexicon_id == Lexicon.id)
+        .join(Glosses, Words.gloss_id == Glosses.id)
+    )
+
+
+def content_hash(*values: str) -> str:
+    """Hash identifying a lexicon entry or gloss by its content"""
+    return hashlib.sha256("\x1f".join(values).encode()).hexdigest()
+
+
+def chunked(rows: Sequence[T], columns: int) -> Iterator[Sequence[T]]:
+    """Split insert rows so a statement stays under MAX_BIND_PARAMETERS"""
+    size = max(MAX_BIND_PARAMETERS // columns, 1)
+    for start in range(0, len(rows), size):
+        yield rows[start : start + size]
+
+
+def _insert(dialect: str):
+    return sqlite.insert if dialect == "sqlite" else postgresql.insert
+
+
+def lexicon_upsert(dialect: str, words: Iterable[Tuple[str, str, str]]) -> List:
+    """Upsert the entries of (original_word, translated_word, romanization) triples
+
+    Known entries get their save count bumped by their occurrences. Returns
+    statements of chunked rows, each returning (content_hash, id) rows.
+    """
+    rows: Dict[str, Dict] = {}
+    for original_word, translated_word, romanization in words:
+        key = content_hash(original_word, translated_word, romanization)
+        row = rows.setdefault(
+            key,
+            {
+                "content_hash": key,
+                "original_word": original_word,
+                "translated_word": translated_word,
+                "romanization": romanization,
+                "save_count": 0,
+            },
+        )
+        row["save_count"] += 1
+    statements = []
+    # sorted so concurrent upserts lock rows in the same order
+    for chunk in chunked([rows[key] for key in sorted(rows)], 5):
+        stmt = _insert(dialect)(Lexicon).values(chunk)
+        statements.append(
+            stmt.on_conflict_do_update(
+                index_elements=[Lexicon.content_hash],
+                set_={"save_count": Lexicon.save_count + stmt.excluded.save_count},
+            ).returning(Lexicon.content_hash, Lexicon.id)
+        )
+    return statements
+
+
+def gloss_upsert(dialect: str, explanations: Iterable[str]) -> List:
+    """Upsert explanations, returns statements of chunked rows
+
+    Each statement returns (content_hash, id) rows.
+    """
+    rows = {content_hash(explanation): explanation for explanation in explanations}
+    statements = []
+    for chunk in chunked(sorted(rows), 2):
+        stmt = _insert(dialect)(Glosses).values(
+            [{"content_hash": key, "explanation": rows[key]} for key in chunk]
+        )
+        # a no-op update, so RETURNING also yields the rows that already existed
+        statements.append(
+            stmt.on_conflict_do_update(
+                index_elements=[Glosses.content_hash],
+                set_={"content_hash": stmt.excluded.content_hash},
+            ).returning(Glosses.content_hash, Glosses.id)
+        )
+    return statements
+
+
+def word_rows(
+    words: List[Tuple[int, str, str, str, str]],
+    lexicon_ids: Dict[str, int],
+    gloss_ids: Dict[str, int],
+) -> List[Dict[str, int]]:
+    """Rows of the words join table
+
+    `words` are (sentences_id, original_word, translated_word, explanation,
+    romanization) tuples, the id maps come from the upserts.
+    """
+    return [
+        {
+            "sentences_id": sentences_id,
+            "lexicon_id": lexicon_ids[content_hash(original_word, translated_word, romanization)],
+            "gloss_id": gloss_ids[content_hash(explanation)],
+        }
+        for sentences_id, original_word, translated_word, explanation, romanization in words
+    ]
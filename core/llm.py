@@ -21,8 +21,14 @@ from pydantic import BaseModel
 from .client import llm_client
 
 from models.words import WordsBase
+from telemetry.metrics import observe_upstream, record_llm_usage
+from telemetry.usage import metered
+from telemetry.tracing import traced
 import json
 
+# deployment name of the azure openai model
+LLM_MODEL = "gpt-4o-mini-2"
+
 
 class BoundingPolygon(BaseModel):
     """Bounding Polygon Model"""
@@ -56,7 +62,15 @@ class OcrExtractedText(BaseModel):
     text: str
 
 
-def llm_ocr_selection_postprocessing_service(ocr_data: OcrData) -> str:
+class OcrPostprocessResult(OcrExtractedText):
+    """OCR Postprocess Result with token usage"""
+
+    prompt_tokens: int
+    completion_tokens: int
+
+
+@traced("llm.ocr_postprocess")
+def llm_ocr_selection_postprocessing_service(ocr_data: OcrData) -> OcrPostprocessResult:
     """LLM OCR Postprocessing Service"""
 
     ocr_data_json = json.dumps(ocr_data.model_dump(mode="json"), ensure_ascii=False)
@@ -70,29 +84,36 @@ You will receive OCR data in JSON format, which includes lines of text and their
 Your task is to process this data and return a single string that represents the reconstructed text in its correct reading order.
     """
 
-    response = llm_client.beta.chat.completions.parse(
-        messages=[
-            {
-                "role": "system",
-                "content": prompt,
-            },
-            {
-                "role": "user",
-                "content": ocr_data_json,
-            }
-        ],
-        max_tokens=4096,
-        response_format=OcrExtractedText,
-        model="gpt-4o-mini-2",
-        temperature=1.0,
-    )
+    with observe_upstream("azure_openai", "ocr_postprocess"), metered() as meter:
+        response = llm_client.beta.chat.completions.parse(
+            messages=[
+                {
+                    "role": "system",
+                    "content": prompt,
+                },
+                {
+                    "role": "user",
+                    "content": ocr_data_json,
+                }
+            ],
+            max_tokens=4096,
+            response_format=OcrExtractedText,
+            model=LLM_MODEL,
+            temperature=1.0,
+        )
+        meter.add_llm_usage(response.usage)
+    record_llm_usage(LLM_MODEL, response.usage)
 
     choice = response.choices[0]
     base = choice.message.parsed
     if base is None:
         raise ValueError("LLM response parsing failed, no data returned")
 
-    return base.text
+    return OcrPostprocessResult(
+        text=base.text,
+        prompt_tokens=response.usage.prompt_tokens,
+        completion_tokens=response.usage.completion_tokens,
+    )
 
 
 class WordsExplanation(BaseModel):
@@ -120,6 +141,7 @@ class LLMResponse(FormatResponse):
     completion_tokens: int
 
 
+@traced("llm.explain")
 def llm_explaination_service(
     original_sentence: str,
     translated_sentence: str,
@@ -137,17 +159,20 @@ def llm_explaination_service(
               Provide romanization/pinyin/romaji/romaja as necessary.
               """
 
-    response = llm_client.beta.chat.completions.parse(
-        messages=[
-            {
-                "role": "system",
-                "content": prompt,
-            },
-        ],
-        max_tokens=4096,
-        response_format=FormatResponse,
-        model="gpt-4o-mini-2",
-    )
+    with observe_upstream("azure_openai", "explain"), metered() as meter:
+        response = llm_client.beta.chat.completions.parse(
+            messages=[
+                {
+                    "role": "system",
+                    "content": prompt,
+                },
+            ],
+            max_tokens=4096,
+            response_format=FormatResponse,
+            model=LLM_MODEL,
+        )
+        meter.add_llm_usage(response.usage)
+    record_llm_usage(LLM_MODEL, response.usage)
 
     choice = response.choices[0]
     base = choice.message.parsed
@@ -179,17 +204,20 @@ def llm_service(data: WordsBase) -> LLMResponse:
         f"for each word explanation, do not explain duplicated word"
     )
     # hit api client
-    response = llm_client.beta.chat.completions.parse(
-        messages=[
-            {
-                "role": "system",
-                "content": prompt,
-            },
-        ],
-        max_tokens=4096,
-        response_format=FormatResponse,
-        model="gpt-4o-mini-2",
-    )
+    with observe_upstream("azure_openai", "analyze"), metered() as meter:
+        response = llm_client.beta.chat.completions.parse(
+            messages=[
+                {
+                    "role": "system",
+                    "content": prompt,
+                },
+            ],
+            max_tokens=4096,
+            response_format=FormatResponse,
+            model=LLM_MODEL,
+        )
+        meter.add_llm_usage(response.usage)
+    record_llm_usage(LLM_MODEL, response.usage)
     # structured response
     choice = response.choices[0]
     base: FormatResponse = choice.message.parsed
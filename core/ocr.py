@@ -22,6 +22,13 @@ from azure.ai.vision.imageanalysis.models import VisualFeatures, ImageAnalysisRe
 
 from .client import ocr_client
 
+from telemetry.metrics import observe_upstream
+from telemetry.usage import metered
+from telemetry.log import get_logger
+from telemetry.tracing import traced
+
+logger = get_logger("ocr")
+
 
 class ImageOcrResponse:
     """Image Analysis Response Schema"""
@@ -46,29 +53,37 @@ class ImageOcrResponse:
 
 # TODO: integrate bounding box polygon information to ocr_service
 # TODO: implement auth when prod
+@traced("ocr")
 def raw_ocr_service(image_buffer: bytes) -> ImageAnalysisResult:
     """Raw response OCR Image to text api service"""
     try:
-        response = ocr_client.analyze(
-            image_data=image_buffer, visual_features=[VisualFeatures.READ]
-        )
+        with observe_upstream("azure_vision", "raw_ocr"), metered(images=1):
+            response = ocr_client.analyze(
+                image_data=image_buffer, visual_features=[VisualFeatures.READ]
+            )
         return response
 
     except HttpResponseError as exception:
-        print(f"raw error: {exception}")
-        if exception.error is not None:
-            print(f"Error Code: {exception.error.code}")
-            print(f"Message: {exception.error.message}")
+        logger.error(
+            "azure image-analysis request failed",
+            extra={
+                "error": str(exception),
+                "error_code": exception.error.code if exception.error else None,
+                "error_message": exception.error.message if exception.error else None,
+            },
+        )
         raise
 
 
+@traced("ocr")
 def ocr_service(image_buffer: bytes) -> ImageOcrResponse:
     """OCR Image to text api service"""
     try:
         # hit api client
-        response = ocr_client.analyze(
-            image_data=image_buffer, visual_features=[VisualFeatures.READ]
-        )
+        with observe_upstream("azure_vision", "ocr"), metered(images=1):
+            response = ocr_client.analyze(
+                image_data=image_buffer, visual_features=[VisualFeatures.READ]
+            )
         # prepare for raw line of texts
         merged_lines: List[str] = []
         # merge
@@ -85,8 +100,12 @@ def ocr_service(image_buffer: bytes) -> ImageOcrResponse:
         )
     # catch api errors
     except HttpResponseError as exception:
-        print(f"raw error: {exception}")
-        if exception.error is not None:
-            print(f"Error Code: {exception.error.code}")
-            print(f"Message: {exception.error.message}")
+        logger.error(
+            "azure image-analysis request failed",
+            extra={
+                "error": str(exception),
+                "error_code": exception.error.code if exception.error else None,
+                "error_message": exception.error.message if exception.error else None,
+            },
+        )
         raise
@@ -0,0 +1,271 @@
+# Copyright (c) 2024-2025 LinguaScreen, Inc.
+#
+# This file is part of LinguaScreen Server
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import random
+import time
+from collections import OrderedDict
+from typing import Dict, List, NamedTuple, Optional, Set, Tuple
+
+from sqlmodel import func, select
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from config import settings
+
+from models.sentences import Sentences
+from models.words import Words
+
+from .dictionary import dictionary_version
+from .lexicon import SavedWord, select_words
+
+# number of options in a quiz
+QUIZ_OPTION_COUNT = 5
+
+
+class QuizPool:
+    """Per-user cache of the sentence ids eligible for a quiz
+
+    Pools are reloaded when the dictionary version of the user moved, so
+    saves made by other processes, like the standalone worker, show up.
+    """
+
+    def __init__(self, ttl: float, max_users: int):
+        self.ttl = ttl
+        self.max_users = max_users
+        # user id -> (loaded at, dictionary version, eligible sentence ids),
+        # least recently used first
+        self._pools: "OrderedDict[int, Tuple[float, int, List[int]]]" = OrderedDict()
+
+    async def _load(self, db: AsyncSession, user_id: int) -> List[int]:
+        # covered by the (user_id, word_count, id) index
+        ids = (
+            await db.exec(
+                select(Sentences.id).where(
+                    Sentences.user_id == user_id,
+                    Sentences.word_count >= QUIZ_OPTION_COUNT,
+                )
+            )
+        ).all()
+        return list(ids)
+
+    async def pick(self, db: AsyncSession, user_id: int) -> Optional[int]:
+        """Pick a random eligible sentence id of the user"""
+        version = await dictionary_version(db, user_id)
+        entry = self._pools.get(user_id)
+        if entry is None or entry[1] != version or time.monotonic() - entry[0] > self.ttl:
+            entry = (time.monotonic(), version, await self._load(db, user_id))
+            self._pools[user_id] = entry
+            if len(self._pools) > self.max_users:
+                self._pools.popitem(last=False)
+        self._pools.move_to_end(user_id)
+        ids = entry[2]
+        return random.choice(ids) if ids else None
+
+    def invalidate(self, user_id: int):
+        """Drop the cached pool after the user dictionary changed"""
+        self._pools.pop(user_id, None)
+
+
+quiz_pool = QuizPool(settings.QUIZ_POOL_TTL, settings.QUIZ_POOL_MAX_USERS)
+
+
+class PoolWord(NamedTuple):
+    """Saved word with the context of its sentence"""
+
+    id: int
+    sentences_id: int
+    original_word: str
+    translated_word: str
+    explanation: str
+    romanization: str
+    original: str
+    translation: str
+
+
+class LanguagePairPool:
+    """Words of one language pair, with one representative per translation"""
+
+    def __init__(self):
+        self.words: List[PoolWord] = []
+        self.by_translation: Dict[str, PoolWord] = {}
+
+    def add(self, word: PoolWord):
+        self.words.append(word)
+        self.by_translation.setdefault(word.translated_word, word)
+
+    def distractors(self, answer: PoolWord, count: int) -> List[PoolWord]:
+        """Random words of the pair whose translation differs from the answer"""
+        translations = list(self.by_translation)
+        picked = random.sample(translations, min(count + 1, len(translations)))
+        return [
+            self.by_translation[t] for t in picked if t != answer.translated_word
+        ][:count]
+
+
+class WordPool:
+    """Per-user cache of saved words grouped by language pair
+
+    Reloaded when the dictionary version of the user moved, like QuizPool.
+    """
+
+    def __init__(self, ttl: float, max_users: int, max_words: int):
+        self.ttl = ttl
+        self.max_users = max_users
+        self.max_words = max_words
+        # user id -> (loaded at, dictionary version,
+        # pools keyed by (original_lang, translation_lang))
+        self._pools: "OrderedDict[int, Tuple[float, int, Dict]]" = OrderedDict()
+
+    async def _load(
+        self, db: AsyncSession, user_id: int
+    ) -> Dict[Tuple[str, str], LanguagePairPool]:
+        # most recent words first when the dictionary is larger than the cap
+        rows = (
+            await db.exec(
+                select_words(
+                    Sentences.original,
+                    Sentences.translation,
+                    Sentences.original_lang,
+                    Sentences.translation_lang,
+                )
+                .join(Sentences, Words.sentences_id == Sentences.id)
+                .where(Sentences.user_id == user_id)
+                .order_by(Words.id.desc())
+                .limit(self.max_words)
+            )
+        ).all()
+        pairs: Dict[Tuple[str, str], LanguagePairPool] = {}
+        for row in rows:
+            pair = pairs.setdefault((row[8], row[9]), LanguagePairPool())
+            pair.add(PoolWord(*row[:8]))
+        return pairs
+
+    async def get(
+        self, db: AsyncSession, user_id: int
+    ) -> Dict[Tuple[str, str], LanguagePairPool]:
+        """Get the language pair pools of the user"""
+        version = await dictionary_version(db, user_id)
+        entry = self._pools.get(user_id)
+        if entry is None or entry[1] != version or time.monotonic() - entry[0] > self.ttl:
+            entry = (time.monotonic(), version, await self._load(db, user_id))
+            self._pools[user_id] = entry
+            if len(self._pools) > self.max_users:
+                self._pools.popitem(last=False)
+        self._pools.move_to_end(user_id)
+        return entry[2]
+
+    def invalidate(self, user_id: int):
+        """Drop the cached pool after the user dictionary changed"""
+        self._pools.pop(user_id, None)
+
+
+word_pool = WordPool(
+    settings.QUIZ_POOL_TTL, settings.QUIZ_POOL_MAX_USERS, settings.QUIZ_WORD_POOL_MAX_WORDS
+)
+
+
+class QuizSessions:
+    """Question words already asked per study session"""
+
+    def __init__(self, ttl: float, max_sessions: int):
+        self.ttl = ttl
+        self.max_sessions = max_sessions
+        self._seen: "OrderedDict[Tuple[int, str], Tuple[float, Set[int]]]" = OrderedDict()
+
+    def seen(self, user_id: int, session_id: str) -> Set[int]:
+        """Get the mutable set of word ids asked in the session"""
+        key = (user_id, session_id)
+        entry = self._seen.get(key)
+        if entry is None or time.monotonic() - entry[0] > self.ttl:
+            entry = (time.monotonic(), set())
+        else:
+            entry = (time.monotonic(), entry[1])
+        self._seen[key] = entry
+        self._seen.move_to_end(key)
+        if len(self._seen) > self.max_sessions:
+            self._seen.popitem(last=False)
+        return entry[1]
+
+
+quiz_sessions = QuizSessions(settings.QUIZ_SESSION_TTL, settings.QUIZ_POOL_MAX_USERS)
+
+
+class Quiz(NamedTuple):
+    """Question word with shuffled options"""
+
+    question: PoolWord
+    options: List[PoolWord]
+    correct_answer_index: int
+
+
+async def generate_quiz_batch(
+    db: AsyncSession, user_id: int, count: int, session_id: str
+) -> List[Quiz]:
+    """Generate quizzes with distractors drawn across sentences of the same language pair"""
+    pairs = await word_pool.get(db, user_id)
+    seen = quiz_sessions.seen(user_id, session_id)
+    # questions need enough distinct translations in their pair for the distractors
+    candidates = [
+        (word, pair)
+        for pair in pairs.values()
+        if len(pair.by_translation) >= QUIZ_OPTION_COUNT
+        for word in pair.words
+        if word.id not in seen
+    ]
+    quizzes: List[Quiz] = []
+    for word, pair in random.sample(candidates, min(count, len(candidates))):
+        options = pair.distractors(word, QUIZ_OPTION_COUNT - 1) + [word]
+        random.shuffle(options)
+        seen.add(word.id)
+        quizzes.append(Quiz(word, options, options.index(word)))
+    return quizzes
+
+
+def invalidate_quiz_cache(user_id: int):
+    """Drop every cached quiz pool of the user"""
+    quiz_pool.invalidate(user_id)
+    word_pool.invalidate(user_id)
+
+
+async def pick_quiz_sentence(
+    db: AsyncSession, user_id: int
+) -> Optional[Tuple[Sentences, List[SavedWord]]]:
+    """Pick a random eligible sentence and a random sample of its words"""
+    # a stale pool can point at a sentence deleted by another worker, so retry
+    for _ in range(3):
+        sentence_id = await quiz_pool.pick(db, user_id)
+        if sentence_id is None:
+            return None
+        sentence = (
+            await db.exec(
+                select(Sentences).where(
+                    Sentences.id == sentence_id, Sentences.user_id == user_id
+                )
+            )
+        ).first()
+        if sentence is not None:
+            words = (
+                await db.exec(
+                    select_words()
+                    .where(Words.sentences_id == sentence_id)
+                    .order_by(func.random())
+                    .limit(QUIZ_OPTION_COUNT)
+                )
+            ).all()
+            if len(words) == QUIZ_OPTION_COUNT:
+                return sentence, [SavedWord(*word) for word in words]
+        quiz_pool.invalidate(user_id)
+    return None
@@ -0,0 +1,190 @@
+# Copyright (c) 2024-2025 LinguaScreen, Inc.
+#
+# This file is part of LinguaScreen Server
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import zlib
+from typing import Any, Dict, Optional
+
+from fastapi import status
+from fastapi.responses import ORJSONResponse, Response
+from pydantic import BaseModel
+from starlette.datastructures import Headers, MutableHeaders
+
+import orjson  # noqa: F401, required by ORJSONResponse
+
+from config import settings
+from telemetry.log import get_logger
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - the brotli extra
+    brotli = None
+
+logger = get_logger("responses")
+
+# default response class of the app, orjson renders several times faster
+FastJSONResponse = ORJSONResponse
+
+# content types worth compressing
+COMPRESSIBLE_TYPES = (
+    "application/json",
+    "application/x-ndjson",
+    "text/csv",
+    "text/plain",
+    "text/tab-separated-values",
+)
+
+
+def model_response(
+    model: BaseModel,
+    status_code: int = status.HTTP_200_OK,
+    headers: Optional[Dict[str, str]] = None,
+    **dump_options: Any,
+) -> Response:
+    """Serialize an already validated response model straight to JSON bytes
+
+    Returning it skips the response_model validation and the second
+    serialization pass FastAPI applies to plain return values.
+    """
+    return Response(
+        content=model.model_dump_json(**dump_options),
+        status_code=status_code,
+        headers=headers,
+        media_type="application/json",
+    )
+
+
+def negotiate_encoding(accept_encoding: str) -> Optional[str]:
+    """Pick br or gzip from an Accept-Encoding header, None for identity"""
+    accepted: Dict[str, float] = {}
+    for part in accept_encoding.split(","):
+        coding, _, params = part.strip().partition(";")
+        quality = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        accepted[coding.strip().lower()] = quality
+    wildcard = accepted.get("*", 0.0)
+    for coding in ("br", "gzip"):
+        if coding == "br" and brotli is None:
+            continue
+        if accepted.get(coding, wildcard) > 0:
+            return coding
+    return None
+
+
+class _Compressor:
+    """Incremental br or gzip compressor"""
+
+    def __init__(self, encoding: str):
+        if encoding == "br":
+            self._brotli = brotli.Compressor(quality=settings.COMPRESSION_BROTLI_QUALITY)
+            self._zlib = None
+        else:
+            self._brotli = None
+            # wbits 31 writes the gzip header and trailer
+            self._zlib = zlib.compressobj(settings.COMPRESSION_GZIP_LEVEL, zlib.DEFLATED, 31)
+
+    def compress(self, data: bytes, flush: bool) -> bytes:
+        if self._brotli is not None:
+            out = self._brotli.process(data)
+            return out + (self._brotli.flush() if flush else b"")
+        out = self._zlib.compress(data)
+        return out + (self._zlib.flush(zlib.Z_SYNC_FLUSH) if flush else b"")
+
+    def finish(self, data: bytes) -> bytes:
+        if self._brotli is not None:
+            return self._brotli.process(data) + self._brotli.finish()
+        return self._zlib.compress(data) + self._zlib.flush()
+
+
+class CompressionMiddleware:
+    """ASGI middleware compressing responses above a size threshold
+
+    Bodies sent in one message are compressed whole when they reach
+    COMPRESSION_MINIMUM_SIZE, streamed bodies are compressed chunk by chunk
+    and flushed so every chunk reaches the client. Server-sent events and
+    responses that are already encoded pass through.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        if brotli is None:
+            logger.info("brotli is not installed, responses are compressed with gzip only")
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        encoding = negotiate_encoding(Headers(scope=scope).get("accept-encoding", ""))
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        start_message: Optional[Dict[str, Any]] = None
+        compressor: Optional[_Compressor] = None
+        passthrough = False
+
+        async def send_wrapper(message):
+            nonlocal start_message, compressor, passthrough
+            if message["type"] == "http.response.start":
+                headers = Headers(raw=message["headers"])
+                content_type = headers.get("content-type", "").split(";")[0].strip()
+                passthrough = (
+                    "content-encoding" in headers
+                    or content_type not in COMPRESSIBLE_TYPES
+                )
+                if passthrough:
+                    await send(message)
+                else:
+                    # held until the first body chunk tells whether it is worth it
+                    start_message = message
+                return
+            if message["type"] != "http.response.body" or passthrough:
+                await send(message)
+                return
+            body = message.get("body", b"")
+            more_body = message.get("more_body", False)
+            if start_message is not None:
+                start, start_message = start_message, None
+                headers = MutableHeaders(raw=start["headers"])
+                if not more_body and len(body) < settings.COMPRESSION_MINIMUM_SIZE:
+                    passthrough = True
+                    await send(start)
+                    await send(message)
+                    return
+                compressor = _Compressor(encoding)
+                headers["content-encoding"] = encoding
+                headers.add_vary_header("accept-encoding")
+                if more_body:
+                    del headers["content-length"]
+                else:
+                    body = compressor.finish(body)
+                    headers["content-length"] = str(len(body))
+                    await send(start)
+                    await send({"type": "http.response.body", "body": body})
+                    return
+                await send(start)
+            if more_body:
+                body = compressor.compress(body, flush=True)
+            else:
+                body = compressor.finish(body)
+            await send({"type": "http.response.body", "body": body, "more_body": more_body})
+
+        await self.app(scope, receive, send_wrapper)
@@ -0,0 +1,136 @@
+# Copyright (c) 2024-2025 LinguaScreen, Inc.
+#
+# This file is part of LinguaScreen Server
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+from datetime import datetime, timedelta
+from typing import Dict, List, NamedTuple, Sequence
+
+from sqlalchemy import update
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from config import settings
+
+from models.reviews import Reviews
+from models.words import Words
+
+from .lexicon import select_words
+
+# answers graded below this restart the schedule
+PASSING_GRADE = 3
+MIN_EASE = 1.3
+
+
+class Schedule(NamedTuple):
+    """Spaced repetition state after an answer"""
+
+    due_at: datetime
+    interval_days: float
+    ease: float
+    repetitions: int
+    lapses: int
+
+
+def schedule(review: Reviews, grade: int, now: datetime) -> Schedule:
+    """Next SM-2 schedule of a review graded from 0 to 5"""
+    repetitions, lapses = review.repetitions, review.lapses
+    if grade < PASSING_GRADE:
+        repetitions, lapses, interval = 0, lapses + 1, 1.0
+    else:
+        repetitions += 1
+        if repetitions == 1:
+            interval = 1.0
+        elif repetitions == 2:
+            interval = 6.0
+        else:
+            interval = round(review.interval_days * review.ease, 2)
+    ease = max(
+        MIN_EASE, review.ease + 0.1 - (5 - grade) * (0.08 + (5 - grade) * 0.02)
+    )
+    return Schedule(now + timedelta(days=interval), interval, ease, repetitions, lapses)
+
+
+def review_rows(user_id: int, word_ids: Sequence[int], due_at: datetime) -> List[Dict]:
+    """Rows of the review state of newly saved words, due right away"""
+    return [
+        {"user_id": user_id, "word_id": word_id, "due_at": due_at}
+        for word_id in word_ids
+    ]
+
+
+async def next_reviews(db: AsyncSession, user_id: int, limit: int, now: datetime):
+    """Pop the most overdue words of the user
+
+    The items are read with a range scan of the (user_id, due_at) index and
+    leased in one update, so they are not handed out again until answered or
+    the lease runs out. Rows locked by a concurrent call are skipped, and the
+    update only leases rows still due, so two calls never share a word.
+    Nothing is committed, the caller owns the transaction.
+    """
+    rows = (
+        await db.exec(
+            select_words(Reviews.id, Reviews.due_at, Reviews.repetitions)
+            .join(Reviews, Reviews.word_id == Words.id)
+            .where(Reviews.user_id == user_id, Reviews.due_at <= now)
+            .order_by(Reviews.due_at)
+            .limit(limit)
+            .with_for_update(of=Reviews, skip_locked=True)
+        )
+    ).all()
+    if not rows:
+        return rows
+    leased = set(
+        (
+            await db.exec(
+                update(Reviews)
+                .where(Reviews.id.in_([row[6] for row in rows]), Reviews.due_at <= now)
+                .values(due_at=now + timedelta(seconds=settings.REVIEW_LEASE_SECONDS))
+                .returning(Reviews.id)
+                .execution_options(synchronize_session=False)
+            )
+        ).scalars().all()
+    )
+    return [row for row in rows if row[6] in leased]
+
+
+async def answer_reviews(
+    db: AsyncSession, user_id: int, grades: Dict[int, int], now: datetime
+) -> Dict[int, Schedule]:
+    """Reschedule graded words in one batched update, keyed by word id
+
+    Words that are not in the user queue are ignored. Nothing is committed,
+    the caller owns the transaction.
+    """
+    reviews = (
+        await db.exec(
+            select(Reviews).where(
+                Reviews.user_id == user_id, Reviews.word_id.in_(list(grades))
+            )
+        )
+    ).all()
+    schedules = {
+        review.word_id: schedule(review, grades[review.word_id], now)
+        for review in reviews
+    }
+    if reviews:
+        await db.exec(
+            update(Reviews),
+            params=[
+                {"id": review.id, **schedules[review.word_id]._asdict()}
+                for review in reviews
+            ],
+        )
+    return schedules
@@ -0,0 +1,172 @@
+# Copyright (c) 2024-2025 LinguaScreen, Inc.
+#
+# This file is part of LinguaScreen Server
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import re
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from sqlalchemy import text
+from sqlalchemy.sql.elements import TextClause
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+# most terms of a search query that are matched
+SEARCH_MAX_TERMS = 32
+
+# han, kana and hangul have no spaces between words, they are indexed as bigrams
+_CJK_RUN = re.compile(
+    "[\u1100-\u11ff\u3040-\u30ff\u3130-\u318f\u3400-\u4dbf"
+    "\u4e00-\u9fff\uac00-\ud7af\uf900-\ufaff]+"
+)
+_TERM = re.compile(r"\w+")
+
+
+def _bigrams(run: str, trailing: bool) -> List[str]:
+    if len(run) == 1:
+        return [run]
+    grams = [run[i : i + 2] for i in range(len(run) - 1)]
+    # the last character alone, so a one character query can still match it
+    if trailing:
+        grams.append(run[-1])
+    return grams
+
+
+def segment(value: Optional[str], trailing: bool = True) -> str:
+    """Split CJK runs of a text into space separated bigrams"""
+    if not value:
+        return ""
+    return _CJK_RUN.sub(
+        lambda match: " " + " ".join(_bigrams(match.group(), trailing)) + " ", value
+    )
+
+
+def search_terms(query: str) -> List[str]:
+    """Terms of a search query, segmented like the indexed documents"""
+    return _TERM.findall(segment(query, trailing=False))[:SEARCH_MAX_TERMS]
+
+
+def document_params(
+    sentence_id: int,
+    user_id: int,
+    original: str,
+    translation: str,
+    explanation: Optional[str],
+    words: Iterable[Tuple[str, str, str]],
+) -> Dict[str, Any]:
+    """Bind parameters of the index row of a sentence and its words
+
+    `words` are (original_word, translated_word, romanization) triples.
+    """
+    return {
+        "sentence_id": sentence_id,
+        "user_id": user_id,
+        "owner": f"u{user_id}",
+        "original": segment(original),
+        "translation": segment(translation),
+        "explanation": segment(explanation),
+        "words": " ".join(segment(value) for word in words for value in word if value),
+    }
+
+
+def index_statement(dialect: str) -> TextClause:
+    """Insert of one index row, see document_params"""
+    if dialect == "sqlite":
+        return text(
+            "INSERT INTO sentence_search "
+            "(rowid, owner, original, translation, explanation, words) "
+            "VALUES (:sentence_id, :owner, :original, :translation, :explanation, :words)"
+        )
+    return text(
+        "INSERT INTO sentence_search (sentence_id, user_id, document) VALUES ("
+        ":sentence_id, :user_id, "
+        "setweight(to_tsvector('simple', :original), 'A') || "
+        "setweight(to_tsvector('simple', :translation), 'B') || "
+        "setweight(to_tsvector('simple', :words), 'C') || "
+        "setweight(to_tsvector('simple', :explanation), 'D'))"
+    )
+
+
+async def index_sentences(db: AsyncSession, documents: List[Dict[str, Any]]):
+    """Add sentences to the search index in a single executemany"""
+    if documents:
+        await db.exec(index_statement(db.bind.dialect.name), params=documents)
+
+
+async def unindex_sentences(db: AsyncSession, sentence_ids: Sequence[int]):
+    """Remove deleted sentences from the search index"""
+    if not sentence_ids:
+        return
+    key = "rowid" if db.bind.dialect.name == "sqlite" else "sentence_id"
+    await db.exec(
+        text(f"DELETE FROM sentence_search WHERE {key} = :id"),
+        params=[{"id": sentence_id} for sentence_id in sentence_ids],
+    )
+
+
+def _match_expression(dialect: str, user_id: int, terms: List[str]) -> str:
+    # terms are \w+ only, so they need no escaping; the last one is a prefix
+    if dialect == "sqlite":
+        phrases = " ".join(f'"{term}"' for term in terms) + "*"
+        # the owner token restricts the match to the user documents
+        return f'owner : "u{user_id}" AND - owner : ({phrases})'
+    return " & ".join(terms) + ":*"
+
+
+async def search_sentences(
+    db: AsyncSession,
+    user_id: int,
+    query: str,
+    limit: int,
+    after: Optional[Tuple[float, int]] = None,
+) -> List[Tuple[int, float]]:
+    """Rank the user sentences matching a query, returns (id, score) pairs
+
+    Lower scores rank first. Pass the last pair of a page as `after` to get
+    the next one.
+    """
+    terms = search_terms(query)
+    if not terms:
+        return []
+    dialect = db.bind.dialect.name
+    if dialect == "sqlite":
+        # bm25 weights follow the column order, owner does not count
+        ranked = (
+            "SELECT rowid AS id, bm25(sentence_search, 0.0, 10.0, 5.0, 1.0, 3.0) AS score "
+            "FROM sentence_search WHERE sentence_search MATCH :match"
+        )
+    else:
+        ranked = (
+            "SELECT sentence_id AS id, "
+            "-ts_rank(document, to_tsquery('simple', :match))::float8 AS score "
+            "FROM sentence_search WHERE user_id = :user_id "
+            "AND document @@ to_tsquery('simple', :match)"
+        )
+    params: Dict[str, Any] = {
+        "match": _match_expression(dialect, user_id, terms),
+        "user_id": user_id,
+        "limit": limit,
+    }
+    keyset = ""
+    if after is not None:
+        keyset = "WHERE score > :score OR (score = :score AND id > :id) "
+        params["score"], params["id"] = after
+    rows = await db.exec(
+        text(
+            f"SELECT id, score FROM ({ranked}) AS ranked "
+            f"{keyset}ORDER BY score, id LIMIT :limit"
+        ),
+        params=params,
+    )
+    return [(row.id, row.score) for row in rows]
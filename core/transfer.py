@@ -0,0 +1,284 @@
+# Copyright (c) 2024-2025 LinguaScreen, Inc.
+#
+# This file is part of LinguaScreen Server
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import csv
+import io
+from typing import IO, AsyncIterator, Dict, Iterator, List, Optional, Tuple, Union
+
+from pydantic import ValidationError
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from models.lexicon import Glosses, Lexicon
+from models.sentences import SentenceRecord, Sentences, WordRecord
+from models.words import Words
+
+from .dictionary import ExplainedSentence, naive_utc
+from .llm import LLMResponse, WordsExplanation
+
+# format -> (media type, file extension)
+EXPORT_FORMATS: Dict[str, Tuple[str, str]] = {
+    "ndjson": ("application/x-ndjson", "ndjson"),
+    "csv": ("text/csv", "csv"),
+    "anki": ("text/tab-separated-values", "txt"),
+}
+
+# one row per word, rows of a sentence are consecutive and share sentence_id
+CSV_COLUMNS = [
+    "sentence_id",
+    "original",
+    "original_lang",
+    "translation",
+    "translation_lang",
+    "explanation",
+    "created_at",
+    "original_word",
+    "translated_word",
+    "word_explanation",
+    "romanization",
+]
+
+# file headers understood by the Anki text importer, one note per word
+ANKI_HEADER = [
+    "#separator:tab",
+    "#html:false",
+    "#columns:Front\tBack\tRomanization\tExplanation\tSentence\tTranslation",
+]
+
+# bytes of an export buffered before being sent as one chunk
+EXPORT_CHUNK_SIZE = 64 * 1024
+
+
+async def iter_dictionary(
+    db: AsyncSession, user_id: int, batch_size: int
+) -> AsyncIterator[Tuple[int, SentenceRecord]]:
+    """Stream the user sentences with their words, as (id, record) pairs
+
+    A single query is read through a server-side cursor, `batch_size` rows at
+    a time, so memory does not grow with the dictionary.
+    """
+    result = await db.stream(
+        select(
+            Sentences.id,
+            Sentences.original,
+            Sentences.original_lang,
+            Sentences.translation,
+            Sentences.translation_lang,
+            Sentences.explanation,
+            Sentences.created_at,
+            Words.id.label("word_id"),
+            Lexicon.original_word,
+            Lexicon.translated_word,
+            Glosses.explanation.label("word_explanation"),
+            Lexicon.romanization,
+        )
+        .outerjoin(Words, Words.sentences_id == Sentences.id)
+        .outerjoin(Lexicon, Words.lexicon_id == Lexicon.id)
+        .outerjoin(Glosses, Words.gloss_id == Glosses.id)
+        .where(Sentences.user_id == user_id)
+        .order_by(Sentences.id, Words.id)
+    )
+    current: Optional[Tuple[int, SentenceRecord]] = None
+    async for partition in result.partitions(batch_size):
+        for row in partition:
+            if current is None or current[0] != row.id:
+                if current is not None:
+                    yield current
+                current = (
+                    row.id,
+                    SentenceRecord(
+                        original=row.original,
+                        original_lang=row.original_lang,
+                        translation=row.translation,
+                        translation_lang=row.translation_lang,
+                        explanation=row.explanation,
+                        created_at=row.created_at,
+                    ),
+                )
+            if row.word_id is not None:
+                current[1].words.append(
+                    WordRecord(
+                        original_word=row.original_word,
+                        translated_word=row.translated_word,
+                        explanation=row.word_explanation,
+                        romanization=row.romanization,
+                    )
+                )
+    if current is not None:
+        yield current
+
+
+def _csv_rows(sentence_id: int, record: SentenceRecord) -> List[List]:
+    sentence = [
+        sentence_id,
+        record.original,
+        record.original_lang,
+        record.translation,
+        record.translation_lang,
+        record.explanation or "",
+        record.created_at.isoformat() if record.created_at else "",
+    ]
+    if not record.words:
+        return [sentence + ["", "", "", ""]]
+    return [
+        sentence
+        + [word.original_word, word.translated_word, word.explanation, word.romanization]
+        for word in record.words
+    ]
+
+
+def _anki_rows(record: SentenceRecord) -> List[List]:
+    return [
+        [
+            word.original_word,
+            word.translated_word,
+            word.romanization,
+            word.explanation,
+            record.original,
+            record.translation,
+        ]
+        for word in record.words
+    ]
+
+
+async def serialize_dictionary(
+    fmt: str, records: AsyncIterator[Tuple[int, SentenceRecord]]
+) -> AsyncIterator[str]:
+    """Serialize streamed records, yielding chunks of about EXPORT_CHUNK_SIZE"""
+    buffer = io.StringIO()
+    writer = csv.writer(
+        buffer, delimiter="\t" if fmt == "anki" else ",", lineterminator="\n"
+    )
+    if fmt == "csv":
+        writer.writerow(CSV_COLUMNS)
+    elif fmt == "anki":
+        buffer.write("\n".join(ANKI_HEADER) + "\n")
+    async for sentence_id, record in records:
+        if fmt == "ndjson":
+            buffer.write(record.model_dump_json() + "\n")
+        elif fmt == "csv":
+            writer.writerows(_csv_rows(sentence_id, record))
+        else:
+            writer.writerows(_anki_rows(record))
+        if buffer.tell() >= EXPORT_CHUNK_SIZE:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+def _error(exc: ValidationError) -> str:
+    error = exc.errors()[0]
+    location = ".".join(str(part) for part in error["loc"])
+    return f"{location}: {error['msg']}" if location else error["msg"]
+
+
+def _csv_record(rows: List[Dict[str, str]]) -> SentenceRecord:
+    first = rows[0]
+    return SentenceRecord.model_validate(
+        {
+            "original": first.get("original"),
+            "original_lang": first.get("original_lang"),
+            "translation": first.get("translation"),
+            "translation_lang": first.get("translation_lang"),
+            "explanation": first.get("explanation") or None,
+            "created_at": first.get("created_at") or None,
+            "words": [
+                {
+                    "original_word": row.get("original_word"),
+                    "translated_word": row.get("translated_word"),
+                    "explanation": row.get("word_explanation") or "",
+                    "romanization": row.get("romanization") or "",
+                }
+                for row in rows
+                if row.get("original_word")
+            ],
+        }
+    )
+
+
+def read_records(
+    file: IO[bytes], fmt: str
+) -> Iterator[Tuple[int, Union[SentenceRecord, str]]]:
+    """Parse an uploaded dictionary lazily
+
+    Yields (line, record) pairs, or (line, error) when a record is invalid so
+    the import can go on with the next one.
+    """
+    text = io.TextIOWrapper(file, encoding="utf-8-sig", newline="")
+    if fmt == "ndjson":
+        for line_no, line in enumerate(text, 1):
+            if not line.strip():
+                continue
+            try:
+                yield line_no, SentenceRecord.model_validate_json(line)
+            except ValidationError as exc:
+                yield line_no, _error(exc)
+        return
+    reader = csv.DictReader(text)
+    group: List[Dict[str, str]] = []
+    group_line = 0
+    for row in reader:
+        if group and row.get("sentence_id") != group[0].get("sentence_id"):
+            try:
+                yield group_line, _csv_record(group)
+            except ValidationError as exc:
+                yield group_line, _error(exc)
+            group = []
+        if not group:
+            group_line = reader.line_num
+        group.append(row)
+    if group:
+        try:
+            yield group_line, _csv_record(group)
+        except ValidationError as exc:
+            yield group_line, _error(exc)
+
+
+def take(
+    records: Iterator[Tuple[int, Union[SentenceRecord, str]]], count: int
+) -> List[Tuple[int, Union[SentenceRecord, str]]]:
+    """Next `count` parsed records, fewer at the end of the upload"""
+    batch = []
+    for item in records:
+        batch.append(item)
+        if len(batch) == count:
+            break
+    return batch
+
+
+def to_explained(record: SentenceRecord) -> ExplainedSentence:
+    """Imported record in the shape save_sentences takes"""
+    return ExplainedSentence(
+        original=record.original,
+        original_lang=record.original_lang,
+        translation=record.translation,
+        translation_lang=record.translation_lang,
+        explanation=record.explanation,
+        result=LLMResponse(
+            words_explanation=[
+                WordsExplanation(**word.model_dump()) for word in record.words
+            ],
+            entire_explanation=record.explanation or "",
+            original_sentence=record.original,
+            translated_sentence=record.translation,
+            prompt_tokens=0,
+            completion_tokens=0,
+        ),
+        created_at=naive_utc(record.created_at) if record.created_at else None,
+    )
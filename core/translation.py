@@ -21,6 +21,13 @@ from azure.core.exceptions import HttpResponseError
 
 from .client import translator_client
 
+from telemetry.metrics import observe_upstream
+from telemetry.log import get_logger
+from telemetry.tracing import traced
+from telemetry.usage import metered
+
+logger = get_logger("translation")
+
 
 class TranslationResponse:
     """Translation Response Schema"""
@@ -49,6 +56,7 @@ class TranslationResponse:
         )
 
 
+@traced("translate")
 def translation_service(to_language: str, input_text: str) -> TranslationResponse:
     """Translation api service"""
     # prepare
@@ -57,9 +65,13 @@ def translation_service(to_language: str, input_text: str) -> TranslationRespons
     # try catch
     try:
         # hit api client
-        response = translator_client.translate(
-            body=input_text_elements, to_language=to_language
-        )
+        # billed per character of the source text
+        with observe_upstream("azure_translator", "translate"), metered(
+            characters=len(input_text)
+        ):
+            response = translator_client.translate(
+                body=input_text_elements, to_language=to_language
+            )
         # extract response
         translation = response[0] if response else None
         # structured response
@@ -74,8 +86,12 @@ def translation_service(to_language: str, input_text: str) -> TranslationRespons
         )
     # catch api errors
     except HttpResponseError as exception:
-        print(f"raw error: {exception}")
-        if exception.error is not None:
-            print(f"Error Code: {exception.error.code}")
-            print(f"Message: {exception.error.message}")
+        logger.error(
+            "azure text-translation request failed",
+            extra={
+                "error": str(exception),
+                "error_code": exception.error.code if exception.error else None,
+                "error_message": exception.error.message if exception.error else None,
+            },
+        )
         raise
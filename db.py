@@ -15,24 +15,173 @@
 # You should have received a copy of the GNU Affero General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
-from sqlmodel import SQLModel, create_engine, Session
+from sqlalchemy import event
+from sqlalchemy.engine import Engine, make_url
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlmodel import SQLModel, create_engine
+from sqlmodel.ext.asyncio.session import AsyncSession
 
 from config import settings
+from migrations.runner import run_migrations
+from telemetry.metrics import instrument_engine
+from telemetry.tracing import trace_engine
 
-# Create database engine (sqlite by default)
+# async drivers used when no explicit async url is configured
+ASYNC_DRIVERS = {
+    "sqlite": "sqlite+aiosqlite",
+    "postgresql": "postgresql+asyncpg",
+    "postgres": "postgresql+asyncpg",
+}
+
+
+def get_async_database_url() -> str:
+    """Derive the async driver url from the configured database url"""
+    if settings.ASYNC_DATABASE_URL:
+        return settings.ASYNC_DATABASE_URL
+    url = make_url(settings.DATABASE_URL)
+    driver = ASYNC_DRIVERS.get(url.drivername)
+    if driver is None:
+        return settings.DATABASE_URL
+    return url.set(drivername=driver).render_as_string(hide_password=False)
+
+
+def is_sqlite() -> bool:
+    """Check whether the configured database is sqlite"""
+    return make_url(settings.DATABASE_URL).get_backend_name() == "sqlite"
+
+
+def is_production_profile() -> bool:
+    """Check whether the production database profile is selected"""
+    return settings.DATABASE_PROFILE == "production"
+
+
+def enable_sqlite_foreign_keys(engine: Engine):
+    """Enforce foreign keys, and their ON DELETE actions, on sqlite connections"""
+
+    @event.listens_for(engine, "connect")
+    def _on_connect(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        cursor.execute("PRAGMA foreign_keys=ON")
+        cursor.close()
+
+
+def tune_sqlite(engine: Engine, begin: str = "BEGIN"):
+    """Apply production pragmas to every new sqlite connection"""
+
+    @event.listens_for(engine, "connect")
+    def _on_connect(dbapi_connection, connection_record):
+        # hand transaction control to the begin event below
+        dbapi_connection.isolation_level = None
+        cursor = dbapi_connection.cursor()
+        cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute("PRAGMA synchronous=NORMAL")
+        cursor.execute(f"PRAGMA busy_timeout={settings.SQLITE_BUSY_TIMEOUT_MS}")
+        cursor.execute(f"PRAGMA mmap_size={settings.SQLITE_MMAP_SIZE}")
+        cursor.execute(f"PRAGMA cache_size={settings.SQLITE_CACHE_SIZE}")
+        cursor.execute("PRAGMA temp_store=MEMORY")
+        cursor.close()
+
+    @event.listens_for(engine, "begin")
+    def _on_begin(conn):
+        conn.exec_driver_sql(begin)
+
+
+# Only needed for sqlite
+connect_args = {"check_same_thread": False} if is_sqlite() else {}
+
+# pool sizing of the production profile
+pool_args = (
+    {
+        "pool_size": settings.DATABASE_POOL_SIZE,
+        "max_overflow": settings.DATABASE_MAX_OVERFLOW,
+        "pool_pre_ping": not is_sqlite(),
+    }
+    if is_production_profile()
+    else {}
+)
+
+# sqlite allows one writer at a time, production routes writes through one connection
+serialize_writes = is_production_profile() and is_sqlite()
+
+# Create sync database engine (sqlite by default), used for schema management
 engine = create_engine(
     settings.DATABASE_URL,
     echo=settings.DEBUG,
-    connect_args={"check_same_thread": False},  # Only needed for sqlite
+    connect_args=connect_args,
+)
+instrument_engine(engine)
+trace_engine(engine)
+
+# Create async database engine used by request handlers
+async_engine = create_async_engine(
+    get_async_database_url(),
+    echo=settings.DEBUG,
+    connect_args=connect_args,
+    **pool_args,
+)
+instrument_engine(async_engine.sync_engine)
+trace_engine(async_engine.sync_engine)
+
+if serialize_writes:
+    # the sync engine is a second writer, only used for schema work at startup,
+    # it takes the lock upfront and waits on busy_timeout like the write engine
+    tune_sqlite(engine, begin="BEGIN IMMEDIATE")
+    tune_sqlite(async_engine.sync_engine)
+    # single connection, so writes queue up in the pool instead of failing on locks
+    async_write_engine = create_async_engine(
+        get_async_database_url(),
+        echo=settings.DEBUG,
+        connect_args=connect_args,
+        pool_size=1,
+        max_overflow=0,
+        pool_timeout=settings.DATABASE_WRITE_TIMEOUT,
+    )
+    # take the write lock upfront to avoid deadlocking lock upgrades across workers
+    tune_sqlite(async_write_engine.sync_engine, begin="BEGIN IMMEDIATE")
+    instrument_engine(async_write_engine.sync_engine)
+    trace_engine(async_write_engine.sync_engine)
+else:
+    async_write_engine = async_engine
+
+if is_sqlite():
+    enable_sqlite_foreign_keys(engine)
+    enable_sqlite_foreign_keys(async_engine.sync_engine)
+    if async_write_engine is not async_engine:
+        enable_sqlite_foreign_keys(async_write_engine.sync_engine)
+
+# objects stay usable after commit, handlers read them when building responses
+async_session_factory = async_sessionmaker(
+    async_engine, class_=AsyncSession, expire_on_commit=False
+)
+async_write_session_factory = async_sessionmaker(
+    async_write_engine, class_=AsyncSession, expire_on_commit=False
 )
 
 
 def create_db_and_tables():
-    """Create database tables if they don't exist"""
+    """Create database tables if they don't exist and migrate them"""
+    # every table must be registered on the metadata before create_all,
+    # migrations expect the tables of the current models to exist
+    import models.idempotency  # noqa: F401
+    import models.jobs  # noqa: F401
+    import models.lexicon  # noqa: F401
+    import models.reviews  # noqa: F401
+    import models.sentences  # noqa: F401
+    import models.usage  # noqa: F401
+    import models.user  # noqa: F401
+    import models.words  # noqa: F401
+
     SQLModel.metadata.create_all(engine)
+    run_migrations(engine)
+
+
+async def get_session():
+    """Dependency for async database session"""
+    async with async_session_factory() as session:
+        yield session
 
 
-def get_session():
-    """Dependency for database session"""
-    with Session(engine) as session:
+async def get_write_session():
+    """Dependency for async database session of handlers that write"""
+    async with async_write_session_factory() as session:
         yield session
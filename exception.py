@@ -22,13 +22,16 @@ from sqlalchemy.exc import SQLAlchemyError
 from azure.core.exceptions import HttpResponseError
 
 from main import app
+from telemetry.log import get_logger
+
+logger = get_logger("exception")
 
 
 @app.exception_handler(SQLAlchemyError)
 async def sqlalchemy_error_handler(request: Request, exc: SQLAlchemyError):
     """Custom error exception for database error"""
     # throw error
-    print(f"Database error on {request.url}: {exc}")
+    logger.error("database error", extra={"url": str(request.url), "error": str(exc)})
     return JSONResponse(
         status_code=500,
         content={"detail": "Database error occurred"},
@@ -39,7 +42,7 @@ async def sqlalchemy_error_handler(request: Request, exc: SQLAlchemyError):
 async def http_response_error_handler(request: Request, exc: HttpResponseError):
     """Custom error exception for azure client"""
     # throw error
-    print(f"HttpResponseError on {request.url}: {exc}")
+    logger.error("external service error", extra={"url": str(request.url), "error": str(exc)})
     detail = exc.message if hasattr(exc, "message") else str(exc)
     return JSONResponse(
         status_code=502,
@@ -15,25 +15,87 @@
 # You should have received a copy of the GNU Affero General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
+import asyncio
+from typing import Optional
+
 from fastapi import FastAPI
 
 from config import settings
-from db import create_db_and_tables
-from routers import auth, sentences, gateway
+from core.jobs import JobWorkers
+from core.responses import CompressionMiddleware, FastJSONResponse
+from db import async_write_engine, create_db_and_tables
+from routers import auth, sentences, gateway, review, usage, overlay, jobs, metrics, debug
+from security.idempotency import IdempotentReplay, replay_idempotent_response
+from telemetry.metrics import MetricsMiddleware, start_snapshot_writer, write_snapshot
+from telemetry.tracing import TracingMiddleware
+from telemetry.profiler import ProfilerMiddleware
+from telemetry.log import RequestIdMiddleware
+from telemetry.usage import UsageMiddleware, start_usage_flusher, usage_ledger
 
 # main app
-app = FastAPI(title=settings.APP_NAME, debug=settings.DEBUG)
+app = FastAPI(
+    title=settings.APP_NAME,
+    debug=settings.DEBUG,
+    default_response_class=FastJSONResponse,
+)
+
+# add middlewares
+if settings.COMPRESSION_ENABLED:
+    app.add_middleware(CompressionMiddleware)
+if settings.PROFILER_ENABLED:
+    app.add_middleware(ProfilerMiddleware)
+if settings.TRACING_ENABLED:
+    app.add_middleware(TracingMiddleware)
+if settings.METRICS_ENABLED:
+    app.add_middleware(MetricsMiddleware)
+if settings.USAGE_ENABLED:
+    app.add_middleware(UsageMiddleware)
+app.add_middleware(RequestIdMiddleware)
+
+# answer retried requests with their stored response
+app.add_exception_handler(IdempotentReplay, replay_idempotent_response)
 
 # add routers
 app.include_router(auth.router)
 app.include_router(sentences.router)
 app.include_router(gateway.router)
+app.include_router(review.router)
+app.include_router(usage.router)
+app.include_router(overlay.router)
+app.include_router(jobs.router)
+if settings.METRICS_ENABLED:
+    app.include_router(metrics.router)
+if settings.PROFILER_ENABLED:
+    app.include_router(debug.router)
+
+
+# background jobs run in this process unless JOB_WORKERS is 0
+job_workers = JobWorkers(settings.JOB_WORKERS)
+usage_flusher: Optional[asyncio.Task] = None
 
 
 @app.on_event("startup")
-def on_startup():
+async def on_startup():
     """Initialize database on application startup"""
+    global usage_flusher
     create_db_and_tables()
+    if settings.METRICS_ENABLED:
+        start_snapshot_writer()
+    if settings.USAGE_ENABLED:
+        usage_flusher = start_usage_flusher(async_write_engine)
+    job_workers.start()
+
+
+@app.on_event("shutdown")
+async def on_shutdown():
+    """Flush worker state on application shutdown"""
+    await job_workers.stop()
+    if settings.METRICS_ENABLED:
+        write_snapshot()
+    if usage_flusher is not None:
+        usage_flusher.cancel()
+    if settings.USAGE_ENABLED:
+        await usage_ledger.flush(async_write_engine)
 
 
 @app.get("/")
@@ -0,0 +1,66 @@
+# Copyright (c) 2024-2025 LinguaScreen, Inc.
+#
+# This file is part of LinguaScreen Server
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+from datetime import datetime, timezone
+
+from sqlalchemy import Column, DateTime, Integer, MetaData, String, Table, insert, select
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import IntegrityError
+
+from migrations.versions import MIGRATIONS
+from telemetry.log import get_logger
+
+logger = get_logger("migrations")
+
+# bookkeeping table, kept out of the models metadata
+schema_migrations = Table(
+    "schema_migrations",
+    MetaData(),
+    Column("version", Integer, primary_key=True),
+    Column("name", String, nullable=False),
+    Column("applied_at", DateTime, nullable=False),
+)
+
+
+def run_migrations(engine: Engine):
+    """Apply every pending migration in version order"""
+    schema_migrations.create(engine, checkfirst=True)
+    with engine.connect() as conn:
+        applied = set(conn.execute(select(schema_migrations.c.version)).scalars())
+
+    for migration in sorted(MIGRATIONS, key=lambda m: m.version):
+        if migration.version in applied:
+            continue
+        try:
+            # schema change and version record commit together
+            with engine.begin() as conn:
+                migration.upgrade(conn)
+                conn.execute(
+                    insert(schema_migrations).values(
+                        version=migration.version,
+                        name=migration.name,
+                        applied_at=datetime.now(timezone.utc),
+                    )
+                )
+        except IntegrityError:
+            # another worker applied it concurrently
+            logger.info("migration already applied", extra={"version": migration.version})
+            continue
+        logger.info(
+            "applied migration",
+            extra={"version": migration.version, "migration": migration.name},
+        )
@@ -0,0 +1,277 @@
+# Copyright (c) 2024-2025 LinguaScreen, Inc.
+#
+# This file is part of LinguaScreen Server
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+from collections import defaultdict
+from typing import Callable, List, NamedTuple
+
+from sqlalchemy import bindparam, inspect, text
+from sqlalchemy.engine import Connection
+
+from core.lexicon import content_hash, gloss_upsert, lexicon_upsert
+from core.search import document_params, index_statement
+
+
+class Migration(NamedTuple):
+    """Versioned schema change applied once per database"""
+
+    version: int
+    name: str
+    upgrade: Callable[[Connection], None]
+
+
+# Migrations may run on a database freshly created from the current models,
+# so every step must be a no-op when the change is already there.
+
+
+def has_column(conn: Connection, table: str, column: str) -> bool:
+    """Check whether a table has a column"""
+    return any(c["name"] == column for c in inspect(conn).get_columns(table))
+
+
+def add_sentence_and_word_indexes(conn: Connection):
+    conn.execute(text("CREATE INDEX IF NOT EXISTS ix_sentences_user_id ON sentences (user_id)"))
+    conn.execute(text("CREATE INDEX IF NOT EXISTS ix_words_sentences_id ON words (sentences_id)"))
+
+
+def add_composite_indexes(conn: Connection):
+    conn.execute(
+        text("CREATE INDEX IF NOT EXISTS ix_sentences_user_id_id ON sentences (user_id, id)")
+    )
+    conn.execute(
+        text("CREATE INDEX IF NOT EXISTS ix_words_sentences_id_id ON words (sentences_id, id)")
+    )
+
+
+def add_sentence_word_count(conn: Connection):
+    if not has_column(conn, "sentences", "word_count"):
+        conn.execute(
+            text("ALTER TABLE sentences ADD COLUMN word_count INTEGER NOT NULL DEFAULT 0")
+        )
+        conn.execute(
+            text(
+                "UPDATE sentences SET word_count = "
+                "(SELECT count(*) FROM words WHERE words.sentences_id = sentences.id)"
+            )
+        )
+    conn.execute(
+        text(
+            "CREATE INDEX IF NOT EXISTS ix_sentences_user_id_word_count "
+            "ON sentences (user_id, word_count, id)"
+        )
+    )
+
+
+def cascade_word_deletes(conn: Connection):
+    foreign_keys = inspect(conn).get_foreign_keys("words")
+    sentence_fk = next(
+        fk for fk in foreign_keys if fk["referred_table"] == "sentences"
+    )
+    if (sentence_fk.get("options") or {}).get("ondelete", "").upper() == "CASCADE":
+        return
+    if conn.dialect.name != "sqlite":
+        conn.execute(text(f'ALTER TABLE words DROP CONSTRAINT "{sentence_fk["name"]}"'))
+        conn.execute(
+            text(
+                "ALTER TABLE words ADD CONSTRAINT words_sentences_id_fkey "
+                "FOREIGN KEY (sentences_id) REFERENCES sentences (id) ON DELETE CASCADE"
+            )
+        )
+        return
+    # sqlite cannot alter constraints, rebuild the table
+    conn.execute(
+        text(
+            "CREATE TABLE words_new ("
+            "original_word VARCHAR NOT NULL, "
+            "translated_word VARCHAR NOT NULL, "
+            "explanation VARCHAR NOT NULL, "
+            "romanization VARCHAR NOT NULL, "
+            "sentences_id INTEGER, "
+            "id INTEGER NOT NULL, "
+            "PRIMARY KEY (id), "
+            "FOREIGN KEY(sentences_id) REFERENCES sentences (id) ON DELETE CASCADE)"
+        )
+    )
+    # words orphaned by earlier partial deletes are dropped on the way
+    conn.execute(
+        text(
+            "INSERT INTO words_new "
+            "(original_word, translated_word, explanation, romanization, sentences_id, id) "
+            "SELECT original_word, translated_word, explanation, romanization, sentences_id, id "
+            "FROM words WHERE sentences_id IS NULL "
+            "OR sentences_id IN (SELECT id FROM sentences)"
+        )
+    )
+    conn.execute(text("DROP TABLE words"))
+    conn.execute(text("ALTER TABLE words_new RENAME TO words"))
+    conn.execute(text("CREATE INDEX ix_words_sentences_id ON words (sentences_id)"))
+    conn.execute(text("CREATE INDEX ix_words_sentences_id_id ON words (sentences_id, id)"))
+
+
+def add_sentence_created_at(conn: Connection):
+    if not has_column(conn, "sentences", "created_at"):
+        conn.execute(text("ALTER TABLE sentences ADD COLUMN created_at TIMESTAMP"))
+
+
+def add_sentence_search(conn: Connection):
+    if conn.dialect.name == "sqlite":
+        conn.execute(
+            text(
+                "CREATE VIRTUAL TABLE IF NOT EXISTS sentence_search USING fts5("
+                "owner, original, translation, explanation, words, "
+                "tokenize = 'unicode61 remove_diacritics 2')"
+            )
+        )
+        indexed = "SELECT rowid FROM sentence_search"
+    else:
+        conn.execute(
+            text(
+                "CREATE TABLE IF NOT EXISTS sentence_search ("
+                "sentence_id INTEGER PRIMARY KEY, "
+                "user_id INTEGER, "
+                "document TSVECTOR NOT NULL)"
+            )
+        )
+        conn.execute(
+            text(
+                "CREATE INDEX IF NOT EXISTS ix_sentence_search_user_id "
+                "ON sentence_search (user_id)"
+            )
+        )
+        conn.execute(
+            text(
+                "CREATE INDEX IF NOT EXISTS ix_sentence_search_document "
+                "ON sentence_search USING GIN (document)"
+            )
+        )
+        indexed = "SELECT sentence_id FROM sentence_search"
+    # backfill sentences saved before the index existed, in batches
+    last_id = 0
+    while True:
+        sentences = conn.execute(
+            text(
+                "SELECT id, user_id, original, translation, explanation FROM sentences "
+                f"WHERE id > :last_id AND id NOT IN ({indexed}) ORDER BY id LIMIT 1000"
+            ),
+            {"last_id": last_id},
+        ).all()
+        if not sentences:
+            break
+        last_id = sentences[-1].id
+        words = defaultdict(list)
+        for row in conn.execute(
+            text(
+                "SELECT sentences_id, original_word, translated_word, romanization "
+                "FROM words WHERE sentences_id IN :ids"
+            ).bindparams(bindparam("ids", expanding=True)),
+            {"ids": [sentence.id for sentence in sentences]},
+        ):
+            words[row.sentences_id].append(
+                (row.original_word, row.translated_word, row.romanization)
+            )
+        conn.execute(
+            index_statement(conn.dialect.name),
+            [
+                document_params(
+                    sentence.id,
+                    sentence.user_id,
+                    sentence.original,
+                    sentence.translation,
+                    sentence.explanation,
+                    words[sentence.id],
+                )
+                for sentence in sentences
+            ],
+        )
+
+
+def normalize_words_into_lexicon(conn: Connection):
+    # lexicon and glosses are created by create_all before migrations run
+    if has_column(conn, "words", "lexicon_id"):
+        return
+    conn.execute(text("ALTER TABLE words ADD COLUMN lexicon_id INTEGER REFERENCES lexicon (id)"))
+    conn.execute(text("ALTER TABLE words ADD COLUMN gloss_id INTEGER REFERENCES glosses (id)"))
+    # move word content into shared entries, in batches
+    last_id = 0
+    while True:
+        words = conn.execute(
+            text(
+                "SELECT id, original_word, translated_word, explanation, romanization "
+                "FROM words WHERE id > :last_id ORDER BY id LIMIT 1000"
+            ),
+            {"last_id": last_id},
+        ).all()
+        if not words:
+            break
+        last_id = words[-1].id
+        lexicon_ids = {}
+        for stmt in lexicon_upsert(
+            conn.dialect.name,
+            [(w.original_word, w.translated_word, w.romanization) for w in words],
+        ):
+            lexicon_ids.update(conn.execute(stmt).all())
+        gloss_ids = {}
+        for stmt in gloss_upsert(conn.dialect.name, [w.explanation for w in words]):
+            gloss_ids.update(conn.execute(stmt).all())
+        conn.execute(
+            text("UPDATE words SET lexicon_id = :lexicon_id, gloss_id = :gloss_id WHERE id = :id"),
+            [
+                {
+                    "id": w.id,
+                    "lexicon_id": lexicon_ids[
+                        content_hash(w.original_word, w.translated_word, w.romanization)
+                    ],
+                    "gloss_id": gloss_ids[content_hash(w.explanation)],
+                }
+                for w in words
+            ],
+        )
+    for column in ("original_word", "translated_word", "explanation", "romanization"):
+        conn.execute(text(f"ALTER TABLE words DROP COLUMN {column}"))
+    conn.execute(text("CREATE INDEX IF NOT EXISTS ix_words_lexicon_id ON words (lexicon_id)"))
+
+
+def add_word_reviews(conn: Connection):
+    # reviews is created by create_all, words saved before it are due right away
+    conn.execute(
+        text(
+            "INSERT INTO reviews "
+            "(user_id, word_id, due_at, interval_days, ease, repetitions, lapses) "
+            "SELECT sentences.user_id, words.id, "
+            "COALESCE(sentences.created_at, CURRENT_TIMESTAMP), 0, 2.5, 0, 0 "
+            "FROM words JOIN sentences ON sentences.id = words.sentences_id "
+            "WHERE sentences.user_id IS NOT NULL "
+            "AND words.id NOT IN (SELECT word_id FROM reviews)"
+        )
+    )
+
+
+def add_idempotency_headers(conn: Connection):
+    if not has_column(conn, "idempotency_records", "headers"):
+        conn.execute(text("ALTER TABLE idempotency_records ADD COLUMN headers VARCHAR"))
+
+
+MIGRATIONS: List[Migration] = [
+    Migration(1, "index sentences.user_id and words.sentences_id", add_sentence_and_word_indexes),
+    Migration(2, "composite indexes on (user_id, id) and (sentences_id, id)", add_composite_indexes),
+    Migration(3, "sentences.word_count for quiz eligibility", add_sentence_word_count),
+    Migration(4, "ON DELETE CASCADE on words.sentences_id", cascade_word_deletes),
+    Migration(5, "sentences.created_at", add_sentence_created_at),
+    Migration(6, "full-text search index over sentences and words", add_sentence_search),
+    Migration(7, "words reference a shared lexicon and glosses", normalize_words_into_lexicon),
+    Migration(8, "spaced repetition state of saved words", add_word_reviews),
+    Migration(9, "idempotency_records.headers replayed with the response", add_idempotency_headers),
+]
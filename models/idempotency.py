@@ -0,0 +1,40 @@
+# Copyright (c) 2024-2025 LinguaScreen, Inc.
+#
+# This file is part of LinguaScreen Server
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+from datetime import datetime
+from typing import Optional
+
+from sqlmodel import Field, SQLModel
+
+
+class IdempotencyRecord(SQLModel, table=True):
+    """Database model for the stored result of an idempotent request"""
+
+    __tablename__ = "idempotency_records"
+
+    id: Optional[int] = Field(default=None, primary_key=True)
+    # caller, route and Idempotency-Key header
+    key: str = Field(unique=True)
+    # sha256 of the request body the key was first used with
+    request_hash: str
+    # null while the first request is in progress
+    status_code: Optional[int] = None
+    response: Optional[str] = None
+    # JSON object of response headers sent again on replay
+    headers: Optional[str] = None
+    created_at: datetime
+    expires_at: datetime = Field(index=True)
@@ -0,0 +1,85 @@
+# Copyright (c) 2024-2025 LinguaScreen, Inc.
+#
+# This file is part of LinguaScreen Server
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+from datetime import datetime
+from typing import Any, Optional
+
+from sqlalchemy import Index
+from sqlmodel import Field, SQLModel
+from pydantic import BaseModel
+
+# job states, queued and running jobs are claimed once available_at is past
+JOB_QUEUED = "queued"
+JOB_RUNNING = "running"
+JOB_DONE = "done"
+JOB_FAILED = "failed"
+
+
+class Job(SQLModel, table=True):
+    """Database model for a background job"""
+
+    __tablename__ = "jobs"
+    __table_args__ = (
+        Index("ix_jobs_status_available_at", "status", "available_at"),
+        Index("ix_jobs_user_id_id", "user_id", "id"),
+    )
+
+    id: Optional[int] = Field(default=None, primary_key=True)
+    user_id: int
+    kind: str
+    status: str = Field(default=JOB_QUEUED)
+    # json request, and json result once done
+    payload: str
+    result: Optional[str] = None
+    error: Optional[str] = None
+    attempts: int = Field(default=0)
+    # when a queued job may run, or when the lease of a running one expires
+    available_at: datetime
+    created_at: datetime
+    updated_at: datetime
+
+
+# schema
+class JobStatus(BaseModel):
+    """Model for the state of a background job"""
+
+    id: int
+    kind: str
+    status: str
+    attempts: int
+    result: Optional[Any] = None
+    error: Optional[str] = None
+    created_at: datetime
+    updated_at: datetime
+
+class JobStatusResponse(BaseModel):
+    """Model for GET /jobs/{id} response body"""
+
+    message: str
+    result: JobStatus
+
+class JobAccepted(BaseModel):
+    """Model for a job that was queued"""
+
+    job_id: int
+    status: str
+
+class JobAcceptedResponse(BaseModel):
+    """Model for the response body of a request answered with a queued job"""
+
+    message: str
+    result: JobAccepted
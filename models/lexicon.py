@@ -0,0 +1,47 @@
+# Copyright (c) 2024-2025 LinguaScreen, Inc.
+#
+# This file is part of LinguaScreen Server
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+from typing import Optional
+
+from sqlmodel import Field, SQLModel
+
+
+class LexiconBase(SQLModel):
+    """Base model for lexicon entries"""
+
+    original_word: str
+    translated_word: str
+    romanization: str = ""
+
+
+class Lexicon(LexiconBase, table=True):
+    """Database model for a distinct word shared across sentences and users"""
+
+    id: Optional[int] = Field(default=None, primary_key=True)
+    # sha256 of the entry content, the upsert key
+    content_hash: str = Field(unique=True)
+    # number of times the entry was saved, across every user
+    save_count: int = Field(default=0)
+
+
+class Glosses(SQLModel, table=True):
+    """Database model for a distinct word explanation"""
+
+    id: Optional[int] = Field(default=None, primary_key=True)
+    # sha256 of the explanation, the upsert key
+    content_hash: str = Field(unique=True)
+    explanation: str
@@ -0,0 +1,83 @@
+# Copyright (c) 2024-2025 LinguaScreen, Inc.
+#
+# This file is part of LinguaScreen Server
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+from datetime import datetime
+from typing import List, Optional
+
+from sqlalchemy import Index
+from sqlmodel import Field, SQLModel
+from pydantic import BaseModel, Field as PydanticField
+
+
+class Reviews(SQLModel, table=True):
+    """Database model for the spaced repetition state of a saved word"""
+
+    __table_args__ = (Index("ix_reviews_user_id_due_at", "user_id", "due_at"),)
+
+    id: Optional[int] = Field(default=None, primary_key=True)
+    user_id: int
+    word_id: int = Field(foreign_key="words.id", ondelete="CASCADE", unique=True)
+    due_at: datetime
+    interval_days: float = Field(default=0.0)
+    ease: float = Field(default=2.5)
+    repetitions: int = Field(default=0)
+    lapses: int = Field(default=0)
+
+
+# schema
+class ReviewItem(BaseModel):
+    """Model for a saved word handed out for review"""
+
+    word_id: int
+    sentences_id: int
+    original_word: str
+    translated_word: str
+    explanation: str
+    romanization: str
+    due_at: datetime
+    repetitions: int
+
+class ReviewNextResponse(BaseModel):
+    """Model for POST /review/next response body"""
+
+    message: str
+    result: List[ReviewItem]
+
+class ReviewAnswer(BaseModel):
+    """Grade of a reviewed word, from 0 (forgotten) to 5 (perfect recall)"""
+
+    word_id: int
+    grade: int = PydanticField(ge=0, le=5)
+
+class ReviewAnswersRequestBody(BaseModel):
+    """Request body for grading reviewed words"""
+
+    answers: List[ReviewAnswer] = PydanticField(min_length=1, max_length=100)
+
+class ReviewSchedule(BaseModel):
+    """Model for the new schedule of a graded word"""
+
+    word_id: int
+    due_at: datetime
+    interval_days: float
+    repetitions: int
+
+class ReviewAnswersResponse(BaseModel):
+    """Model for POST /review/answers response body"""
+
+    message: str
+    result: List[ReviewSchedule]
@@ -15,10 +15,12 @@
 # You should have received a copy of the GNU Affero General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
+from datetime import datetime
 from typing import Optional, List
 
+from sqlalchemy import Index
 from sqlmodel import Field, SQLModel, Relationship
-from pydantic import BaseModel
+from pydantic import BaseModel, Field as PydanticField
 
 from .words import Words
 
@@ -31,16 +33,34 @@ class SentencesBase(SQLModel, BaseModel):
     translation: str
     translation_lang: str
     explanation: Optional[str] = None
-    user_id: Optional[int] = None
+    user_id: Optional[int] = Field(default=None, index=True)
 
 
 class Sentences(SentencesBase, table=True):
     """Database model for saved sentences"""
 
+    __table_args__ = (
+        Index("ix_sentences_user_id_id", "user_id", "id"),
+        Index("ix_sentences_user_id_word_count", "user_id", "word_count", "id"),
+    )
+
     id: Optional[int] = Field(default=None, primary_key=True)
+    # number of saved words, maintained on save so quizzes skip counting
+    word_count: int = Field(default=0)
+    # unset on sentences saved before it was tracked
+    created_at: Optional[datetime] = Field(default=None)
+
+    # relationship to words, deleted by the database through ON DELETE CASCADE
+    words: List[Words] = Relationship(back_populates="sentences", passive_deletes=True)
+
 
-    # relationship to words
-    words: List[Words] = Relationship(back_populates="sentences")
+class DictionaryVersion(SQLModel, table=True):
+    """Database model for a counter bumped on every change to a user dictionary"""
+
+    __tablename__ = "dictionary_versions"
+
+    user_id: int = Field(primary_key=True, sa_column_kwargs={"autoincrement": False})
+    version: int = Field(default=0)
 
 
 # schema
@@ -55,8 +75,71 @@ class SentenceResponse(SentencesBase):
 
     id: int
 
+class BulkDeleteRequestBody(BaseModel):
+    """Request body for deleting many sentences, criteria are combined with AND"""
+
+    ids: Optional[List[int]] = PydanticField(default=None, max_length=1000)
+    original_lang: Optional[str] = None
+    translation_lang: Optional[str] = None
+    created_before: Optional[datetime] = None
+    created_after: Optional[datetime] = None
+
+class BulkDeleteResponse(BaseModel):
+    """Response model for bulk sentence deletion"""
+
+    class ResultModel(BaseModel):
+        """Result model for bulk deletion response"""
+
+        deleted: int
+
+    message: str
+    result: ResultModel
+
+class SentencePreview(BaseModel):
+    """Model for a sentence projected to the requested fields"""
+
+    id: Optional[int] = None
+    original: Optional[str] = None
+    original_lang: Optional[str] = None
+    translation: Optional[str] = None
+    translation_lang: Optional[str] = None
+    explanation: Optional[str] = None
+    user_id: Optional[int] = None
+
 class GetSentencesResponse(BaseModel):
     """Model for GET /sentence/ response body"""
 
     message: str
-    result: List[SentenceResponse]
\ No newline at end of file
+    result: List[SentencePreview]
+    next_cursor: Optional[str] = None
+
+class SentenceSearchResult(SentenceResponse):
+    """Model for a sentence matched by a search, lower scores rank first"""
+
+    score: float
+
+class SearchSentencesResponse(BaseModel):
+    """Model for GET /sentence/search response body"""
+
+    message: str
+    result: List[SentenceSearchResult]
+    next_cursor: Optional[str] = None
+
+class WordRecord(BaseModel):
+    """Word of an exported or imported sentence"""
+
+    original_word: str
+    translated_word: str
+    explanation: str = ""
+    romanization: str = ""
+
+class SentenceRecord(BaseModel):
+    """Sentence with its words, as one record of an export or import"""
+
+    original: str
+    original_lang: str
+    translation: str
+    translation_lang: str
+    explanation: Optional[str] = None
+    created_at: Optional[datetime] = None
+    words: List[WordRecord] = []
@@ -0,0 +1,88 @@
+# Copyright (c) 2024-2025 LinguaScreen, Inc.
+#
+# This file is part of LinguaScreen Server
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+from datetime import date
+from typing import List, Optional
+
+from sqlalchemy import UniqueConstraint
+from sqlmodel import Field, SQLModel
+from pydantic import BaseModel
+
+
+class UsageDaily(SQLModel, table=True):
+    """Database model for the upstream usage of a user on an endpoint in a day"""
+
+    __tablename__ = "usage_daily"
+    __table_args__ = (
+        UniqueConstraint(
+            "user_id", "day", "endpoint", name="uq_usage_daily_user_id_day_endpoint"
+        ),
+    )
+
+    id: Optional[int] = Field(default=None, primary_key=True)
+    # 0 for anonymous callers
+    user_id: int
+    day: date
+    endpoint: str
+    calls: int = Field(default=0)
+    prompt_tokens: int = Field(default=0)
+    completion_tokens: int = Field(default=0)
+    characters: int = Field(default=0)
+    images: int = Field(default=0)
+    cache_hits: int = Field(default=0)
+    # summed latency of the upstream calls
+    upstream_ms: float = Field(default=0.0)
+
+
+# schema
+class UsageTotals(BaseModel):
+    """Model for summed upstream usage"""
+
+    calls: int
+    prompt_tokens: int
+    completion_tokens: int
+    characters: int
+    images: int
+    cache_hits: int
+    upstream_ms: float
+    avg_upstream_ms: float
+
+class EndpointUsage(UsageTotals):
+    """Model for the upstream usage of an endpoint"""
+
+    endpoint: str
+
+class DailyUsage(UsageTotals):
+    """Model for the upstream usage of an endpoint in a day"""
+
+    day: date
+    endpoint: str
+
+class UsageSummaryResponse(BaseModel):
+    """Model for GET /usage/summary response body"""
+
+    message: str
+    since: date
+    total: UsageTotals
+    result: List[EndpointUsage]
+
+class DailyUsageResponse(BaseModel):
+    """Model for GET /usage/daily response body"""
+
+    message: str
+    since: date
+    result: List[DailyUsage]
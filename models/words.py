@@ -17,6 +17,7 @@
 
 from typing import Optional, TYPE_CHECKING
 
+from sqlalchemy import Index
 from sqlmodel import Field, SQLModel, Relationship
 
 if TYPE_CHECKING:
@@ -24,18 +25,25 @@ if TYPE_CHECKING:
 
 
 class WordsBase(SQLModel):
-    """Base model for saved words"""
+    """Base model for saved words, as served by the API"""
 
     original_word: str
     translated_word: str
     explanation: str
     romanization: str = ""
-    sentences_id: Optional[int] = Field(default=None, foreign_key="sentences.id")
+    sentences_id: Optional[int] = None
 
 
-class Words(WordsBase, table=True):
-    """Database model for saved words"""
+class Words(SQLModel, table=True):
+    """Database model joining sentences to their lexicon entries and glosses"""
+
+    __table_args__ = (Index("ix_words_sentences_id_id", "sentences_id", "id"),)
 
     id: Optional[int] = Field(default=None, primary_key=True)
+    sentences_id: Optional[int] = Field(
+        default=None, foreign_key="sentences.id", ondelete="CASCADE", index=True
+    )
+    lexicon_id: int = Field(foreign_key="lexicon.id", index=True)
+    gloss_id: int = Field(foreign_key="glosses.id")
 
     sentences: Optional["Sentences"] = Relationship(back_populates="words")
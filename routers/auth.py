@@ -16,11 +16,13 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
 from datetime import timedelta
-from fastapi import APIRouter, Depends, HTTPException, status
-from sqlmodel import Session, select
+from fastapi import APIRouter, Depends, HTTPException, Request, status
+from sqlalchemy.exc import IntegrityError
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
 
 from config import settings
-from db import get_session
+from db import get_session, get_write_session
 
 from models.user import (
     User,
@@ -30,36 +32,77 @@ from models.user import (
     LoginResponse,
 )
 
-from security.auth import authenticate_user, get_password_hash
-from security.jwt import create_access_token, get_current_user
+from security.auth import (
+    HashingAdmissionError,
+    HashingQueueFullError,
+    authenticate_user,
+    get_password_hash,
+    password_hasher,
+)
+from security.jwt import create_access_token, get_current_user, token_claims
+from security.ratelimit import client_address
 
 router = APIRouter(tags=["authentication"])
 
 
+def hashing_rejected(exc: RuntimeError) -> HTTPException:
+    """Response for a password hash refused by the pool"""
+    if isinstance(exc, HashingAdmissionError):
+        return HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail="Too many concurrent attempts, try again later",
+            headers={"Retry-After": "1"},
+        )
+    return HTTPException(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        detail="Server is busy, try again later",
+        headers={"Retry-After": "1"},
+    )
+
+
 @router.post(
     "/register", status_code=status.HTTP_201_CREATED, response_model=RegisterResponse
 )
-def register(req_body: RegisterSchema, db: Session = Depends(get_session)):
+async def register(
+    req_body: RegisterSchema,
+    request: Request,
+    db: AsyncSession = Depends(get_session),
+    write_db: AsyncSession = Depends(get_write_session),
+):
     """Create a new user with hashed password"""
     # get user by email
-    existing_user = db.exec(select(User).where(User.email == req_body.email)).first()
+    existing_user = (
+        await db.exec(select(User).where(User.email == req_body.email))
+    ).first()
     # check if exist
     if existing_user:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Email already registered",
         )
-    # hash password
-    hashed_password = get_password_hash(req_body.password)
-    # save to db
+    # end the read transaction, no connection is held while hashing
+    await db.commit()
+    # hash password in the password pool, kept off the event loop
+    try:
+        hashed_password = await password_hasher.run(
+            get_password_hash, req_body.password, client=client_address(request)
+        )
+    except (HashingAdmissionError, HashingQueueFullError) as exc:
+        raise hashing_rejected(exc)
+    # save to db, the unique constraints catch a concurrent registration
     db_user = User(
         username=req_body.username,
         email=req_body.email,
         hashed_password=hashed_password,
     )
-    db.add(db_user)
-    db.commit()
-    db.refresh(db_user)
+    write_db.add(db_user)
+    try:
+        await write_db.commit()
+    except IntegrityError:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Username or email already registered",
+        )
     # return response
     return {
         "message": "successful account registration",
@@ -71,10 +114,17 @@ def register(req_body: RegisterSchema, db: Session = Depends(get_session)):
 
 
 @router.post("/login", status_code=status.HTTP_200_OK, response_model=LoginResponse)
-async def login(req_body: LoginSchema, db: Session = Depends(get_session)):
+async def login(
+    req_body: LoginSchema, request: Request, db: AsyncSession = Depends(get_session)
+):
     """Endpoint for user authentication and token generation"""
     # authenticate user credential
-    user = authenticate_user(db, req_body.email, req_body.password)
+    try:
+        user = await authenticate_user(
+            db, req_body.email, req_body.password, client=client_address(request)
+        )
+    except (HashingAdmissionError, HashingQueueFullError) as exc:
+        raise hashing_rejected(exc)
     # if credential does not match
     if not user:
         raise HTTPException(
@@ -84,7 +134,7 @@ async def login(req_body: LoginSchema, db: Session = Depends(get_session)):
     # generate access token for session
     access_token_expires = timedelta(days=settings.ACCESS_TOKEN_EXPIRE)
     access_token = create_access_token(
-        data={"sub": str(user.id)}, expires_delta=access_token_expires
+        data=token_claims(user), expires_delta=access_token_expires
     )
     # return response
     return {
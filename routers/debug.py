@@ -0,0 +1,60 @@
+# Copyright (c) 2024-2025 LinguaScreen, Inc.
+#
+# This file is part of LinguaScreen Server
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+from typing import Optional
+
+from fastapi import APIRouter, Depends, Header, HTTPException, status
+from fastapi.responses import PlainTextResponse
+
+from config import settings
+from telemetry.profiler import is_profiler_token, list_profiles, profile_path
+
+
+def require_profiler_token(
+    token: Optional[str] = Header(default=None, alias=settings.PROFILER_HEADER),
+):
+    """Dependency restricting access to holders of the profiler token"""
+    if not is_profiler_token(token):
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Forbidden")
+
+
+router = APIRouter(
+    prefix="/debug",
+    tags=["debug"],
+    include_in_schema=False,
+    dependencies=[Depends(require_profiler_token)],
+)
+
+
+@router.get("/profiles", status_code=status.HTTP_200_OK)
+def get_profiles():
+    """List stored request profiles"""
+    return {"message": "successful profiles retrieval", "result": list_profiles()}
+
+
+@router.get("/profiles/{profile_id}", response_class=PlainTextResponse)
+def download_profile(profile_id: str):
+    """Download a profile in collapsed stack format"""
+    path = profile_path(profile_id)
+    if path is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Profile not found")
+    with open(path) as file:
+        content = file.read()
+    return PlainTextResponse(
+        content=content,
+        headers={"Content-Disposition": f'attachment; filename="{profile_id}.folded"'},
+    )
@@ -16,16 +16,22 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
 from typing import List, Optional
+import asyncio
 import random
+import uuid
 
-from fastapi import APIRouter, Depends, status, Form, UploadFile, File, HTTPException
-from fastapi.responses import JSONResponse
-from pydantic import BaseModel
-from sqlmodel import Session, select
-from sqlalchemy import func
+from fastapi import APIRouter, Depends, status, Form, UploadFile, File, HTTPException, Query, Request, Response
+from fastapi.concurrency import run_in_threadpool
+from pydantic import BaseModel, Field
+from sqlmodel.ext.asyncio.session import AsyncSession
 
-from db import get_session
+from config import settings
+from db import get_session, get_write_session
 
+from core.dictionary import ExplainedSentence, save_sentences
+from core.jobs import JOB_SAVE, enqueue_job, job_notifier
+from core.responses import FastJSONResponse, model_response
+from core.quiz import generate_quiz_batch, invalidate_quiz_cache, pick_quiz_sentence
 from core.translation import translation_service, TranslationResponse
 from core.ocr import raw_ocr_service, ocr_service, ImageOcrResponse
 from core.llm import (
@@ -37,14 +43,32 @@ from core.llm import (
     OcrData
 )
 
-from models.sentences import Sentences, TranslationReqBody
-from models.words import Words
+from models.jobs import JOB_QUEUED, JobAcceptedResponse
+from models.sentences import TranslationReqBody
 from models.user import User
 
+from security.idempotency import IdempotencyClaim, client_idempotency, user_idempotency
 from security.jwt import get_current_user
+from security.ratelimit import (
+    charge_llm_tokens,
+    client_llm_quota,
+    client_rate_limit,
+    take_user_requests,
+    user_llm_quota,
+    user_rate_limit,
+)
 
 router = APIRouter(prefix="/ai", tags=["AI"])
 
+# request buckets of the routes calling Azure services, and of the others
+client_ai_limit = client_rate_limit(
+    settings.RATE_LIMIT_AI_PER_MINUTE, settings.RATE_LIMIT_AI_BURST
+)
+user_ai_limit = user_rate_limit(
+    settings.RATE_LIMIT_AI_PER_MINUTE, settings.RATE_LIMIT_AI_BURST
+)
+user_limit = user_rate_limit(settings.RATE_LIMIT_PER_MINUTE, settings.RATE_LIMIT_BURST)
+
 
 class TranslateResponseModel(BaseModel):
     """Response model for translation API"""
@@ -63,7 +87,10 @@ class TranslateResponseModel(BaseModel):
 
 
 @router.post(
-    "/translate", status_code=status.HTTP_200_OK, response_model=TranslateResponseModel
+    "/translate",
+    status_code=status.HTTP_200_OK,
+    response_model=TranslateResponseModel,
+    dependencies=[Depends(client_ai_limit)],
 )
 async def translate(req_body: TranslationReqBody):
     """API for text translation only"""
@@ -72,7 +99,7 @@ async def translate(req_body: TranslationReqBody):
         req_body.to_language, req_body.sentences
     )
     # return response
-    return JSONResponse(
+    return FastJSONResponse(
         content={
             "message": "successful text translation",
             "result": {
@@ -87,7 +114,9 @@ async def translate(req_body: TranslationReqBody):
     )
 
 
-@router.post("/ocr", status_code=status.HTTP_200_OK)
+@router.post(
+    "/ocr", status_code=status.HTTP_200_OK, dependencies=[Depends(client_ai_limit)]
+)
 async def ocr(image: UploadFile = File(...)):
     """API for image analysis only"""
     # read image content
@@ -110,18 +139,29 @@ class OcrSelectionPostprocessResponse(BaseModel):
     message: str
     result: str
     
-@router.post("/ocr/selection/postprocess", status_code=status.HTTP_200_OK, response_model=OcrSelectionPostprocessResponse)
+@router.post(
+    "/ocr/selection/postprocess",
+    status_code=status.HTTP_200_OK,
+    response_model=OcrSelectionPostprocessResponse,
+    dependencies=[Depends(client_ai_limit)],
+)
 async def ocr_selection_postprocess(
     req_body: OcrSelectionPostprocessRequestBody,
+    idempotency: Optional[IdempotencyClaim] = Depends(client_idempotency),
+    quota: str = Depends(client_llm_quota),
 ):
     """API for OCR selection postprocess"""
-    text = llm_ocr_selection_postprocessing_service(
+    result = llm_ocr_selection_postprocessing_service(
         ocr_data=req_body.ocr_data,
     )
-    return {
+    await charge_llm_tokens(quota, result.prompt_tokens, result.completion_tokens)
+    response = {
         "message": "successful OCR selection postprocess",
-        "result": text,
+        "result": result.text,
     }
+    if idempotency is not None:
+        await idempotency.complete(response)
+    return response
 
 class ExplainRequestBody(BaseModel):
     """Request body for LLM explanation"""
@@ -140,9 +180,16 @@ class ExplainResponseModel(BaseModel):
 
 
 @router.post(
-    "/explain", status_code=status.HTTP_200_OK, response_model=ExplainResponseModel
+    "/explain",
+    status_code=status.HTTP_200_OK,
+    response_model=ExplainResponseModel,
+    dependencies=[Depends(client_ai_limit)],
 )
-async def explain(req_body: ExplainRequestBody):
+async def explain(
+    req_body: ExplainRequestBody,
+    idempotency: Optional[IdempotencyClaim] = Depends(client_idempotency),
+    quota: str = Depends(client_llm_quota),
+):
     """API for LLM explanation"""
     result = llm_explaination_service(
         req_body.original_sentence,
@@ -150,17 +197,12 @@ async def explain(req_body: ExplainRequestBody):
         req_body.original_lang,
         req_body.target_lang,
     )
-    return {
-        "message": "successful LLM explanation",
-        "result": {
-            "words_explanation": result.words_explanation,
-            "entire_explanation": result.entire_explanation,
-            "original_sentence": result.original_sentence,
-            "translated_sentence": result.translated_sentence,
-            "prompt_tokens": result.prompt_tokens,
-            "completion_tokens": result.completion_tokens,
-        },
-    }
+    await charge_llm_tokens(quota, result.prompt_tokens, result.completion_tokens)
+    # the result is an LLMResponse already, it is serialized once without revalidation
+    response = ExplainResponseModel(message="successful LLM explanation", result=result)
+    if idempotency is not None:
+        await idempotency.complete(response)
+    return model_response(response)
 
 
 class LLMExplanationResponse(BaseModel):
@@ -198,53 +240,112 @@ class LLMExplanationResponse(BaseModel):
     result: ResultModel
 
 
-class WordSavingResponse(BaseModel):
-    """Response model for Word Saving /save"""
-    message: str = "successfully saved to dictionary"
-
-@router.post("/save", status_code=status.HTTP_200_OK, response_model=WordSavingResponse)
+@router.post(
+    "/save",
+    status_code=status.HTTP_202_ACCEPTED,
+    response_model=JobAcceptedResponse,
+    dependencies=[Depends(user_ai_limit), Depends(user_llm_quota)],
+)
 async def explain_and_save(
     req_body: ExplainRequestBody,
-    db: Session = Depends(get_session),
+    response: Response,
+    idempotency: Optional[IdempotencyClaim] = Depends(user_idempotency),
+    db: AsyncSession = Depends(get_write_session),
     user: User = Depends(get_current_user),
 ):
-    """API for LLM explanation and save"""
-    result = llm_explaination_service(
-        req_body.original_sentence,
-        req_body.translated_sentence,
-        req_body.original_lang,
-        req_body.target_lang,
-    )
-    # save to db
-    sentence: Sentences = Sentences(
-        original=req_body.original_sentence,
-        original_lang=req_body.original_lang,
-        translation=req_body.translated_sentence,
-        translation_lang=req_body.target_lang,
-        explanation=result.entire_explanation,
-        user_id=user.id,
-    )
-    # query
-    db.add(sentence)
-    db.commit()
-    db.refresh(sentence)
-    # save words
-    words: List[Words] = [
-        Words(
-            original_word=word_explanation.original_word,
-            translated_word=word_explanation.translated_word,
-            explanation=word_explanation.explanation,
-            romanization=word_explanation.romanization,
-            sentences_id=sentence.id,
+    """API queueing an LLM explanation and save, follow it on /jobs/{job_id}"""
+    job_id = await enqueue_job(db, user.id, JOB_SAVE, req_body.model_dump())
+    body = {
+        "message": "explanation and save queued",
+        "result": {"job_id": job_id, "status": JOB_QUEUED},
+    }
+    headers = {"Location": f"/jobs/{job_id}"}
+    # stored with the job, a retry never queues it twice
+    if idempotency is not None:
+        await idempotency.complete(
+            body, db, status_code=status.HTTP_202_ACCEPTED, headers=headers
         )
-        for word_explanation in result.words_explanation
-    ]
-    # bulk insert
-    db.add_all(words)
-    # commit changes
-    db.commit()
+    await db.commit()
+    job_notifier.notify_queued()
+    response.headers.update(headers)
     # return response
-    return {"message": "successfully saved to dictionary"}
+    return body
+
+
+class BatchSaveRequestBody(BaseModel):
+    """Request body for saving many sentences at once"""
+
+    sentences: List[ExplainRequestBody] = Field(min_length=1, max_length=20)
+
+
+class BatchSaveResponse(BaseModel):
+    """Response model for batch saving /save/batch"""
+
+    message: str
+    result: List[int]
+
+
+@router.post(
+    "/save/batch",
+    status_code=status.HTTP_200_OK,
+    response_model=BatchSaveResponse,
+)
+async def explain_and_save_batch(
+    request: Request,
+    req_body: BatchSaveRequestBody,
+    idempotency: Optional[IdempotencyClaim] = Depends(user_idempotency),
+    db: AsyncSession = Depends(get_write_session),
+    user: User = Depends(get_current_user),
+    quota: str = Depends(user_llm_quota),
+):
+    """API for LLM explanation and save of many sentences in one transaction"""
+    # every sentence is an LLM call, each one counts against the AI limit
+    await take_user_requests(
+        request,
+        user,
+        settings.RATE_LIMIT_AI_PER_MINUTE,
+        settings.RATE_LIMIT_AI_BURST,
+        cost=len(req_body.sentences),
+    )
+    # explanations run concurrently in the threadpool
+    results = await asyncio.gather(
+        *[
+            run_in_threadpool(
+                llm_explaination_service,
+                item.original_sentence,
+                item.translated_sentence,
+                item.original_lang,
+                item.target_lang,
+            )
+            for item in req_body.sentences
+        ]
+    )
+    await charge_llm_tokens(
+        quota,
+        sum(result.prompt_tokens for result in results),
+        sum(result.completion_tokens for result in results),
+    )
+    sentence_ids = await save_sentences(
+        db,
+        user.id,
+        [
+            ExplainedSentence(
+                original=item.original_sentence,
+                original_lang=item.original_lang,
+                translation=item.translated_sentence,
+                translation_lang=item.target_lang,
+                explanation=result.entire_explanation,
+                result=result,
+            )
+            for item, result in zip(req_body.sentences, results)
+        ],
+    )
+    response = {"message": "successfully saved to dictionary", "result": sentence_ids}
+    if idempotency is not None:
+        await idempotency.complete(response, db)
+    await db.commit()
+    invalidate_quiz_cache(user.id)
+    return response
 
 
 # Alternative simpler response format if you prefer
@@ -265,39 +366,28 @@ class SimpleQuizResponse(BaseModel):
     correct_answer_index: int
 
 
-@router.get("/quiz", status_code=status.HTTP_200_OK, response_model=SimpleQuizResponse)
+@router.get(
+    "/quiz",
+    status_code=status.HTTP_200_OK,
+    response_model=SimpleQuizResponse,
+    dependencies=[Depends(user_limit)],
+)
 async def get_simple_randomized_quiz(
-    db: Session = Depends(get_session),
+    db: AsyncSession = Depends(get_session),
     user: User = Depends(get_current_user),
 ):
     """Generate a simpler quiz format - guess the meaning of one word from 5 options"""
 
-    # Get sentences with at least 5 words
-    sentences_with_enough_words = (
-        db.query(Sentences)
-        .join(Words)
-        .filter(Sentences.user_id == user.id)
-        .group_by(Sentences.id)
-        .having(func.count(Words.id) >= 5)
-        .all()
-    )
+    # Pick a sentence with at least 5 words and 5 of its words
+    picked = await pick_quiz_sentence(db, user.id)
 
-    if not sentences_with_enough_words:
+    if picked is None:
         raise HTTPException(
             status_code=404,
             detail="You need to learn more words in one sentence",
         )
 
-    # Select random sentence
-    selected_sentence = random.choice(sentences_with_enough_words)
-
-    # Get words from the sentence
-    sentence_words = (
-        db.query(Words).filter(Words.sentences_id == selected_sentence.id).all()
-    )
-
-    # Select 5 random words
-    selected_words = random.sample(sentence_words, 5)
+    selected_sentence, selected_words = picked
 
     # Pick one word to be the question
     question_word_data = random.choice(selected_words)
@@ -328,3 +418,61 @@ async def get_simple_randomized_quiz(
         options=quiz_options,
         correct_answer_index=new_correct_index,
     )
+
+
+class BatchQuizResponse(BaseModel):
+    """Response model for a batch of quizzes of one study session"""
+
+    session_id: str
+    quizzes: List[SimpleQuizResponse]
+
+
+@router.get(
+    "/quiz/batch",
+    status_code=status.HTTP_200_OK,
+    response_model=BatchQuizResponse,
+    dependencies=[Depends(user_limit)],
+)
+async def get_quiz_batch(
+    count: int = Query(default=20, ge=1, le=100),
+    session_id: Optional[str] = Query(default=None, max_length=64),
+    db: AsyncSession = Depends(get_session),
+    user: User = Depends(get_current_user),
+):
+    """Generate a batch of quizzes for a study session
+
+    Options are drawn from words of any saved sentence in the same language
+    pair, and a question word is not asked twice within the same session.
+    """
+    session_id = session_id or uuid.uuid4().hex
+    quizzes = await generate_quiz_batch(db, user.id, count, session_id)
+
+    if not quizzes:
+        raise HTTPException(
+            status_code=404,
+            detail="You need to learn more words to start a study session",
+        )
+
+    return BatchQuizResponse(
+        session_id=session_id,
+        quizzes=[
+            SimpleQuizResponse(
+                sentence_id=quiz.question.sentences_id,
+                original_sentence=quiz.question.original,
+                translation=quiz.question.translation,
+                question_word=quiz.question.original_word,
+                options=[
+                    SimpleQuizWord(
+                        original_word=word.original_word,
+                        translated_word=word.translated_word,
+                        explanation=word.explanation,
+                        romanization=word.romanization,
+                        is_correct_for_question=quiz.question.original_word,
+                    )
+                    for word in quiz.options
+                ],
+                correct_answer_index=quiz.correct_answer_index,
+            )
+            for quiz in quizzes
+        ],
+    )
@@ -0,0 +1,118 @@
+# Copyright (c) 2024-2025 LinguaScreen, Inc.
+#
+# This file is part of LinguaScreen Server
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import json
+import time
+from typing import Any, AsyncIterator, Dict, Optional
+
+from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import StreamingResponse
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from config import settings
+from db import async_session_factory, get_session
+
+from core.jobs import job_notifier
+from models.jobs import JOB_DONE, JOB_FAILED, Job, JobStatusResponse
+from models.user import User
+
+from security.jwt import get_current_user
+from security.ratelimit import user_rate_limit
+
+router = APIRouter(
+    prefix="/jobs",
+    tags=["jobs"],
+    dependencies=[
+        Depends(user_rate_limit(settings.RATE_LIMIT_PER_MINUTE, settings.RATE_LIMIT_BURST))
+    ],
+)
+
+
+def _job_status(job: Job) -> Dict[str, Any]:
+    return {
+        "id": job.id,
+        "kind": job.kind,
+        "status": job.status,
+        "attempts": job.attempts,
+        "result": json.loads(job.result) if job.result else None,
+        "error": job.error,
+        "created_at": job.created_at,
+        "updated_at": job.updated_at,
+    }
+
+
+async def _get_job(db: AsyncSession, user_id: int, job_id: int) -> Optional[Job]:
+    return (
+        await db.exec(select(Job).where(Job.id == job_id, Job.user_id == user_id))
+    ).first()
+
+
+@router.get("/{id}", status_code=status.HTTP_200_OK, response_model=JobStatusResponse)
+async def get_job(
+    id: int,
+    db: AsyncSession = Depends(get_session),
+    user: User = Depends(get_current_user),
+):
+    """Get the state of a background job of the user"""
+    job = await _get_job(db, user.id, id)
+    if job is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Job not found")
+    # return response
+    return {"message": "successful job retrieval", "result": _job_status(job)}
+
+
+async def _job_events(user_id: int, job_id: int) -> AsyncIterator[str]:
+    # the request session is closed before streaming starts, open our own
+    last = None
+    sent_at = time.monotonic()
+    while True:
+        async with async_session_factory() as db:
+            job = await _get_job(db, user_id, job_id)
+        if job is None:
+            return
+        current = (job.status, job.attempts)
+        if current != last:
+            last = current
+            sent_at = time.monotonic()
+            data = json.dumps(jsonable_encoder(_job_status(job)), ensure_ascii=False)
+            yield f"event: status\ndata: {data}\n\n"
+            if job.status in (JOB_DONE, JOB_FAILED):
+                return
+        elif time.monotonic() - sent_at >= settings.JOB_EVENTS_KEEPALIVE:
+            sent_at = time.monotonic()
+            yield ": keepalive\n\n"
+        # woken right away by workers of this process, others are polled
+        await job_notifier.wait_job(job_id, settings.JOB_POLL_INTERVAL)
+
+
+@router.get("/{id}/events", status_code=status.HTTP_200_OK)
+async def get_job_events(
+    id: int,
+    db: AsyncSession = Depends(get_session),
+    user: User = Depends(get_current_user),
+):
+    """Server-sent events with the state of a job, until it is done or failed"""
+    if await _get_job(db, user.id, id) is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Job not found")
+    await db.close()
+    return StreamingResponse(
+        _job_events(user.id, id),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
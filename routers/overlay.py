@@ -0,0 +1,312 @@
+# Copyright (c) 2024-2025 LinguaScreen, Inc.
+#
+# This file is part of LinguaScreen Server
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import asyncio
+import base64
+import binascii
+import hashlib
+import json
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Literal, Optional, Set, Tuple
+
+from azure.core.exceptions import HttpResponseError
+from fastapi import APIRouter, HTTPException, WebSocket, WebSocketDisconnect, status
+from fastapi.concurrency import run_in_threadpool
+from fastapi.encoders import jsonable_encoder
+from fastapi.security import HTTPAuthorizationCredentials
+from pydantic import BaseModel, Field, ValidationError
+
+from config import settings
+
+from core.llm import llm_explaination_service, llm_ocr_selection_postprocessing_service
+from core.ocr import raw_ocr_service
+from core.translation import translation_service
+from models.sentences import TranslationReqBody
+from models.user import User
+
+from routers.gateway import ExplainRequestBody, OcrSelectionPostprocessRequestBody
+from security.jwt import get_current_user, token_expiry
+from security.ratelimit import charge_llm_tokens, take_request, user_llm_quota
+from telemetry.log import get_logger
+from telemetry.usage import attribute_usage, record_usage
+
+logger = get_logger("overlay")
+
+router = APIRouter(tags=["overlay"])
+
+OVERLAY_PATH = "/ws/overlay"
+
+
+class OverlayMessage(BaseModel):
+    """Request multiplexed over the overlay socket, answered under the same id"""
+
+    id: str = Field(min_length=1, max_length=64)
+    type: Literal["ocr", "postprocess", "translate", "explain"]
+    payload: Dict[str, Any] = Field(default_factory=dict)
+
+
+class OcrFrame(BaseModel):
+    """Payload of an OCR request"""
+
+    # base64 encoded image
+    image: str
+
+
+class OverlaySession:
+    """State of one authenticated overlay connection"""
+
+    def __init__(self, websocket: WebSocket, user: User, expires_at: float):
+        self.websocket = websocket
+        self.user = user
+        self.expires_at = expires_at
+        self.caller = f"user:{user.id}"
+        # cache key of the last OCR frame
+        self.previous_frame: Optional[Tuple[str, str]] = None
+        # recent results, or the tasks still computing them
+        self.cache: "OrderedDict[Tuple[str, str], asyncio.Future]" = OrderedDict()
+        self.slots = asyncio.Semaphore(settings.OVERLAY_MAX_IN_FLIGHT)
+        self.tasks: Set[asyncio.Task] = set()
+        self._send_lock = asyncio.Lock()
+
+    async def send(self, message: Dict[str, Any]):
+        # tasks finish in any order, frames must not interleave
+        async with self._send_lock:
+            await self.websocket.send_text(
+                json.dumps(jsonable_encoder(message), ensure_ascii=False)
+            )
+
+    def spawn(self, raw: str):
+        """Serve a message in its own task, its slot is released when done"""
+        task = asyncio.create_task(self.serve(raw))
+        self.tasks.add(task)
+        task.add_done_callback(self._done)
+
+    def _done(self, task: asyncio.Task):
+        self.tasks.discard(task)
+        self.slots.release()
+
+    def close(self):
+        for task in self.tasks:
+            task.cancel()
+
+    async def serve(self, raw: str):
+        reply = await self.answer(raw)
+        try:
+            await self.send(reply)
+        except (WebSocketDisconnect, RuntimeError):
+            # the connection went away while the result was on its way
+            pass
+
+    async def answer(self, raw: str) -> Dict[str, Any]:
+        """Result or error message answering a raw request"""
+        request_id = None
+        try:
+            message = OverlayMessage.model_validate_json(raw)
+            request_id = message.id
+            attribute_usage(f"{OVERLAY_PATH}:{message.type}", self.user.id)
+            if time.time() >= self.expires_at:
+                raise HTTPException(
+                    status_code=status.HTTP_401_UNAUTHORIZED,
+                    detail="Token expired, reconnect with a new one",
+                )
+            result, cached, unchanged = await self.resolve(message)
+            return {
+                "id": request_id,
+                "type": "result",
+                "cached": cached,
+                "unchanged": unchanged,
+                "result": result,
+            }
+        except ValidationError as exception:
+            status_code = status.HTTP_422_UNPROCESSABLE_ENTITY
+            detail = exception.errors(include_url=False, include_context=False)
+        except HTTPException as exception:
+            status_code, detail = exception.status_code, exception.detail
+        except HttpResponseError as exception:
+            status_code = status.HTTP_502_BAD_GATEWAY
+            detail = f"External service error: {exception.message}"
+        except Exception as exception:
+            logger.error("overlay request failed", extra={"error": str(exception)})
+            status_code = status.HTTP_500_INTERNAL_SERVER_ERROR
+            detail = "Internal server error"
+        return {"id": request_id, "type": "error", "status": status_code, "detail": detail}
+
+    async def call(
+        self,
+        kind: str,
+        handler: Callable[["OverlaySession", Any], Awaitable[Any]],
+        payload: Any,
+    ) -> Any:
+        # only requests reaching upstream services count against the limit
+        await take_request(
+            f"{OVERLAY_PATH}:{kind}",
+            self.caller,
+            settings.RATE_LIMIT_AI_PER_MINUTE,
+            settings.RATE_LIMIT_AI_BURST,
+        )
+        return await handler(self, payload)
+
+    async def resolve(self, message: OverlayMessage) -> Tuple[Any, bool, bool]:
+        """Result of a message, from the session cache when it was seen recently"""
+        handler, payload_model = HANDLERS[message.type]
+        payload = payload_model.model_validate(message.payload)
+        digest = hashlib.sha256(
+            json.dumps(message.payload, sort_keys=True, ensure_ascii=False).encode()
+        ).hexdigest()
+        key = (message.type, digest)
+        unchanged = False
+        if message.type == "ocr":
+            unchanged = key == self.previous_frame
+            self.previous_frame = key
+        future = self.cache.get(key)
+        if future is not None:
+            # a repeat, or a duplicate of a request still in flight
+            self.cache.move_to_end(key)
+            record_usage(calls=0, cache_hits=1)
+            return await future, True, unchanged
+        # cached before anything is awaited, so duplicates in flight find it
+        future = asyncio.ensure_future(self.call(message.type, handler, payload))
+        self.cache[key] = future
+        while len(self.cache) > settings.OVERLAY_CACHE_SIZE:
+            self.cache.popitem(last=False)
+        try:
+            return await future, False, unchanged
+        except BaseException:
+            # failures are not cached, the next attempt calls upstream again
+            if self.cache.get(key) is future:
+                del self.cache[key]
+            raise
+
+
+async def _ocr(session: OverlaySession, payload: OcrFrame) -> Any:
+    try:
+        image = base64.b64decode(payload.image, validate=True)
+    except (binascii.Error, ValueError):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST, detail="Image is not valid base64"
+        )
+    return jsonable_encoder(await run_in_threadpool(raw_ocr_service, image))
+
+
+async def _postprocess(
+    session: OverlaySession, payload: OcrSelectionPostprocessRequestBody
+) -> Any:
+    quota = await user_llm_quota(session.user)
+    result = await run_in_threadpool(
+        llm_ocr_selection_postprocessing_service, payload.ocr_data
+    )
+    await charge_llm_tokens(quota, result.prompt_tokens, result.completion_tokens)
+    return result.text
+
+
+async def _translate(session: OverlaySession, payload: TranslationReqBody) -> Any:
+    translation = await run_in_threadpool(
+        translation_service, payload.to_language, payload.sentences
+    )
+    return {
+        "raw": translation.input_text,
+        "result": translation.translation,
+        "from_language": translation.detected_language,
+        "to_language": payload.to_language,
+        "score": translation.score,
+    }
+
+
+async def _explain(session: OverlaySession, payload: ExplainRequestBody) -> Any:
+    quota = await user_llm_quota(session.user)
+    result = await run_in_threadpool(
+        llm_explaination_service,
+        payload.original_sentence,
+        payload.translated_sentence,
+        payload.original_lang,
+        payload.target_lang,
+    )
+    await charge_llm_tokens(quota, result.prompt_tokens, result.completion_tokens)
+    return result.model_dump(mode="json")
+
+
+# handler and payload model of every message type
+HANDLERS: Dict[str, Tuple[Callable[[OverlaySession, Any], Awaitable[Any]], type]] = {
+    "ocr": (_ocr, OcrFrame),
+    "postprocess": (_postprocess, OcrSelectionPostprocessRequestBody),
+    "translate": (_translate, TranslationReqBody),
+    "explain": (_explain, ExplainRequestBody),
+}
+
+
+async def _authenticate(websocket: WebSocket) -> Optional[OverlaySession]:
+    # the first message carries the token, browsers cannot set headers here
+    try:
+        message = await asyncio.wait_for(
+            websocket.receive_json(), settings.OVERLAY_AUTH_TIMEOUT
+        )
+        if message.get("type") != "auth":
+            raise ValueError("auth message expected")
+        token = message["token"]
+        user = await get_current_user(
+            HTTPAuthorizationCredentials(scheme="Bearer", credentials=token)
+        )
+    except WebSocketDisconnect:
+        return None
+    except (asyncio.TimeoutError, HTTPException, AttributeError, KeyError, TypeError, ValueError):
+        await websocket.close(
+            code=status.WS_1008_POLICY_VIOLATION, reason="Authentication failed"
+        )
+        return None
+    session = OverlaySession(websocket, user, token_expiry(token))
+    await session.send({"type": "ready", "user_id": user.id})
+    return session
+
+
+@router.websocket(OVERLAY_PATH)
+async def overlay(websocket: WebSocket):
+    """Reading overlay session
+
+    The client authenticates once with {"type": "auth", "token": ...}, then
+    sends {"id", "type", "payload"} messages of type ocr, postprocess,
+    translate or explain. Results are pushed as they complete, tagged with
+    the request id, repeated requests are answered from a per-session cache.
+    """
+    await websocket.accept()
+    session = await _authenticate(websocket)
+    if session is None:
+        return
+    try:
+        while True:
+            # at most OVERLAY_MAX_IN_FLIGHT requests, then the client is not read
+            await session.slots.acquire()
+            message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                session.slots.release()
+                break
+            if message.get("text") is None:
+                session.slots.release()
+                await session.send(
+                    {
+                        "id": None,
+                        "type": "error",
+                        "status": status.HTTP_400_BAD_REQUEST,
+                        "detail": "Only text frames are accepted",
+                    }
+                )
+                continue
+            session.spawn(message["text"])
+    except WebSocketDisconnect:
+        pass
+    finally:
+        session.close()
@@ -0,0 +1,98 @@
+# Copyright (c) 2024-2025 LinguaScreen, Inc.
+#
+# This file is part of LinguaScreen Server
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+from datetime import datetime
+
+from fastapi import APIRouter, Depends, Query, status
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from config import settings
+from db import get_write_session
+
+from core.review import answer_reviews, next_reviews
+from models.reviews import (
+    ReviewAnswersRequestBody,
+    ReviewAnswersResponse,
+    ReviewNextResponse,
+)
+from models.user import User
+
+from security.jwt import get_current_user
+from security.ratelimit import user_rate_limit
+
+router = APIRouter(
+    prefix="/review",
+    tags=["review"],
+    dependencies=[
+        Depends(user_rate_limit(settings.RATE_LIMIT_PER_MINUTE, settings.RATE_LIMIT_BURST))
+    ],
+)
+
+
+@router.post("/next", status_code=status.HTTP_200_OK, response_model=ReviewNextResponse)
+async def get_next_reviews(
+    limit: int = Query(default=20, ge=1, le=100),
+    db: AsyncSession = Depends(get_write_session),
+    user: User = Depends(get_current_user),
+):
+    """Pop the most overdue saved words for review"""
+    rows = await next_reviews(db, user.id, limit, datetime.utcnow())
+    await db.commit()
+    # return response
+    return {
+        "message": "successful review retrieval",
+        "result": [
+            {
+                "word_id": row.id,
+                "sentences_id": row.sentences_id,
+                "original_word": row.original_word,
+                "translated_word": row.translated_word,
+                "explanation": row.explanation,
+                "romanization": row.romanization,
+                "due_at": row.due_at,
+                "repetitions": row.repetitions,
+            }
+            for row in rows
+        ],
+    }
+
+
+@router.post(
+    "/answers", status_code=status.HTTP_200_OK, response_model=ReviewAnswersResponse
+)
+async def post_review_answers(
+    req_body: ReviewAnswersRequestBody,
+    db: AsyncSession = Depends(get_write_session),
+    user: User = Depends(get_current_user),
+):
+    """Grade reviewed words and schedule their next review"""
+    grades = {answer.word_id: answer.grade for answer in req_body.answers}
+    schedules = await answer_reviews(db, user.id, grades, datetime.utcnow())
+    await db.commit()
+    # return response
+    return {
+        "message": "successful review answers",
+        "result": [
+            {
+                "word_id": word_id,
+                "due_at": schedule.due_at,
+                "interval_days": schedule.interval_days,
+                "repetitions": schedule.repetitions,
+            }
+            for word_id, schedule in schedules.items()
+        ],
+    }
@@ -15,58 +15,340 @@
 # You should have received a copy of the GNU Affero General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
-from fastapi import APIRouter, Depends, HTTPException, status
-from sqlmodel import Session, select
-from sqlalchemy.orm import selectinload
+import json
+import tempfile
+from typing import Optional
 
-from db import get_session
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, status
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import Response, StreamingResponse
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from config import settings
+from db import (
+    async_session_factory,
+    async_write_session_factory,
+    get_session,
+    get_write_session,
+)
 
 from models.user import User
-from models.sentences import Sentences, GetSentencesResponse
+from core.dictionary import delete_sentences, dictionary_version, naive_utc, save_sentences
+from core.responses import FastJSONResponse
+from core.lexicon import select_words
+from core.quiz import invalidate_quiz_cache
+from core.search import search_sentences
+from core.pagination import InvalidCursorError, decode_cursor, encode_cursor
+from core.transfer import (
+    EXPORT_FORMATS,
+    iter_dictionary,
+    read_records,
+    serialize_dictionary,
+    take,
+    to_explained,
+)
+
 from models.words import Words
+from models.sentences import (
+    Sentences,
+    SentencePreview,
+    GetSentencesResponse,
+    SearchSentencesResponse,
+    BulkDeleteRequestBody,
+    BulkDeleteResponse,
+)
 
 from security.jwt import get_current_user
+from security.ratelimit import user_rate_limit
+
+router = APIRouter(
+    prefix="/sentence",
+    tags=["saved sentences"],
+    dependencies=[
+        Depends(user_rate_limit(settings.RATE_LIMIT_PER_MINUTE, settings.RATE_LIMIT_BURST))
+    ],
+)
+
+# columns that can be requested through `fields`
+SENTENCE_FIELDS = list(SentencePreview.model_fields)
+
+
+async def _dictionary_etag(db: AsyncSession, user_id: int) -> str:
+    # read before the rows, so a concurrent change can only make the tag stale
+    version = await dictionary_version(db, user_id)
+    return f'W/"{user_id}-{version}"'
+
 
-router = APIRouter(prefix="/sentence", tags=["saved sentences"])
+def _not_modified(request: Request, etag: str) -> bool:
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    # weak comparison, W/ prefixes are ignored
+    tag = etag.removeprefix("W/")
+    return any(
+        candidate.strip().removeprefix("W/") == tag for candidate in header.split(",")
+    )
 
-@router.get("/", status_code=status.HTTP_200_OK, response_model=GetSentencesResponse)
-def get_sentences(
+
+def _cache_headers(etag: str) -> dict:
+    # clients keep the response but revalidate it on every use
+    return {"ETag": etag, "Cache-Control": "private, no-cache"}
+
+
+@router.get(
+    "/",
+    status_code=status.HTTP_200_OK,
+    response_model=GetSentencesResponse,
+    response_model_exclude_unset=True,
+)
+async def get_sentences(
+    request: Request,
     skip: int = 0,
     limit: int = 100,
-    db: Session = Depends(get_session),
+    cursor: Optional[str] = None,
+    fields: Optional[str] = None,
+    db: AsyncSession = Depends(get_session),
     user: User = Depends(get_current_user),
 ):
-    """Get all saved sentences based on the user session"""
+    """Get all saved sentences based on the user session
+
+    Pass `next_cursor` of the previous page as `cursor` to page by key instead
+    of `skip`, and a comma separated `fields` list to only select those columns.
+    Answers 304 when `If-None-Match` holds the ETag of the current dictionary.
+    """
+    etag = await _dictionary_etag(db, user.id)
+    if _not_modified(request, etag):
+        return Response(
+            status_code=status.HTTP_304_NOT_MODIFIED, headers=_cache_headers(etag)
+        )
+    # resolve projection, id is always selected to build the cursor
+    selected = SENTENCE_FIELDS
+    if fields:
+        requested = {field.strip() for field in fields.split(",") if field.strip()}
+        unknown = requested - set(SENTENCE_FIELDS)
+        if unknown:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"Unknown fields: {', '.join(sorted(unknown))}",
+            )
+        selected = [f for f in SENTENCE_FIELDS if f in requested or f == "id"]
+    # keyset on (user_id, id) when a cursor is given, offset otherwise
+    query = (
+        select(*[getattr(Sentences, field) for field in selected])
+        .where(Sentences.user_id == user.id)
+        .order_by(Sentences.id)
+        .limit(limit)
+    )
+    if cursor:
+        try:
+            after_id = int(decode_cursor(cursor)["id"])
+        except (InvalidCursorError, KeyError, TypeError, ValueError):
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid cursor"
+            )
+        query = query.where(Sentences.id > after_id)
+    else:
+        query = query.offset(skip)
     # get sentences
-    collections = db.exec(
-        select(Sentences).where(Sentences.user_id == user.id).offset(skip).limit(limit)
-    ).all()
+    rows = (await db.exec(query)).all()
+    if len(selected) == 1:
+        # a single column comes back as plain scalars
+        rows = [(row,) for row in rows]
+    collections = [dict(zip(selected, row)) for row in rows]
+    next_cursor = None
+    if collections and len(collections) == limit:
+        next_cursor = encode_cursor({"id": collections[-1]["id"]})
+    # rows hold plain column values and only the selected keys, they are
+    # rendered as they are instead of being validated against the model
+    return FastJSONResponse(
+        content={
+            "message": "successful sentences retrieval",
+            "result": collections,
+            "next_cursor": next_cursor,
+        },
+        headers=_cache_headers(etag),
+    )
+
+
+@router.get(
+    "/search", status_code=status.HTTP_200_OK, response_model=SearchSentencesResponse
+)
+async def search_saved_sentences(
+    q: str = Query(min_length=1, max_length=200),
+    limit: int = Query(default=20, ge=1, le=100),
+    cursor: Optional[str] = None,
+    db: AsyncSession = Depends(get_session),
+    user: User = Depends(get_current_user),
+):
+    """Search saved sentences and their words, best matches first
+
+    Pass `next_cursor` of the previous page as `cursor` to get the next one.
+    """
+    after = None
+    if cursor:
+        try:
+            position = decode_cursor(cursor)
+            after = (float(position["score"]), int(position["id"]))
+        except (InvalidCursorError, KeyError, TypeError, ValueError):
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid cursor"
+            )
+    # rank ids in the index, then load the page of sentences by primary key
+    ranked = await search_sentences(db, user.id, q, limit, after)
+    sentences = {}
+    if ranked:
+        sentences = {
+            sentence.id: sentence
+            for sentence in (
+                await db.exec(
+                    select(Sentences).where(
+                        Sentences.id.in_([sentence_id for sentence_id, _ in ranked]),
+                        Sentences.user_id == user.id,
+                    )
+                )
+            ).all()
+        }
+    result = [
+        {**sentences[sentence_id].model_dump(), "score": score}
+        for sentence_id, score in ranked
+        if sentence_id in sentences
+    ]
+    next_cursor = None
+    if len(ranked) == limit:
+        last_id, last_score = ranked[-1]
+        next_cursor = encode_cursor({"score": last_score, "id": last_id})
     # return response
     return {
-        "message": "successful sentences retrieval",
-        "result": collections,
+        "message": "successful sentences search",
+        "result": result,
+        "next_cursor": next_cursor,
     }
 
 
+@router.get("/export", status_code=status.HTTP_200_OK)
+async def export_saved_sentences(
+    fmt: str = Query(default="ndjson", alias="format", pattern="^(ndjson|csv|anki)$"),
+    user: User = Depends(get_current_user),
+):
+    """Stream every saved sentence with its words as NDJSON, CSV or Anki notes"""
+    media_type, extension = EXPORT_FORMATS[fmt]
+
+    async def body():
+        # the request session is closed before streaming starts, use a dedicated one
+        async with async_session_factory() as db:
+            records = iter_dictionary(db, user.id, settings.EXPORT_BATCH_SIZE)
+            async for chunk in serialize_dictionary(fmt, records):
+                yield chunk
+
+    return StreamingResponse(
+        body(),
+        media_type=media_type,
+        headers={
+            "content-disposition": f'attachment; filename="dictionary.{extension}"'
+        },
+    )
+
+
+@router.post("/import", status_code=status.HTTP_200_OK)
+async def import_saved_sentences(
+    request: Request,
+    fmt: str = Query(default="ndjson", alias="format", pattern="^(ndjson|csv)$"),
+    user: User = Depends(get_current_user),
+):
+    """Import sentences from a raw NDJSON or CSV request body
+
+    The body has the format of the matching export. Progress is streamed back
+    as NDJSON, one line per committed batch and a final summary.
+    """
+    # spool the upload to disk so memory does not grow with its size
+    upload = tempfile.TemporaryFile()
+    size = 0
+    async for chunk in request.stream():
+        size += len(chunk)
+        if size > settings.IMPORT_MAX_BYTES:
+            upload.close()
+            raise HTTPException(
+                status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                detail="Import is too large",
+            )
+        upload.write(chunk)
+    upload.seek(0)
+
+    async def progress():
+        imported, errors = 0, []
+        records = read_records(upload, fmt)
+        try:
+            while True:
+                # parsing reads the spooled file, keep it off the event loop
+                batch = await run_in_threadpool(take, records, settings.IMPORT_BATCH_SIZE)
+                if not batch:
+                    break
+                valid = []
+                for line, record in batch:
+                    if isinstance(record, str):
+                        errors.append({"line": line, "error": record})
+                    else:
+                        valid.append(to_explained(record))
+                # one transaction per batch, committed batches stay on failure
+                async with async_write_session_factory() as db:
+                    await save_sentences(db, user.id, valid)
+                    await db.commit()
+                invalidate_quiz_cache(user.id)
+                imported += len(valid)
+                yield json.dumps(
+                    {"imported": imported, "failed": len(errors), "line": batch[-1][0]}
+                ) + "\n"
+        except UnicodeDecodeError:
+            errors.append({"line": None, "error": "Import is not valid UTF-8"})
+        finally:
+            upload.close()
+        yield json.dumps(
+            {
+                "done": True,
+                "imported": imported,
+                "failed": len(errors),
+                # the first errors are enough to fix the file
+                "errors": errors[:100],
+            }
+        ) + "\n"
+
+    return StreamingResponse(progress(), media_type="application/x-ndjson")
+
+
 # NOTE: currently each word is only shown by fetching sentence by id for performance reason.
 @router.get("/{id}", status_code=status.HTTP_200_OK)
-def get_sentence_by_id(
+async def get_sentence_by_id(
     id: int,
-    db: Session = Depends(get_session),
+    request: Request,
+    db: AsyncSession = Depends(get_session),
     user: User = Depends(get_current_user),
 ):
-    """Get a specific sentence by ID"""
+    """Get a specific sentence by ID, 304 when `If-None-Match` is current"""
+    etag = await _dictionary_etag(db, user.id)
+    if _not_modified(request, etag):
+        return Response(
+            status_code=status.HTTP_304_NOT_MODIFIED, headers=_cache_headers(etag)
+        )
     # get sentence by id
-    sentence = db.exec(
-        select(Sentences)
-        .options(selectinload(Sentences.words))
-        .where(Sentences.id == id, Sentences.user_id == user.id)
+    sentence = (
+        await db.exec(
+            select(Sentences).where(Sentences.id == id, Sentences.user_id == user.id)
+        )
     ).first()
     # check if exist
     if not sentence:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND, detail="Sentence not found"
         )
+    # get words with their lexicon entry and gloss
+    words = (
+        await db.exec(
+            select_words().where(Words.sentences_id == sentence.id).order_by(Words.id)
+        )
+    ).all()
     # structure response
     result = {
         "id": sentence.id,
@@ -85,43 +367,70 @@ def get_sentence_by_id(
                 "romanization": word.romanization,
                 "sentences_id": word.sentences_id,
             }
-            for word in sentence.words
+            for word in words
         ],
     }
     # return response
-    return {
-        "message": "successful sentence retrieval",
-        "result": result,
-    }
+    return FastJSONResponse(
+        content={
+            "message": "successful sentence retrieval",
+            "result": result,
+        },
+        headers=_cache_headers(etag),
+    )
 
 
 @router.delete("/{id}", status_code=status.HTTP_204_NO_CONTENT)
-def delete_sentence(
+async def delete_sentence(
     id: int,
-    db: Session = Depends(get_session),
+    db: AsyncSession = Depends(get_write_session),
     current_user: User = Depends(get_current_user),
 ):
     """Delete words by ID"""
-    # get sentence by id
-    sentence = db.exec(
-        select(Sentences).where(
-            Sentences.id == id, Sentences.user_id == current_user.id
-        )
-    ).first()
+    # delete sentence, its words go through ON DELETE CASCADE
+    deleted = await delete_sentences(db, current_user.id, Sentences.id == id)
     # check if exist
-    if not sentence:
+    if not deleted:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND, detail="Sentences not found"
         )
-    # select all related words
-    words_to_delete = db.exec(
-        select(Words).where(Words.sentences_id == sentence.id)
-    ).all()
-    # delete the words
-    for word in words_to_delete:
-        db.delete(word)
-    # delete sentence
-    db.delete(sentence)
-    db.commit()
+    await db.commit()
+    invalidate_quiz_cache(current_user.id)
     # return nothing
     return None
+
+
+@router.post(
+    "/bulk-delete", status_code=status.HTTP_200_OK, response_model=BulkDeleteResponse
+)
+async def bulk_delete_sentences(
+    req_body: BulkDeleteRequestBody,
+    db: AsyncSession = Depends(get_write_session),
+    current_user: User = Depends(get_current_user),
+):
+    """Delete every sentence of the user matching the given criteria in one statement"""
+    # build criteria, ownership is always enforced by delete_sentences
+    criteria = []
+    if req_body.ids is not None:
+        criteria.append(Sentences.id.in_(req_body.ids))
+    if req_body.original_lang is not None:
+        criteria.append(Sentences.original_lang == req_body.original_lang)
+    if req_body.translation_lang is not None:
+        criteria.append(Sentences.translation_lang == req_body.translation_lang)
+    if req_body.created_before is not None:
+        criteria.append(Sentences.created_at < naive_utc(req_body.created_before))
+    if req_body.created_after is not None:
+        criteria.append(Sentences.created_at > naive_utc(req_body.created_after))
+    # refuse to wipe the whole dictionary by accident
+    if not criteria:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="At least one deletion criterion is required",
+        )
+    deleted = await delete_sentences(db, current_user.id, *criteria)
+    await db.commit()
+    invalidate_quiz_cache(current_user.id)
+    return {
+        "message": "successful sentences deletion",
+        "result": {"deleted": deleted},
+    }
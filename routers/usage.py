@@ -0,0 +1,118 @@
+# Copyright (c) 2024-2025 LinguaScreen, Inc.
+#
+# This file is part of LinguaScreen Server
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+from datetime import date, datetime, timedelta
+from typing import Any, Dict
+
+from fastapi import APIRouter, Depends, Query, status
+from sqlalchemy import func
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from config import settings
+from db import get_session
+
+from models.usage import DailyUsageResponse, UsageDaily, UsageSummaryResponse
+from models.user import User
+
+from security.jwt import get_current_user
+from security.ratelimit import user_rate_limit
+from telemetry.usage import USAGE_COUNTERS
+
+router = APIRouter(
+    prefix="/usage",
+    tags=["usage"],
+    dependencies=[
+        Depends(user_rate_limit(settings.RATE_LIMIT_PER_MINUTE, settings.RATE_LIMIT_BURST))
+    ],
+)
+
+# summed counters, labelled with their column name
+_SUMS = [func.sum(getattr(UsageDaily, name)).label(name) for name in USAGE_COUNTERS]
+
+
+def _since(days: int) -> date:
+    return datetime.utcnow().date() - timedelta(days=days - 1)
+
+
+def _totals(row: Any) -> Dict[str, Any]:
+    totals = {name: getattr(row, name) or 0 for name in USAGE_COUNTERS}
+    return _with_average(totals)
+
+
+def _with_average(totals: Dict[str, Any]) -> Dict[str, Any]:
+    calls = totals["calls"]
+    totals["avg_upstream_ms"] = totals["upstream_ms"] / calls if calls else 0.0
+    return totals
+
+
+@router.get("/summary", status_code=status.HTTP_200_OK, response_model=UsageSummaryResponse)
+async def get_usage_summary(
+    days: int = Query(default=30, ge=1, le=366),
+    db: AsyncSession = Depends(get_session),
+    user: User = Depends(get_current_user),
+):
+    """Upstream usage of the user per endpoint over the last days
+
+    Reads the daily rows only, usage of the last few seconds may not be
+    flushed yet.
+    """
+    since = _since(days)
+    rows = (
+        await db.exec(
+            select(UsageDaily.endpoint, *_SUMS)
+            .where(UsageDaily.user_id == user.id, UsageDaily.day >= since)
+            .group_by(UsageDaily.endpoint)
+            .order_by(UsageDaily.endpoint)
+        )
+    ).all()
+    result = [{"endpoint": row.endpoint, **_totals(row)} for row in rows]
+    total = _with_average(
+        {name: sum(item[name] for item in result) for name in USAGE_COUNTERS}
+    )
+    # return response
+    return {
+        "message": "successful usage summary retrieval",
+        "since": since,
+        "total": total,
+        "result": result,
+    }
+
+
+@router.get("/daily", status_code=status.HTTP_200_OK, response_model=DailyUsageResponse)
+async def get_daily_usage(
+    days: int = Query(default=30, ge=1, le=366),
+    db: AsyncSession = Depends(get_session),
+    user: User = Depends(get_current_user),
+):
+    """Upstream usage of the user per day and endpoint over the last days"""
+    since = _since(days)
+    rows = (
+        await db.exec(
+            select(UsageDaily)
+            .where(UsageDaily.user_id == user.id, UsageDaily.day >= since)
+            .order_by(UsageDaily.day.desc(), UsageDaily.endpoint)
+        )
+    ).all()
+    # return response
+    return {
+        "message": "successful daily usage retrieval",
+        "since": since,
+        "result": [
+            {"day": row.day, "endpoint": row.endpoint, **_totals(row)} for row in rows
+        ],
+    }
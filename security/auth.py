@@ -15,12 +15,81 @@
 # You should have received a copy of the GNU Affero General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Optional, TypeVar
+
 from passlib.context import CryptContext
-from sqlmodel import Session, select
+from sqlalchemy import update
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from config import settings
+from db import async_write_session_factory
 
 from models.user import User
 
-hash_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+T = TypeVar("T")
+
+# hashes with another work factor need an update, in either direction
+hash_context = CryptContext(
+    schemes=["bcrypt"],
+    deprecated="auto",
+    bcrypt__rounds=settings.BCRYPT_ROUNDS,
+    bcrypt__min_rounds=settings.BCRYPT_ROUNDS,
+    bcrypt__max_rounds=settings.BCRYPT_ROUNDS,
+)
+
+
+class HashingQueueFullError(RuntimeError):
+    """Raised when too many password hashes are already waiting"""
+
+
+class HashingAdmissionError(RuntimeError):
+    """Raised when a client already has too many password hashes in flight"""
+
+
+class PasswordHasher:
+    """Bounded thread pool running bcrypt away from the event loop"""
+
+    def __init__(self, workers: int, queue_size: int, per_client: int):
+        self.workers = workers
+        self.limit = workers + queue_size
+        self.per_client = per_client
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._pending = 0
+        self._clients: Dict[str, int] = {}
+
+    async def run(self, fn: Callable[..., T], *args, client: Optional[str] = None) -> T:
+        """Run a hashing function in the pool, refusing work beyond the limits"""
+        if client is not None and self._clients.get(client, 0) >= self.per_client:
+            raise HashingAdmissionError("Too many password hashes in flight")
+        if self._pending >= self.limit:
+            raise HashingQueueFullError("Password hashing queue is full")
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(
+                max_workers=self.workers, thread_name_prefix="password-hash"
+            )
+        self._pending += 1
+        if client is not None:
+            self._clients[client] = self._clients.get(client, 0) + 1
+        try:
+            return await asyncio.get_running_loop().run_in_executor(
+                self._executor, fn, *args
+            )
+        finally:
+            self._pending -= 1
+            if client is not None:
+                self._clients[client] -= 1
+                if not self._clients[client]:
+                    del self._clients[client]
+
+
+password_hasher = PasswordHasher(
+    settings.PASSWORD_HASH_WORKERS,
+    settings.PASSWORD_HASH_QUEUE_SIZE,
+    settings.PASSWORD_HASH_PER_CLIENT,
+)
 
 
 def verify_password(plain_password: str, hashed_password: str) -> bool:
@@ -33,21 +102,39 @@ def get_password_hash(password: str) -> str:
     return hash_context.hash(password)
 
 
-def get_user_by_email(db: Session, email: str) -> User:
+async def get_user_by_email(db: AsyncSession, email: str) -> User:
     """Get user by username"""
-    return db.exec(select(User).where(User.email == email)).first()
+    return (await db.exec(select(User).where(User.email == email))).first()
 
 
-def get_user_by_id(db: Session, id: int) -> User:
+async def get_user_by_id(db: AsyncSession, id: int) -> User:
     """Get user by id"""
-    return db.exec(select(User).where(User.id == id)).first()
+    return (await db.exec(select(User).where(User.id == id))).first()
+
 
+async def authenticate_user(
+    db: AsyncSession, email: str, password: str, client: Optional[str] = None
+) -> User:
+    """Authenticate user with email and password
 
-def authenticate_user(db: Session, email: str, password: str) -> User:
-    """Authenticate user with email and password"""
-    user = get_user_by_email(db, email)
+    The hash is checked in the password pool and upgraded when the work
+    factor changed since it was made.
+    """
+    user = await get_user_by_email(db, email)
     if not user:
         return False
-    if not verify_password(password, user.hashed_password):
+    # end the read transaction, no connection is held while hashing
+    await db.commit()
+    valid, new_hash = await password_hasher.run(
+        hash_context.verify_and_update, password, user.hashed_password, client=client
+    )
+    if not valid:
         return False
+    if new_hash is not None:
+        async with async_write_session_factory() as write_db:
+            await write_db.exec(
+                update(User).where(User.id == user.id).values(hashed_password=new_hash)
+            )
+            await write_db.commit()
+        user.hashed_password = new_hash
     return user
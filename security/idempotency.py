@@ -0,0 +1,252 @@
+# Copyright (c) 2024-2025 LinguaScreen, Inc.
+#
+# This file is part of LinguaScreen Server
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import asyncio
+import hashlib
+import json
+import time
+from contextlib import asynccontextmanager
+from datetime import datetime, timedelta
+from typing import Any, AsyncIterator, Dict, Optional, Tuple
+
+from fastapi import Depends, HTTPException, Request, status
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from sqlalchemy import and_, delete, or_, update
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from config import settings
+from db import async_write_session_factory
+
+from models.idempotency import IdempotencyRecord
+from models.user import User
+from security.jwt import get_current_user
+from security.ratelimit import client_address
+
+IDEMPOTENCY_HEADER = "Idempotency-Key"
+IDEMPOTENCY_KEY_MAX_LENGTH = 255
+
+# set once the request holding a key in this worker finishes
+_inflight: Dict[str, asyncio.Event] = {}
+
+
+class IdempotentReplay(Exception):
+    """Raised with the stored response of a key that was already used"""
+
+    def __init__(
+        self, status_code: int, body: Any, headers: Optional[Dict[str, str]] = None
+    ):
+        self.status_code = status_code
+        self.body = body
+        self.headers = headers or {}
+
+
+async def replay_idempotent_response(request: Request, exc: IdempotentReplay):
+    """Exception handler answering a retried request with the stored response"""
+    return JSONResponse(
+        content=exc.body,
+        status_code=exc.status_code,
+        headers={**exc.headers, "Idempotent-Replayed": "true"},
+    )
+
+
+class IdempotencyClaim:
+    """Key held by the request that runs first"""
+
+    def __init__(self, key: str):
+        self.key = key
+        self.completed = False
+
+    async def complete(
+        self,
+        body: Any,
+        db: Optional[AsyncSession] = None,
+        status_code: int = status.HTTP_200_OK,
+        headers: Optional[Dict[str, str]] = None,
+    ):
+        """Store the response for retries
+
+        Pass the session of the request to store it in the same transaction as
+        its writes, the caller commits it. `headers` are sent again on replay.
+        """
+        stmt = (
+            update(IdempotencyRecord)
+            .where(IdempotencyRecord.key == self.key)
+            .values(
+                status_code=status_code,
+                response=json.dumps(jsonable_encoder(body), ensure_ascii=False),
+                headers=json.dumps(headers) if headers else None,
+            )
+        )
+        if db is None:
+            async with async_write_session_factory() as own:
+                await own.exec(stmt)
+                await own.commit()
+        else:
+            await db.exec(stmt)
+        self.completed = True
+
+
+async def _claim(
+    key: str, request_hash: str
+) -> Tuple[bool, Optional[IdempotencyRecord]]:
+    """Insert the record of a key, returns whether it was claimed and the record"""
+    now = datetime.utcnow()
+    async with async_write_session_factory() as db:
+        # expired records, and records of requests that never finished
+        await db.exec(
+            delete(IdempotencyRecord).where(
+                or_(
+                    IdempotencyRecord.expires_at <= now,
+                    and_(
+                        IdempotencyRecord.key == key,
+                        IdempotencyRecord.status_code.is_(None),
+                        IdempotencyRecord.created_at
+                        <= now - timedelta(seconds=settings.IDEMPOTENCY_LOCK_SECONDS),
+                    ),
+                )
+            )
+        )
+        insert = sqlite.insert if db.bind.dialect.name == "sqlite" else postgresql.insert
+        claimed = (
+            await db.exec(
+                insert(IdempotencyRecord)
+                .values(
+                    key=key,
+                    request_hash=request_hash,
+                    created_at=now,
+                    expires_at=now + timedelta(seconds=settings.IDEMPOTENCY_TTL),
+                )
+                .on_conflict_do_nothing(index_elements=[IdempotencyRecord.key])
+                .returning(IdempotencyRecord.id)
+            )
+        ).first() is not None
+        record = None
+        if not claimed:
+            record = (
+                await db.exec(
+                    select(IdempotencyRecord).where(IdempotencyRecord.key == key)
+                )
+            ).first()
+        await db.commit()
+    return claimed, record
+
+
+async def _release(key: str):
+    # a stored response is kept, only an unfinished claim is dropped
+    async with async_write_session_factory() as db:
+        await db.exec(
+            delete(IdempotencyRecord).where(
+                IdempotencyRecord.key == key, IdempotencyRecord.status_code.is_(None)
+            )
+        )
+        await db.commit()
+
+
+async def acquire(key: str, request_hash: str) -> IdempotencyClaim:
+    """Claim a key, or wait for the request holding it and replay its response"""
+    deadline = time.monotonic() + settings.IDEMPOTENCY_WAIT_SECONDS
+    while True:
+        claimed, record = await _claim(key, request_hash)
+        if claimed:
+            _inflight[key] = asyncio.Event()
+            return IdempotencyClaim(key)
+        if record is None:
+            # released in between, try again
+            continue
+        if record.request_hash != request_hash:
+            raise HTTPException(
+                status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+                detail=f"{IDEMPOTENCY_HEADER} was already used with another request",
+            )
+        if record.status_code is not None:
+            raise IdempotentReplay(
+                record.status_code,
+                json.loads(record.response),
+                json.loads(record.headers) if record.headers else None,
+            )
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            raise HTTPException(
+                status_code=status.HTTP_409_CONFLICT,
+                detail="A request with this Idempotency-Key is still in progress",
+                headers={"Retry-After": "1"},
+            )
+        event = _inflight.get(key)
+        if event is None:
+            # held by another worker
+            await asyncio.sleep(min(settings.IDEMPOTENCY_POLL_INTERVAL, remaining))
+            continue
+        try:
+            await asyncio.wait_for(event.wait(), remaining)
+        except asyncio.TimeoutError:
+            pass
+
+
+@asynccontextmanager
+async def _idempotency(
+    request: Request, caller: str
+) -> AsyncIterator[Optional[IdempotencyClaim]]:
+    header = request.headers.get(IDEMPOTENCY_HEADER)
+    if header is None:
+        yield None
+        return
+    if not header or len(header) > IDEMPOTENCY_KEY_MAX_LENGTH:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"{IDEMPOTENCY_HEADER} must be 1 to "
+            f"{IDEMPOTENCY_KEY_MAX_LENGTH} characters",
+        )
+    # the body was already read to parse it, this is the cached copy
+    request_hash = hashlib.sha256(await request.body()).hexdigest()
+    route = getattr(request.scope.get("route"), "path", request.url.path)
+    key = f"{caller}:{request.method}:{route}:{header}"
+    claim = await acquire(key, request_hash)
+    try:
+        yield claim
+    except Exception:
+        await _release(key)
+        raise
+    else:
+        if not claim.completed:
+            await _release(key)
+    finally:
+        event = _inflight.pop(key, None)
+        if event is not None:
+            event.set()
+
+
+async def user_idempotency(
+    request: Request, user: User = Depends(get_current_user)
+) -> AsyncIterator[Optional[IdempotencyClaim]]:
+    """Dependency honouring the Idempotency-Key header of the current user
+
+    Yields None without the header. Declare it before the database session of
+    the route, so a failed request is released after its session is closed.
+    """
+    async with _idempotency(request, f"user:{user.id}") as claim:
+        yield claim
+
+
+async def client_idempotency(
+    request: Request,
+) -> AsyncIterator[Optional[IdempotencyClaim]]:
+    """Dependency honouring the Idempotency-Key header of a client address"""
+    async with _idempotency(request, f"client:{client_address(request)}") as claim:
+        yield claim
@@ -15,24 +15,99 @@
 # You should have received a copy of the GNU Affero General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
+import time
+from collections import OrderedDict
 from datetime import datetime, timedelta
-from typing import Optional
+from itertools import chain
+from typing import Dict, Optional, Set, Tuple
 
 from fastapi import Depends, HTTPException, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from jose import JWTError, jwt
-from sqlmodel import Session
+from sqlalchemy import event
+from sqlalchemy.orm import Session
 
 from config import settings
-from db import get_session
+from db import async_session_factory
 
 from models.user import User
 from security.auth import get_user_by_id
+from telemetry.tracing import traced
+from telemetry.usage import set_usage_user
 
 # JWT bearer token security scheme
 jwt_scheme = HTTPBearer()
 
 
+class PrincipalCache:
+    """Verified tokens mapped to their user, never trusted past token expiry"""
+
+    def __init__(self, ttl: float, max_entries: int):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        # token -> (valid until, user), least recently used first
+        self._entries: "OrderedDict[str, Tuple[float, User]]" = OrderedDict()
+        self._tokens: Dict[int, Set[str]] = {}
+
+    def get(self, token: str) -> Optional[User]:
+        """Get the user of a token verified before"""
+        entry = self._entries.get(token)
+        if entry is None:
+            return None
+        if time.monotonic() >= entry[0]:
+            self._drop(token)
+            return None
+        self._entries.move_to_end(token)
+        return entry[1]
+
+    def put(self, token: str, user: User, expires_at: float):
+        """Remember a verified token until the TTL or its `exp` claim"""
+        ttl = min(self.ttl, expires_at - time.time())
+        if ttl <= 0:
+            return
+        self._entries[token] = (time.monotonic() + ttl, user)
+        self._entries.move_to_end(token)
+        self._tokens.setdefault(user.id, set()).add(token)
+        while len(self._entries) > self.max_entries:
+            self._drop(next(iter(self._entries)))
+
+    def invalidate_user(self, user_id: int):
+        """Forget every token of a user after it changed"""
+        for token in self._tokens.pop(user_id, ()):
+            self._entries.pop(token, None)
+
+    def clear(self):
+        """Forget every token"""
+        self._entries.clear()
+        self._tokens.clear()
+
+    def _drop(self, token: str):
+        _, user = self._entries.pop(token)
+        tokens = self._tokens.get(user.id)
+        if tokens is not None:
+            tokens.discard(token)
+            if not tokens:
+                del self._tokens[user.id]
+
+
+principal_cache = PrincipalCache(settings.AUTH_CACHE_TTL, settings.AUTH_CACHE_MAX_ENTRIES)
+
+
+@event.listens_for(Session, "after_flush")
+def _invalidate_changed_users(session, flush_context):
+    for obj in chain(session.dirty, session.deleted):
+        if isinstance(obj, User):
+            principal_cache.invalidate_user(obj.id)
+
+
+def token_claims(user: User) -> dict:
+    """Claims of an access token for the user"""
+    claims = {"sub": str(user.id)}
+    if settings.AUTH_TRUST_TOKEN_CLAIMS:
+        claims.update(username=user.username, email=user.email)
+    return claims
+
+
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -> str:
     """Create JWT access token"""
     # copy data to encode
@@ -51,11 +126,26 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -
     return encoded_jwt
 
 
+def token_expiry(token: str) -> float:
+    """Expiry of a token already verified, as a unix timestamp"""
+    return float(jwt.get_unverified_claims(token).get("exp", 0))
+
+
+@traced("auth")
 async def get_current_user(
     credentials: HTTPAuthorizationCredentials = Depends(jwt_scheme),
-    db: Session = Depends(get_session),
 ) -> User:
-    """Get current user from JWT token"""
+    """Get current user from JWT token
+
+    Tokens verified before are served from the principal cache, so the common
+    path neither decodes the token nor touches the database.
+    """
+    # extract token from credentials
+    token = credentials.credentials
+    user = principal_cache.get(token)
+    if user is not None:
+        set_usage_user(user.id)
+        return user
     # exception structure
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
@@ -64,8 +154,6 @@ async def get_current_user(
     )
     # authenticate
     try:
-        # extract token from credentials
-        token = credentials.credentials
         # decode the JWT token
         payload = jwt.decode(
             token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM]
@@ -81,9 +169,21 @@ async def get_current_user(
             raise credentials_exception
     except JWTError:
         raise credentials_exception
-    # get the user by id
-    user = get_user_by_id(db, user_id)
+    if settings.AUTH_TRUST_TOKEN_CLAIMS and "username" in payload and "email" in payload:
+        # trusted claims, the user is not loaded
+        user = User(
+            id=user_id,
+            username=payload["username"],
+            email=payload["email"],
+            hashed_password="",
+        )
+    else:
+        # get the user by id, a session is only opened on a cache miss
+        async with async_session_factory() as db:
+            user = await get_user_by_id(db, user_id)
     if user is None:
         raise credentials_exception
+    principal_cache.put(token, user, payload.get("exp", 0))
+    set_usage_user(user.id)
     # return user data
     return user
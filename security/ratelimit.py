@@ -0,0 +1,222 @@
+# Copyright (c) 2024-2025 LinguaScreen, Inc.
+#
+# This file is part of LinguaScreen Server
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import math
+import sqlite3
+import threading
+import time
+from typing import Optional
+
+from fastapi import Depends, HTTPException, Request, status
+from fastapi.concurrency import run_in_threadpool
+
+from config import settings
+
+from models.user import User
+from security.jwt import get_current_user
+
+SECONDS_PER_DAY = 86400
+
+# takes the tokens only when the refilled bucket holds enough of them
+TAKE_SQL = """
+INSERT INTO buckets (key, tokens, updated) VALUES (:key, :capacity - :cost, :now)
+ON CONFLICT (key) DO UPDATE SET
+    tokens = min(:capacity, tokens + (:now - updated) * :rate) - :cost,
+    updated = :now
+WHERE min(:capacity, tokens + (:now - updated) * :rate) >= :cost
+RETURNING tokens
+"""
+
+# takes the tokens unconditionally, the bucket may go below zero
+CHARGE_SQL = """
+INSERT INTO buckets (key, tokens, updated) VALUES (:key, :capacity - :cost, :now)
+ON CONFLICT (key) DO UPDATE SET
+    tokens = min(:capacity, tokens + (:now - updated) * :rate) - :cost,
+    updated = :now
+"""
+
+LEVEL_SQL = """
+SELECT min(:capacity, tokens + (:now - updated) * :rate) FROM buckets WHERE key = :key
+"""
+
+
+class BucketStore:
+    """Token buckets in a sqlite file shared by every worker
+
+    Each operation is a single statement, so concurrent workers never see a
+    half updated bucket. Calls block, run them in the threadpool.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5.0, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            # losing the last updates on a crash only refills some buckets
+            conn.execute("PRAGMA synchronous=OFF")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS buckets "
+                "(key TEXT PRIMARY KEY, tokens REAL NOT NULL, updated REAL NOT NULL) "
+                "WITHOUT ROWID"
+            )
+            self._local.conn = conn
+        return conn
+
+    def _level(self, params: dict) -> float:
+        row = self._connect().execute(LEVEL_SQL, params).fetchone()
+        return params["capacity"] if row is None else row[0]
+
+    def take(self, key: str, cost: float, capacity: float, rate: float) -> float:
+        """Take tokens, returns 0 or the seconds to wait when refused"""
+        params = {
+            "key": key,
+            "cost": min(cost, capacity),
+            "capacity": capacity,
+            "rate": rate,
+            "now": time.time(),
+        }
+        if self._connect().execute(TAKE_SQL, params).fetchone() is not None:
+            return 0.0
+        return (params["cost"] - self._level(params)) / rate
+
+    def charge(self, key: str, cost: float, capacity: float, rate: float):
+        """Take tokens already spent, even when the bucket runs dry"""
+        self._connect().execute(
+            CHARGE_SQL,
+            {
+                "key": key,
+                "cost": cost,
+                "capacity": capacity,
+                "rate": rate,
+                "now": time.time(),
+            },
+        )
+
+    def wait(self, key: str, capacity: float, rate: float) -> float:
+        """Seconds until the bucket holds tokens again, 0 when it does"""
+        level = self._level(
+            {"key": key, "capacity": capacity, "rate": rate, "now": time.time()}
+        )
+        return 0.0 if level > 0 else (1 - level) / rate
+
+
+buckets = BucketStore(settings.RATE_LIMIT_DB)
+
+
+def client_address(request: Request) -> Optional[str]:
+    """Address of the client, for limits on anonymous callers"""
+    return request.client.host if request.client else None
+
+
+def too_many_requests(wait: float, detail: str) -> HTTPException:
+    """429 telling the caller when to retry"""
+    return HTTPException(
+        status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+        detail=detail,
+        headers={"Retry-After": str(max(1, math.ceil(wait)))},
+    )
+
+
+async def take_request(
+    route: str, caller: str, per_minute: float, burst: int, cost: int = 1
+):
+    """Take `cost` requests from the bucket of a caller on a route, 429 when short"""
+    if not settings.RATE_LIMIT_ENABLED:
+        return
+    wait = await run_in_threadpool(
+        buckets.take, f"req:{route}:{caller}", cost, burst, per_minute / 60
+    )
+    if wait:
+        raise too_many_requests(wait, "Rate limit exceeded, try again later")
+
+
+async def _take_request(
+    request: Request, caller: str, per_minute: float, burst: int, cost: int = 1
+):
+    # one bucket per caller and route template
+    route = getattr(request.scope.get("route"), "path", request.url.path)
+    await take_request(route, caller, per_minute, burst, cost)
+
+
+async def take_user_requests(
+    request: Request, user: User, per_minute: float, burst: int, cost: int
+):
+    """Take `cost` requests of the current user on a route, for routes fanning out"""
+    await _take_request(request, f"user:{user.id}", per_minute, burst, cost)
+
+
+def user_rate_limit(per_minute: float, burst: int):
+    """Dependency limiting the requests of the current user to a route"""
+
+    async def dependency(request: Request, user: User = Depends(get_current_user)):
+        await _take_request(request, f"user:{user.id}", per_minute, burst)
+
+    return dependency
+
+
+def client_rate_limit(per_minute: float, burst: int):
+    """Dependency limiting the requests of a client address to a route"""
+
+    async def dependency(request: Request):
+        await _take_request(request, f"client:{client_address(request)}", per_minute, burst)
+
+    return dependency
+
+
+async def _check_llm_quota(caller: str) -> str:
+    if settings.RATE_LIMIT_ENABLED:
+        for kind, per_day in (
+            ("prompt", settings.LLM_PROMPT_TOKENS_PER_DAY),
+            ("completion", settings.LLM_COMPLETION_TOKENS_PER_DAY),
+        ):
+            wait = await run_in_threadpool(
+                buckets.wait, f"llm_{kind}:{caller}", per_day, per_day / SECONDS_PER_DAY
+            )
+            if wait:
+                raise too_many_requests(wait, "LLM token quota exhausted, try again later")
+    return caller
+
+
+async def user_llm_quota(user: User = Depends(get_current_user)) -> str:
+    """Dependency refusing users out of LLM tokens, returns their quota key"""
+    return await _check_llm_quota(f"user:{user.id}")
+
+
+async def client_llm_quota(request: Request) -> str:
+    """Dependency refusing clients out of LLM tokens, returns their quota key"""
+    return await _check_llm_quota(f"client:{client_address(request)}")
+
+
+async def charge_llm_tokens(caller: str, prompt_tokens: int, completion_tokens: int):
+    """Charge the tokens of LLM calls to the quota of a caller"""
+    if not settings.RATE_LIMIT_ENABLED:
+        return
+
+    def charge():
+        for kind, tokens, per_day in (
+            ("prompt", prompt_tokens, settings.LLM_PROMPT_TOKENS_PER_DAY),
+            ("completion", completion_tokens, settings.LLM_COMPLETION_TOKENS_PER_DAY),
+        ):
+            buckets.charge(
+                f"llm_{kind}:{caller}", tokens, per_day, per_day / SECONDS_PER_DAY
+            )
+
+    await run_in_threadpool(charge)
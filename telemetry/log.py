@@ -0,0 +1,233 @@
+# Copyright (c) 2024-2025 LinguaScreen, Inc.
+#
+# This file is part of LinguaScreen Server
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import atexit
+import json
+import logging
+import queue
+import re
+import sys
+import threading
+import time
+import uuid
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+from typing import Dict, Optional, Tuple
+
+from config import settings
+
+# id of the request being served, attached to every record
+request_id_var: ContextVar[Optional[str]] = ContextVar("request_id", default=None)
+
+# client supplied request ids are only trusted when they look sane
+REQUEST_ID_PATTERN = re.compile(r"^[A-Za-z0-9._-]{1,64}$")
+
+# attributes every LogRecord has, anything else came in through `extra`
+_RECORD_ATTRS = set(vars(logging.makeLogRecord({}))) | {"message", "asctime", "request_id"}
+
+
+class JsonFormatter(logging.Formatter):
+    """Format records as one json object per line"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        payload = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+            "request_id": getattr(record, "request_id", None),
+        }
+        for key, value in record.__dict__.items():
+            if key not in _RECORD_ATTRS:
+                payload[key] = value
+        if record.exc_text:
+            payload["exception"] = record.exc_text
+        elif record.exc_info:
+            payload["exception"] = self.formatException(record.exc_info)
+        return json.dumps(payload, ensure_ascii=False, default=str)
+
+
+class RequestIdFilter(logging.Filter):
+    """Attach the current request id to records"""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.request_id = request_id_var.get()
+        return True
+
+
+class DuplicateFilter(logging.Filter):
+    """Let a burst of identical records through per window and drop the rest
+
+    Records are identical when their logger, level, formatted message and
+    structured extras match. Counts of dropped records are reported on the
+    next identical record, or by a sweep once their window is over.
+    """
+
+    def __init__(self, window: float, burst: int):
+        super().__init__()
+        self.window = window
+        self.burst = burst
+        self._lock = threading.Lock()
+        # key -> (window start, records seen in window)
+        self._seen: Dict[Tuple, Tuple[float, int]] = {}
+        self._last_sweep = time.monotonic()
+
+    @staticmethod
+    def _key(record: logging.LogRecord) -> Tuple:
+        extras = tuple(
+            sorted(
+                (key, repr(value))
+                for key, value in record.__dict__.items()
+                if key not in _RECORD_ATTRS and key != "suppressed"
+            )
+        )
+        return (record.name, record.levelno, record.getMessage(), extras)
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if getattr(record, "duplicate_summary", False):
+            return True
+        key = self._key(record)
+        now = time.monotonic()
+        with self._lock:
+            start, count = self._seen.get(key, (now, 0))
+            if now - start >= self.window:
+                # report what the previous window swallowed on the first record of the next
+                if count > self.burst:
+                    record.suppressed = count - self.burst
+                start, count = now, 0
+            count += 1
+            self._seen[key] = (start, count)
+            expired = self._sweep(now)
+            if len(self._seen) > 10000:
+                self._seen.clear()
+        for (name, level, message, _), suppressed in expired:
+            logging.getLogger(name).log(
+                level,
+                "duplicate log records suppressed",
+                extra={
+                    "duplicate_summary": True,
+                    "duplicate_message": message,
+                    "suppressed": suppressed,
+                },
+            )
+        return count <= self.burst
+
+    def _sweep(self, now: float):
+        # drop finished windows, returning those that swallowed records
+        if now - self._last_sweep < self.window:
+            return []
+        self._last_sweep = now
+        expired = []
+        for key, (start, count) in list(self._seen.items()):
+            if now - start >= self.window:
+                del self._seen[key]
+                if count > self.burst:
+                    expired.append((key, count - self.burst))
+        return expired
+
+
+class NonBlockingQueueHandler(QueueHandler):
+    """Queue handler that never blocks the caller and drops records when full"""
+
+    dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # only merge the arguments here, formatting happens on the listener thread
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            NonBlockingQueueHandler.dropped += 1
+
+
+_listener: Optional[QueueListener] = None
+_setup_lock = threading.Lock()
+
+
+def setup_logging():
+    """Route every log record through a background writer thread"""
+    global _listener
+    with _setup_lock:
+        if _listener is not None:
+            return
+        stream_handler = logging.StreamHandler(sys.stdout)
+        if settings.LOG_JSON:
+            stream_handler.setFormatter(JsonFormatter())
+        else:
+            stream_handler.setFormatter(
+                logging.Formatter("%(asctime)s %(levelname)s %(name)s [%(request_id)s] %(message)s")
+            )
+        queue_handler = NonBlockingQueueHandler(queue.Queue(settings.LOG_QUEUE_SIZE))
+        queue_handler.addFilter(RequestIdFilter())
+        queue_handler.addFilter(
+            DuplicateFilter(settings.LOG_DUPLICATE_WINDOW, settings.LOG_DUPLICATE_BURST)
+        )
+        root = logging.getLogger()
+        root.handlers = [queue_handler]
+        root.setLevel(settings.LOG_LEVEL.upper())
+        _listener = QueueListener(queue_handler.queue, stream_handler)
+        _listener.start()
+        atexit.register(_listener.stop)
+
+
+def get_logger(name: str) -> logging.Logger:
+    """Get a project logger, configuring the pipeline on first use"""
+    setup_logging()
+    return logging.getLogger(f"linguascreen.{name}")
+
+
+class RequestIdMiddleware:
+    """ASGI middleware assigning a request id used to correlate log records"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] not in ("http", "websocket"):
+            await self.app(scope, receive, send)
+            return
+
+        request_id = None
+        for name, value in scope["headers"]:
+            if name == b"x-request-id":
+                candidate = value.decode("latin-1")
+                if REQUEST_ID_PATTERN.match(candidate):
+                    request_id = candidate
+                break
+        if request_id is None:
+            request_id = uuid.uuid4().hex
+        token = request_id_var.set(request_id)
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                headers = list(message.get("headers", []))
+                headers.append((b"x-request-id", request_id.encode("latin-1")))
+                message["headers"] = headers
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            request_id_var.reset(token)
@@ -0,0 +1,414 @@
+# Copyright (c) 2024-2025 LinguaScreen, Inc.
+#
+# This file is part of LinguaScreen Server
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import json
+import os
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from config import settings
+
+# latency buckets in seconds, wide enough for slow llm calls
+DEFAULT_BUCKETS = (
+    0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0,
+)
+
+LabelValues = Tuple[str, ...]
+
+
+class _Shard:
+    """Per-thread metric storage, only ever written by its owning thread"""
+
+    def __init__(self):
+        self.values: Dict[Tuple[str, LabelValues], List[float]] = {}
+
+
+class Registry:
+    """Collection of metrics backed by lock-free per-thread shards"""
+
+    def __init__(self):
+        self._metrics: Dict[str, "_Metric"] = {}
+        self._shards: List[_Shard] = []
+        self._shards_lock = threading.Lock()
+        self._local = threading.local()
+
+    def register(self, metric: "_Metric"):
+        """Register a metric under its name"""
+        if metric.name in self._metrics:
+            raise ValueError(f"Metric {metric.name} already registered")
+        self._metrics[metric.name] = metric
+
+    def shard(self) -> _Shard:
+        """Get the shard of the calling thread"""
+        try:
+            return self._local.shard
+        except AttributeError:
+            shard = _Shard()
+            # the lock is only taken once per thread
+            with self._shards_lock:
+                self._shards.append(shard)
+            self._local.shard = shard
+            return shard
+
+    def snapshot(self) -> Dict[str, Dict[LabelValues, List[float]]]:
+        """Merge every shard into a single snapshot of this process"""
+        with self._shards_lock:
+            shards = list(self._shards)
+        merged: Dict[str, Dict[LabelValues, List[float]]] = {}
+        for shard in shards:
+            # copying the items is atomic under the GIL
+            for (name, labels), values in list(shard.values.items()):
+                series = merged.setdefault(name, {})
+                current = series.get(labels)
+                if current is None:
+                    series[labels] = list(values)
+                else:
+                    for i, value in enumerate(values):
+                        current[i] += value
+        return merged
+
+    def render(self, snapshot: Dict[str, Dict[LabelValues, List[float]]]) -> str:
+        """Render a snapshot in prometheus text exposition format"""
+        lines: List[str] = []
+        for name, metric in self._metrics.items():
+            lines.append(f"# HELP {name} {metric.documentation}")
+            lines.append(f"# TYPE {name} {metric.kind}")
+            for labels, values in sorted(snapshot.get(name, {}).items()):
+                lines.extend(metric.render(labels, values))
+        lines.append("")
+        return "\n".join(lines)
+
+
+def _escape(value: str) -> str:
+    """Escape a label value for the text exposition format"""
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(pairs: List[Tuple[str, str]]) -> str:
+    """Format label pairs as {name="value",...}"""
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in pairs) + "}"
+
+
+def _format_value(value: float) -> str:
+    """Format a sample value, integers without the trailing .0"""
+    return str(int(value)) if value.is_integer() else repr(value)
+
+
+class _Metric:
+    """Base class for metrics"""
+
+    kind = "untyped"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Tuple[str, ...] = (),
+        registry: Optional[Registry] = None,
+    ):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self._registry = registry or REGISTRY
+        self._registry.register(self)
+
+    def _values(self, labels: LabelValues, size: int) -> List[float]:
+        """Get the mutable values of a series in the calling thread shard"""
+        values = self._registry.shard().values
+        key = (self.name, labels)
+        series = values.get(key)
+        if series is None:
+            series = values[key] = [0.0] * size
+        return series
+
+    def render(self, labels: LabelValues, values: List[float]) -> List[str]:
+        pairs = list(zip(self.labelnames, labels))
+        return [f"{self.name}{_format_labels(pairs)} {_format_value(values[0])}"]
+
+
+class Counter(_Metric):
+    """Monotonically increasing counter"""
+
+    kind = "counter"
+
+    def inc(self, *labels: str, amount: float = 1.0):
+        self._values(labels, 1)[0] += amount
+
+
+class Gauge(_Metric):
+    """Gauge that goes up and down, summed across threads and workers"""
+
+    kind = "gauge"
+
+    def inc(self, *labels: str, amount: float = 1.0):
+        self._values(labels, 1)[0] += amount
+
+    def dec(self, *labels: str, amount: float = 1.0):
+        self._values(labels, 1)[0] -= amount
+
+
+class Histogram(_Metric):
+    """Histogram with fixed buckets, stored non-cumulative plus sum and count"""
+
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Tuple[str, ...] = (),
+        buckets: Tuple[float, ...] = DEFAULT_BUCKETS,
+        registry: Optional[Registry] = None,
+    ):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, documentation, labelnames, registry)
+
+    def observe(self, value: float, *labels: str):
+        # layout: one slot per bucket, one for +Inf, then sum and count
+        values = self._values(labels, len(self.buckets) + 3)
+        values[bisect_left(self.buckets, value)] += 1
+        values[-2] += value
+        values[-1] += 1
+
+    def render(self, labels: LabelValues, values: List[float]) -> List[str]:
+        pairs = list(zip(self.labelnames, labels))
+        lines = []
+        cumulative = 0.0
+        bounds = [repr(b) for b in self.buckets] + ["+Inf"]
+        for bound, count in zip(bounds, values):
+            cumulative += count
+            labelled = _format_labels(pairs + [("le", bound)])
+            lines.append(f"{self.name}_bucket{labelled} {_format_value(cumulative)}")
+        lines.append(f"{self.name}_sum{_format_labels(pairs)} {_format_value(values[-2])}")
+        lines.append(f"{self.name}_count{_format_labels(pairs)} {_format_value(values[-1])}")
+        return lines
+
+
+# process wide registry
+REGISTRY = Registry()
+
+HTTP_REQUEST_DURATION = Histogram(
+    "http_request_duration_seconds",
+    "HTTP request latency by route and status",
+    ("method", "route", "status"),
+)
+HTTP_REQUESTS_IN_FLIGHT = Gauge(
+    "http_requests_in_flight",
+    "HTTP requests currently being served",
+    ("method",),
+)
+UPSTREAM_REQUEST_DURATION = Histogram(
+    "upstream_request_duration_seconds",
+    "Upstream call latency by provider and operation",
+    ("provider", "operation", "outcome"),
+)
+UPSTREAM_REQUESTS_IN_FLIGHT = Gauge(
+    "upstream_requests_in_flight",
+    "Upstream calls currently in progress",
+    ("provider",),
+)
+DB_QUERY_DURATION = Histogram(
+    "db_query_duration_seconds",
+    "Database statement execution time by statement type",
+    ("statement",),
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0),
+)
+LLM_TOKENS = Counter(
+    "llm_tokens_total",
+    "LLM tokens consumed by model and kind",
+    ("model", "kind"),
+)
+
+
+@contextmanager
+def observe_upstream(provider: str, operation: str) -> Iterator[None]:
+    """Time an upstream call and track it as in flight"""
+    UPSTREAM_REQUESTS_IN_FLIGHT.inc(provider)
+    start = time.perf_counter()
+    outcome = "error"
+    try:
+        yield
+        outcome = "ok"
+    finally:
+        UPSTREAM_REQUESTS_IN_FLIGHT.dec(provider)
+        UPSTREAM_REQUEST_DURATION.observe(
+            time.perf_counter() - start, provider, operation, outcome
+        )
+
+
+def record_llm_usage(model: str, usage: Any):
+    """Count prompt and completion tokens from an openai usage object"""
+    if usage is None:
+        return
+    LLM_TOKENS.inc(model, "prompt", amount=usage.prompt_tokens or 0)
+    LLM_TOKENS.inc(model, "completion", amount=usage.completion_tokens or 0)
+
+
+# statement types kept as label values, anything else is "other"
+_STATEMENT_TYPES = {"SELECT", "INSERT", "UPDATE", "DELETE", "PRAGMA", "CREATE"}
+
+
+def _statement_type(statement: str) -> str:
+    """Extract the leading keyword of a sql statement"""
+    head = statement.lstrip()[:8].split(None, 1)
+    keyword = head[0].upper() if head else ""
+    return keyword if keyword in _STATEMENT_TYPES else "other"
+
+
+def instrument_engine(engine: Engine):
+    """Time every statement executed by the engine"""
+
+    # the start is kept on the execution context, so a failed statement
+    # leaves nothing behind for the next one on the pooled connection
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        context._metrics_query_start = time.perf_counter()
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        start = getattr(context, "_metrics_query_start", None)
+        if start is not None:
+            DB_QUERY_DURATION.observe(time.perf_counter() - start, _statement_type(statement))
+
+
+def _snapshot_path(directory: str, pid: int) -> str:
+    return os.path.join(directory, f"metrics-{pid}.json")
+
+
+def _encode(snapshot: Dict[str, Dict[LabelValues, List[float]]]) -> Dict[str, Any]:
+    """Make a snapshot json serializable"""
+    return {
+        name: [[list(labels), values] for labels, values in series.items()]
+        for name, series in snapshot.items()
+    }
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def write_snapshot():
+    """Persist this worker snapshot so sibling workers can serve it"""
+    directory = settings.METRICS_MULTIPROC_DIR
+    if not directory:
+        return
+    path = _snapshot_path(directory, os.getpid())
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as file:
+        json.dump(_encode(REGISTRY.snapshot()), file)
+    # atomic swap so readers never see a partial file
+    os.replace(tmp_path, path)
+
+
+def collect() -> str:
+    """Render metrics of this process merged with every other worker"""
+    snapshot = REGISTRY.snapshot()
+    directory = settings.METRICS_MULTIPROC_DIR
+    if directory and os.path.isdir(directory):
+        own = _snapshot_path(directory, os.getpid())
+        for filename in os.listdir(directory):
+            path = os.path.join(directory, filename)
+            if not filename.endswith(".json") or path == own:
+                continue
+            try:
+                with open(path) as file:
+                    data = json.load(file)
+                pid = int(filename[len("metrics-"):-len(".json")])
+            except (OSError, ValueError):
+                continue
+            alive = _pid_alive(pid)
+            for name, series in data.items():
+                metric = REGISTRY._metrics.get(name)
+                # gauges of dead workers no longer describe anything in flight
+                if metric is None or (metric.kind == "gauge" and not alive):
+                    continue
+                merged = snapshot.setdefault(name, {})
+                for labels, values in series:
+                    key = tuple(labels)
+                    current = merged.get(key)
+                    if current is None:
+                        merged[key] = values
+                    else:
+                        for i, value in enumerate(values):
+                            current[i] += value
+    return REGISTRY.render(snapshot)
+
+
+def start_snapshot_writer():
+    """Periodically write this worker snapshot in multi-worker deployments"""
+    directory = settings.METRICS_MULTIPROC_DIR
+    if not directory:
+        return
+    os.makedirs(directory, exist_ok=True)
+
+    def _loop():
+        while True:
+            time.sleep(settings.METRICS_FLUSH_INTERVAL)
+            try:
+                write_snapshot()
+            except OSError:
+                pass
+
+    threading.Thread(target=_loop, name="metrics-writer", daemon=True).start()
+
+
+class MetricsMiddleware:
+    """ASGI middleware recording request latency and in-flight requests"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        method = scope["method"]
+        status_code = 500
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        HTTP_REQUESTS_IN_FLIGHT.inc(method)
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            HTTP_REQUESTS_IN_FLIGHT.dec(method)
+            # use the route template to keep label cardinality bounded
+            route = scope.get("route")
+            path = getattr(route, "path", None) or "<unmatched>"
+            HTTP_REQUEST_DURATION.observe(
+                time.perf_counter() - start, method, path, str(status_code)
+            )
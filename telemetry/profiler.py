@@ -0,0 +1,175 @@
+# Copyright (c) 2024-2025 LinguaScreen, Inc.
+#
+# This file is part of LinguaScreen Server
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import hmac
+import os
+import random
+import re
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from typing import List, Optional
+
+from config import settings
+from telemetry.log import get_logger
+
+logger = get_logger("profiler")
+
+# profile ids are generated here, anything else is rejected on download
+PROFILE_ID_PATTERN = re.compile(r"^[0-9]{14}-[0-9a-f]{32}$")
+
+
+class SamplingProfiler:
+    """Statistical profiler sampling every thread stack from a side thread"""
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        self.samples: Counter = Counter()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="profiler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def _run(self):
+        own_id = threading.get_ident()
+        names = {}
+        while not self._stop.wait(self.interval):
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                if thread_id not in names:
+                    names = {t.ident: t.name for t in threading.enumerate()}
+                stack: List[str] = []
+                while frame is not None:
+                    code = frame.f_code
+                    filename = "/".join(code.co_filename.rsplit("/", 2)[-2:])
+                    stack.append(f"{code.co_name} ({filename}:{code.co_firstlineno})")
+                    frame = frame.f_back
+                stack.append(names.get(thread_id, str(thread_id)))
+                self.samples[";".join(reversed(stack))] += 1
+
+    def folded(self) -> str:
+        """Render samples in the collapsed stack format used by flamegraph tools"""
+        return "".join(f"{stack} {count}\n" for stack, count in self.samples.most_common())
+
+
+def _output_dir() -> str:
+    directory = settings.PROFILER_OUTPUT_DIR
+    os.makedirs(directory, exist_ok=True)
+    return directory
+
+
+def list_profiles() -> List[str]:
+    """List stored profile ids, newest first"""
+    directory = settings.PROFILER_OUTPUT_DIR
+    if not os.path.isdir(directory):
+        return []
+    names = [name[: -len(".folded")] for name in os.listdir(directory) if name.endswith(".folded")]
+    return sorted(names, reverse=True)
+
+
+def profile_path(profile_id: str) -> Optional[str]:
+    """Path of a stored profile, None when the id is invalid or missing"""
+    if not PROFILE_ID_PATTERN.match(profile_id):
+        return None
+    path = os.path.join(settings.PROFILER_OUTPUT_DIR, f"{profile_id}.folded")
+    return path if os.path.isfile(path) else None
+
+
+def _store(profile_id: str, profiler: SamplingProfiler):
+    """Write a profile and drop the oldest ones above the retention limit"""
+    directory = _output_dir()
+    with open(os.path.join(directory, f"{profile_id}.folded"), "w") as file:
+        file.write(profiler.folded())
+    for stale in list_profiles()[settings.PROFILER_MAX_PROFILES:]:
+        try:
+            os.remove(os.path.join(directory, f"{stale}.folded"))
+        except OSError:
+            pass
+
+
+def is_profiler_token(token: Optional[str]) -> bool:
+    """Check a token against the configured profiler token"""
+    expected = settings.PROFILER_TOKEN
+    if not expected or not token:
+        return False
+    return hmac.compare_digest(token.encode(), expected.encode())
+
+
+# only one request is profiled at a time per worker
+_active = threading.Lock()
+
+
+class ProfilerMiddleware:
+    """ASGI middleware profiling requests flagged by header or sampled at random"""
+
+    def __init__(self, app):
+        self.app = app
+        self.header = settings.PROFILER_HEADER.lower().encode("latin-1")
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        token = None
+        for name, value in scope["headers"]:
+            if name == self.header:
+                token = value.decode("latin-1")
+                break
+        forced = is_profiler_token(token)
+        # slow requests are only known once finished, so sample first and keep the slow ones
+        if not forced and random.random() >= settings.PROFILER_SAMPLE_RATE:
+            await self.app(scope, receive, send)
+            return
+        if not _active.acquire(blocking=False):
+            await self.app(scope, receive, send)
+            return
+
+        profile_id = f"{time.strftime('%Y%m%d%H%M%S')}-{uuid.uuid4().hex}"
+
+        async def send_wrapper(message):
+            if forced and message["type"] == "http.response.start":
+                headers = list(message.get("headers", []))
+                headers.append((b"x-profile-id", profile_id.encode("latin-1")))
+                message["headers"] = headers
+            await send(message)
+
+        profiler = SamplingProfiler(settings.PROFILER_INTERVAL_MS / 1000)
+        start = time.perf_counter()
+        profiler.start()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            profiler.stop()
+            _active.release()
+            elapsed_ms = (time.perf_counter() - start) * 1000
+            if forced or elapsed_ms >= settings.PROFILER_SLOW_REQUEST_MS:
+                _store(profile_id, profiler)
+                logger.info(
+                    "stored request profile",
+                    extra={"profile_id": profile_id, "duration_ms": round(elapsed_ms, 3)},
+                )
@@ -0,0 +1,274 @@
+# Copyright (c) 2024-2025 LinguaScreen, Inc.
+#
+# This file is part of LinguaScreen Server
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import functools
+import inspect
+import random
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+
+from config import settings
+from telemetry.log import get_logger
+
+logger = get_logger("tracing")
+
+
+class Span:
+    """Timed stage of a request"""
+
+    __slots__ = ("name", "start", "end", "children")
+
+    def __init__(self, name: str, start: float, end: Optional[float] = None):
+        self.name = name
+        self.start = start
+        self.end = end
+        self.children: List["Span"] = []
+
+    @property
+    def duration(self) -> float:
+        return (self.end if self.end is not None else time.perf_counter()) - self.start
+
+    def to_dict(self, origin: float) -> Dict[str, Any]:
+        """Serialize the span tree with offsets relative to origin"""
+        return {
+            "name": self.name,
+            "start_ms": round((self.start - origin) * 1000, 3),
+            "duration_ms": round(self.duration * 1000, 3),
+            "children": [
+                child.to_dict(origin)
+                for child in sorted(self.children, key=lambda child: child.start)
+            ],
+        }
+
+
+class Trace:
+    """Span tree of a single request"""
+
+    __slots__ = ("method", "path", "start", "spans", "span_count", "folded", "streaming")
+
+    def __init__(self, method: str, path: str):
+        self.method = method
+        self.path = path
+        self.start = time.perf_counter()
+        self.spans: List[Span] = []
+        self.span_count = 0
+        # duration and count of spans past TRACE_MAX_SPANS, by name
+        self.folded: Dict[str, Tuple[float, int]] = {}
+        self.streaming = False
+
+    def fold(self, span: Span):
+        """Count a span in the totals without keeping it in the tree"""
+        duration, count = self.folded.get(span.name, (0.0, 0))
+        self.folded[span.name] = (duration + span.duration, count + 1)
+
+    def stages(self) -> Dict[str, Tuple[float, int]]:
+        """Total duration and count of every span name"""
+        totals: Dict[str, Tuple[float, int]] = dict(self.folded)
+        pending = list(self.spans)
+        while pending:
+            current = pending.pop()
+            duration, count = totals.get(current.name, (0.0, 0))
+            totals[current.name] = (duration + current.duration, count + 1)
+            pending.extend(current.children)
+        return totals
+
+    def server_timing(self) -> str:
+        """Render the stage breakdown as a Server-Timing header value"""
+        entries = []
+        for name, (duration, count) in sorted(self.stages().items()):
+            entry = f"{name};dur={duration * 1000:.1f}"
+            if count > 1:
+                entry += f';desc="{count}x"'
+            entries.append(entry)
+        total = (time.perf_counter() - self.start) * 1000
+        entries.append(f"total;dur={total:.1f}")
+        return ", ".join(entries)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "method": self.method,
+            "path": self.path,
+            "duration_ms": round((time.perf_counter() - self.start) * 1000, 3),
+            "spans": [
+                span.to_dict(self.start)
+                for span in sorted(self.spans, key=lambda span: span.start)
+            ],
+            "folded": {
+                name: {"count": count, "duration_ms": round(duration * 1000, 3)}
+                for name, (duration, count) in sorted(self.folded.items())
+            },
+        }
+
+
+_current_trace: ContextVar[Optional[Trace]] = ContextVar("trace", default=None)
+_current_span: ContextVar[Optional[Span]] = ContextVar("span", default=None)
+
+
+def _attach(span: Span) -> bool:
+    """Attach a span under the current parent of the active trace
+
+    Returns False once the trace holds TRACE_MAX_SPANS, the caller then
+    folds the span into the per-name totals instead.
+    """
+    trace = _current_trace.get()
+    if trace.span_count >= settings.TRACE_MAX_SPANS:
+        return False
+    trace.span_count += 1
+    parent = _current_span.get()
+    if parent is not None:
+        parent.children.append(span)
+    else:
+        trace.spans.append(span)
+    return True
+
+
+@contextmanager
+def span(name: str) -> Iterator[Optional[Span]]:
+    """Trace a block as a stage of the current request"""
+    trace = _current_trace.get()
+    if trace is None:
+        yield None
+        return
+    current = Span(name, time.perf_counter())
+    if not _attach(current):
+        # past the cap, nested spans are folded as well
+        try:
+            yield current
+        finally:
+            current.end = time.perf_counter()
+            trace.fold(current)
+        return
+    token = _current_span.set(current)
+    try:
+        yield current
+    finally:
+        current.end = time.perf_counter()
+        _current_span.reset(token)
+
+
+def record_span(name: str, start: float, end: float):
+    """Record an already finished stage in the current request"""
+    trace = _current_trace.get()
+    if trace is None:
+        return
+    current = Span(name, start, end)
+    if not _attach(current):
+        trace.fold(current)
+
+
+def traced(name: str) -> Callable:
+    """Decorator tracing every call of a sync or async function"""
+
+    def decorator(func: Callable) -> Callable:
+        if inspect.iscoroutinefunction(func):
+
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                with span(name):
+                    return await func(*args, **kwargs)
+
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return func(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def trace_engine(engine: Engine):
+    """Record every statement executed by the engine as a span"""
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        if _current_trace.get() is not None:
+            context._trace_query_start = time.perf_counter()
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        start = getattr(context, "_trace_query_start", None)
+        if start is not None:
+            keyword = statement.lstrip()[:8].split(None, 1)
+            name = keyword[0].lower() if keyword else "query"
+            record_span(f"db.{name}", start, time.perf_counter())
+
+
+@event.listens_for(Session, "before_commit")
+def _before_commit(session):
+    if _current_trace.get() is not None:
+        session.info["trace_commit_start"] = time.perf_counter()
+
+
+@event.listens_for(Session, "after_commit")
+def _after_commit(session):
+    start = session.info.pop("trace_commit_start", None)
+    if start is not None:
+        record_span("db.commit", start, time.perf_counter())
+
+
+@event.listens_for(Session, "after_soft_rollback")
+def _after_soft_rollback(session, previous_transaction):
+    session.info.pop("trace_commit_start", None)
+
+
+class TracingMiddleware:
+    """ASGI middleware collecting request spans into a Server-Timing header"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        trace = Trace(scope["method"], scope["path"])
+        token = _current_trace.set(trace)
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                headers = list(message.get("headers", []))
+                for key, value in headers:
+                    if key.lower() == b"content-type" and value.startswith(b"text/event-stream"):
+                        trace.streaming = True
+                headers.append((b"server-timing", trace.server_timing().encode("latin-1")))
+                message["headers"] = headers
+            elif message["type"] == "http.response.body" and message.get("more_body"):
+                trace.streaming = True
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _current_trace.reset(token)
+            elapsed_ms = (time.perf_counter() - trace.start) * 1000
+            # streamed responses stay open by design and are never sampled
+            if (
+                not trace.streaming
+                and elapsed_ms >= settings.TRACE_SLOW_REQUEST_MS
+                and random.random() < settings.TRACE_SLOW_SAMPLE_RATE
+            ):
+                logger.warning("slow request", extra={"trace": trace.to_dict()})
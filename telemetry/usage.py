@@ -0,0 +1,242 @@
+# Copyright (c) 2024-2025 LinguaScreen, Inc.
+#
+# This file is part of LinguaScreen Server
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import asyncio
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import date, datetime
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+from config import settings
+from models.usage import UsageDaily
+from telemetry.log import get_logger
+
+logger = get_logger("usage")
+
+# summed counters of a usage row, in column order
+USAGE_COUNTERS = (
+    "calls",
+    "prompt_tokens",
+    "completion_tokens",
+    "characters",
+    "images",
+    "cache_hits",
+    "upstream_ms",
+)
+
+# endpoint of usage recorded outside of a request
+BACKGROUND_ENDPOINT = "<background>"
+
+
+class UsageScope:
+    """Caller of the request being served, usage is attributed to it"""
+
+    __slots__ = ("scope", "user_id", "name")
+
+    def __init__(self, scope: Dict[str, Any], user_id: int = 0, name: Optional[str] = None):
+        self.scope = scope
+        # anonymous until a dependency authenticates the user
+        self.user_id = user_id
+        self.name = name
+
+    @property
+    def endpoint(self) -> str:
+        if self.name is not None:
+            return self.name
+        # the route is only known once the router matched the request
+        route = self.scope.get("route")
+        return getattr(route, "path", None) or "<unmatched>"
+
+
+_current_usage: ContextVar[Optional[UsageScope]] = ContextVar("usage", default=None)
+
+
+def set_usage_user(user_id: int):
+    """Attribute the usage of the current request to an authenticated user"""
+    scope = _current_usage.get()
+    if scope is not None:
+        scope.user_id = user_id
+
+
+def attribute_usage(endpoint: str, user_id: int):
+    """Attribute the usage of the current task to a named endpoint and a user
+
+    For work multiplexed over one connection, call it at the start of the
+    task serving each message.
+    """
+    current = _current_usage.get()
+    scope = current.scope if current is not None else {}
+    _current_usage.set(UsageScope(scope, user_id, endpoint))
+
+
+class UsageLedger:
+    """Usage summed in memory per (user, day, endpoint), flushed in batches"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pending: Dict[Tuple[int, date, str], List[float]] = {}
+
+    def record(self, user_id: int, endpoint: str, amounts: Dict[str, float]):
+        key = (user_id, datetime.utcnow().date(), endpoint)
+        with self._lock:
+            counters = self._pending.get(key)
+            if counters is None:
+                counters = self._pending[key] = [0] * len(USAGE_COUNTERS)
+            for i, name in enumerate(USAGE_COUNTERS):
+                counters[i] += amounts.get(name, 0)
+
+    def drain(self) -> Dict[Tuple[int, date, str], List[float]]:
+        """Take the pending usage, leaving the ledger empty"""
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        return pending
+
+    def restore(self, pending: Dict[Tuple[int, date, str], List[float]]):
+        """Put back usage that failed to flush"""
+        with self._lock:
+            for key, counters in pending.items():
+                current = self._pending.setdefault(key, [0] * len(USAGE_COUNTERS))
+                for i, value in enumerate(counters):
+                    current[i] += value
+
+    async def flush(self, engine: AsyncEngine) -> int:
+        """Add the pending usage to the daily rows, returns the rows written
+
+        Pass the write engine, so on sqlite the flush queues behind the single
+        writer instead of competing with it for the lock.
+        """
+        pending = self.drain()
+        if not pending:
+            return 0
+        # sorted, so concurrent flushes of several workers lock rows in one order
+        rows = [
+            {
+                "user_id": user_id,
+                "day": day,
+                "endpoint": endpoint,
+                **dict(zip(USAGE_COUNTERS, counters)),
+            }
+            for (user_id, day, endpoint), counters in sorted(pending.items())
+        ]
+        size = settings.USAGE_FLUSH_BATCH_SIZE
+        try:
+            async with engine.begin() as conn:
+                for start in range(0, len(rows), size):
+                    await conn.execute(
+                        usage_upsert(engine.dialect.name, rows[start : start + size])
+                    )
+        except Exception:
+            self.restore(pending)
+            raise
+        return len(rows)
+
+
+def usage_upsert(dialect: str, rows: List[Dict[str, Any]]):
+    """Insert daily usage rows, adding to the counters of existing ones"""
+    insert = sqlite.insert if dialect == "sqlite" else postgresql.insert
+    stmt = insert(UsageDaily).values(rows)
+    return stmt.on_conflict_do_update(
+        index_elements=[UsageDaily.user_id, UsageDaily.day, UsageDaily.endpoint],
+        set_={
+            name: getattr(UsageDaily, name) + getattr(stmt.excluded, name)
+            for name in USAGE_COUNTERS
+        },
+    )
+
+
+usage_ledger = UsageLedger()
+
+
+def record_usage(calls: int = 1, **amounts: float):
+    """Add an upstream call, or a cache hit with calls=0, to the ledger"""
+    if not settings.USAGE_ENABLED:
+        return
+    amounts["calls"] = calls
+    scope = _current_usage.get()
+    if scope is None:
+        usage_ledger.record(0, BACKGROUND_ENDPOINT, amounts)
+    else:
+        usage_ledger.record(scope.user_id, scope.endpoint, amounts)
+
+
+class Meter:
+    """Amounts used by a metered upstream call"""
+
+    __slots__ = ("amounts",)
+
+    def __init__(self, amounts: Dict[str, float]):
+        self.amounts = amounts
+
+    def add(self, **amounts: float):
+        for name, value in amounts.items():
+            self.amounts[name] = self.amounts.get(name, 0) + value
+
+    def add_llm_usage(self, usage: Any):
+        """Add the tokens of an openai usage object"""
+        if usage is not None:
+            self.add(
+                prompt_tokens=usage.prompt_tokens or 0,
+                completion_tokens=usage.completion_tokens or 0,
+            )
+
+
+@contextmanager
+def metered(**amounts: float) -> Iterator[Meter]:
+    """Time an upstream call and record it with the amounts it used"""
+    meter = Meter(amounts)
+    start = time.perf_counter()
+    try:
+        yield meter
+    finally:
+        record_usage(upstream_ms=(time.perf_counter() - start) * 1000, **meter.amounts)
+
+
+def start_usage_flusher(engine: AsyncEngine) -> asyncio.Task:
+    """Periodically flush the usage ledger to the database, in the running loop"""
+
+    async def _loop():
+        while True:
+            await asyncio.sleep(settings.USAGE_FLUSH_INTERVAL)
+            try:
+                await usage_ledger.flush(engine)
+            except Exception as exception:
+                logger.error("usage flush failed", extra={"error": str(exception)})
+
+    return asyncio.create_task(_loop(), name="usage-flusher")
+
+
+class UsageMiddleware:
+    """ASGI middleware attributing the upstream usage of a request to its caller"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] not in ("http", "websocket"):
+            await self.app(scope, receive, send)
+            return
+
+        token = _current_usage.set(UsageScope(scope))
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            _current_usage.reset(token)
@@ -0,0 +1,63 @@
+# Copyright (c) 2024-2025 LinguaScreen, Inc.
+#
+# This file is part of LinguaScreen Server
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Standalone job worker
+
+Run next to the app, which then needs JOB_WORKERS=0 in its own environment:
+JOB_WORKERS=4 python worker.py
+"""
+
+import asyncio
+import signal
+
+import main  # noqa: F401 registers every model before the tables are created
+from config import settings
+from core.jobs import JobWorkers
+from db import async_engine, async_write_engine, create_db_and_tables
+from telemetry.log import get_logger
+from telemetry.usage import start_usage_flusher, usage_ledger
+
+logger = get_logger("worker")
+
+
+async def run():
+    create_db_and_tables()
+    usage_flusher = None
+    if settings.USAGE_ENABLED:
+        usage_flusher = start_usage_flusher(async_write_engine)
+    workers = JobWorkers(max(settings.JOB_WORKERS, 1))
+    workers.start()
+    logger.info("job worker started", extra={"workers": workers.count})
+    # stop on ctrl-c or a termination signal
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(signum, stop.set)
+    await stop.wait()
+    await workers.stop()
+    if usage_flusher is not None:
+        usage_flusher.cancel()
+    if settings.USAGE_ENABLED:
+        await usage_ledger.flush(async_write_engine)
+    # pooled aiosqlite connections run in threads that would keep the process alive
+    await async_engine.dispose()
+    await async_write_engine.dispose()
+    logger.info("job worker stopped")
+
+
+if __name__ == "__main__":
+    asyncio.run(run())